@@ -1,3 +1,3 @@
-from . import photos, settings
+from . import photos, settings, uploads
 
-__all__ = ['photos', 'settings']
+__all__ = ['photos', 'settings', 'uploads']
@@ -1,8 +1,12 @@
+from functools import lru_cache
 from typing import AsyncIterator
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import get_settings
 from app.models.database import SessionLocal
+from app.services.resumable import ResumableUploadStore
+from app.services.storage import S3StorageService, StorageService
+from app.services.variant_cache import VariantCache
 
 
 async def get_db() -> AsyncIterator[AsyncSession]:
@@ -12,3 +16,20 @@ async def get_db() -> AsyncIterator[AsyncSession]:
 
 def get_settings_dep():
   return get_settings()
+
+
+@lru_cache
+def get_storage() -> StorageService:
+  return S3StorageService()
+
+
+@lru_cache
+def get_variant_cache() -> VariantCache:
+  settings = get_settings()
+  return VariantCache(settings.variant_cache_dir, settings.variant_cache_max_mb * 1024 * 1024)
+
+
+@lru_cache
+def get_upload_store() -> ResumableUploadStore:
+  settings = get_settings()
+  return ResumableUploadStore(settings.upload_staging_dir, settings.upload_staging_ttl_seconds)
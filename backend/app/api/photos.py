@@ -1,18 +1,77 @@
+import asyncio
+import json
+import uuid
 from datetime import datetime
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.api.deps import get_db
+from typing import Optional
+from urllib.parse import urlencode
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, Header, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import RedirectResponse
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from app.api.deps import get_db, get_storage, get_variant_cache
 from app.api.auth_deps import get_current_user
+from app.config import get_settings
+from app.models.database import upsert
 from app.models.entities import Photo
-from app.queues.events import JobType, QueueManager
-from app.schemas import Photo as PhotoSchema, PhotoUpdateLocation, PhotoUpdateNote
-from app.utils.file_validation import validate_upload_file
+from app.queues.events import Job, JobType
+from app.queues.jobs import ensure_queue_capacity, enqueue_jobs, prioritize_photos
+from app.schemas import Photo as PhotoSchema, PhotoSummary, PhotoUpdateLocation, PhotoUpdateNote
+from app.utils.file_validation import UploadInfo, validate_upload_file
+from app.services.blobs import acquire_blobs, release_blobs
+from app.services.dedup import PerceptualIndex, perceptual_hash, to_signed64
+from app.services.offload import run_cpu_bound
+from app.services.sprites import (
+  load_sprite_page, load_thumbnails, pack_sprite, sprite_fingerprint, sprite_size, sprite_tiles
+)
+from app.services.storage import StorageService
+from app.services.variant_cache import CachedFileResponse, VariantCache, render_variant, renderable_formats
+from app.utils.pagination import decode_cursor, encode_cursor
 from app.utils.validation import validate_user_id, validate_photo_id
-import uuid
+from app.utils.variants import VARIANT_CONTENT_TYPES, normalize_variants, parse_accept, select_variant
 
 router = APIRouter(prefix='/photos', tags=['photos'])
-queue_manager = QueueManager()
+settings = get_settings()
+phash_index = PerceptualIndex(settings.duplicate_max_distance)
+
+# Columns behind each field a list request may ask for; thumbnail is derived from id.
+LIST_COLUMNS = {
+  'id': Photo.id,
+  'thumbnail': Photo.id,
+  'status': Photo.status,
+  'placeholder': Photo.placeholder,
+  'userId': Photo.user_id,
+  'storageKey': Photo.storage_key,
+  'variants': Photo.variants,
+  'captionAi': Photo.caption_ai,
+  'noteUser': Photo.note_user,
+  'exif': Photo.exif,
+  'placeAuto': Photo.place_auto,
+  'placeDisplay': Photo.place_display,
+  'locationOverride': Photo.location_override,
+  'createdAt': Photo.created_at,
+  'updatedAt': Photo.updated_at,
+}
+LIST_DEFAULT_FIELDS = ('id', 'thumbnail', 'status', 'placeholder')
+THUMBNAIL_SIZE = min(settings.variant_sizes)
+
+
+def prioritize_viewed(background_tasks: BackgroundTasks, db: AsyncSession, user_id: str, photos) -> None:
+  """Photos on screen that are still processing jump to the interactive lane.
+
+  Best-effort, after the response and in its own transaction, so a GET never
+  commits in its request's session or fails because the queue is busy.
+  """
+  pending = [photo.id for photo in photos if photo.status == 'processing']
+  if pending:
+    background_tasks.add_task(_prioritize, db.bind, user_id, pending)
+
+
+async def _prioritize(engine: AsyncEngine, user_id: str, photo_ids: list) -> None:
+  try:
+    async with AsyncSession(engine) as db, db.begin():
+      await prioritize_photos(db, user_id, photo_ids)
+  except Exception as e:
+    print(f"Failed to prioritize viewed photos: {e}")
 
 
 def to_schema(photo: Photo) -> PhotoSchema:
@@ -20,7 +79,8 @@ def to_schema(photo: Photo) -> PhotoSchema:
     id=str(photo.id),
     userId=photo.user_id,
     storageKey=photo.storage_key,
-    variants=photo.variants or [],
+    variants=normalize_variants(photo.variants),
+    placeholder=photo.placeholder,
     captionAi=photo.caption_ai,
     noteUser=photo.note_user,
     exif=photo.exif or {},
@@ -33,22 +93,173 @@ def to_schema(photo: Photo) -> PhotoSchema:
   )
 
 
-@router.get('/', response_model=list[PhotoSchema])
+def parse_fields(fields: str | None) -> list[str]:
+  """The fields named in a `fields=` list, id always included"""
+  if not fields:
+    return list(LIST_DEFAULT_FIELDS)
+  names = [name.strip() for name in fields.split(',') if name.strip()]
+  unknown = sorted(set(names) - LIST_COLUMNS.keys())
+  if unknown:
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      detail=f'Unknown fields: {", ".join(unknown)}'
+    )
+  return list(dict.fromkeys(['id', *names]))
+
+
+def to_summary(row, fields: list[str]) -> PhotoSummary:
+  values = row._mapping
+  summary = {'id': str(values['id'])}
+  for name in fields:
+    if name == 'thumbnail':
+      summary[name] = f'{settings.api_prefix}/photos/{values["id"]}/variants/{THUMBNAIL_SIZE}'
+    elif name == 'variants':
+      summary[name] = normalize_variants(values[name])
+    elif name == 'exif':
+      summary[name] = values[name] or {}
+    elif name != 'id':
+      summary[name] = values[name]
+  return PhotoSummary(**summary)
+
+
+async def estimate_photo_count(db: AsyncSession, user_id: str) -> int:
+  """The planner's row estimate for the user's photos on Postgres, an exact count elsewhere"""
+  if db.get_bind().dialect.name == 'postgresql':
+    plan = (await db.execute(
+      text('EXPLAIN (FORMAT JSON) SELECT 1 FROM photos WHERE user_id = :user_id'),
+      {'user_id': user_id}
+    )).scalar_one()
+    if isinstance(plan, str):
+      plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+  result = await db.execute(select(func.count()).select_from(Photo).where(Photo.user_id == user_id))
+  return result.scalar_one()
+
+
+@router.get('/', response_model=list[PhotoSummary], response_model_exclude_unset=True)
 async def list_photos(
+  response: Response,
+  limit: int = Query(default=settings.photo_page_size, ge=1, le=settings.photo_page_max),
+  cursor: str | None = None,
+  count: bool = False,
+  fields: str | None = None,
   db: AsyncSession = Depends(get_db),
   current_user: str = Depends(get_current_user)
 ):
-  """List photos for the authenticated user"""
+  """One page of the authenticated user's photos, newest first.
+
+  Pages are keyed on (created_at, id) rather than offsets, so every page is
+  one range read of idx_photos_user_created however deep it is. The cursor
+  for the next page comes back in X-Next-Cursor; with count=true,
+  X-Total-Count carries an estimate of the user's photos.
+
+  Each photo is a compact summary (id, thumbnail, status, placeholder) unless
+  `fields=` names others. Only those columns are selected, as plain rows, so
+  the JSON columns a grid never shows are not loaded.
+  """
+  names = parse_fields(fields)
+  columns = {'id': Photo.id, 'cursor_created_at': Photo.created_at}
+  columns.update({name: LIST_COLUMNS[name] for name in names if name not in ('id', 'thumbnail')})
+  query = select(*(column.label(name) for name, column in columns.items())).where(Photo.user_id == current_user)
+  if cursor:
+    query = query.where(tuple_(Photo.created_at, Photo.id) < decode_cursor(cursor))
   result = await db.execute(
-    select(Photo).where(Photo.user_id == current_user).order_by(Photo.created_at.desc())
+    query.order_by(Photo.created_at.desc(), Photo.id.desc()).limit(limit + 1)
+  )
+  rows = result.all()
+  if len(rows) > limit:
+    rows = rows[:limit]
+    response.headers['X-Next-Cursor'] = encode_cursor(rows[-1].cursor_created_at, rows[-1].id)
+  if count:
+    response.headers['X-Total-Count'] = str(await estimate_photo_count(db, current_user))
+  return [to_summary(row, names) for row in rows]
+
+
+def sprite_url(version: str, cursor: str | None, limit: int) -> str:
+  query = urlencode({**({'cursor': cursor} if cursor else {}), 'limit': limit})
+  return f'{settings.api_prefix}/photos/sprites/{version}?{query}'
+
+
+@router.get('/sprites')
+async def get_sprite_manifest(
+  background_tasks: BackgroundTasks,
+  limit: int = Query(default=settings.photo_page_size, ge=1, le=settings.photo_page_max),
+  cursor: str | None = None,
+  db: AsyncSession = Depends(get_db),
+  storage: StorageService = Depends(get_storage),
+  cache: VariantCache = Depends(get_variant_cache),
+  current_user: str = Depends(get_current_user)
+):
+  """Offset map of one list page's thumbnails inside its sprite sheet; same cursor and limit as GET /photos/"""
+  rows = await load_sprite_page(db, current_user, cursor, limit)
+  if not rows:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND,
+      detail='Sprite page not found'
+    )
+
+  prioritize_viewed(background_tasks, db, current_user, rows)
+  version = sprite_fingerprint(rows)
+  thumbnails = await load_thumbnails(rows, storage, cache)
+  width, height = sprite_size(len(rows))
+  return {
+    'version': version,
+    'image': sprite_url(version, cursor, limit),
+    'width': width,
+    'height': height,
+    'tiles': sprite_tiles(rows, thumbnails)
+  }
+
+
+@router.get('/sprites/{version}')
+async def get_sprite_image(
+  version: str,
+  limit: int = Query(default=settings.photo_page_size, ge=1, le=settings.photo_page_max),
+  cursor: str | None = None,
+  accept: str | None = Header(default=None),
+  db: AsyncSession = Depends(get_db),
+  storage: StorageService = Depends(get_storage),
+  cache: VariantCache = Depends(get_variant_cache),
+  current_user: str = Depends(get_current_user)
+):
+  """One packed image of a list page's 256px thumbnails"""
+  rows = await load_sprite_page(db, current_user, cursor, limit)
+  if not rows:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND,
+      detail='Sprite page not found'
+    )
+
+  # A photo on this page changed since the manifest was fetched.
+  current = sprite_fingerprint(rows)
+  if version != current:
+    return RedirectResponse(
+      sprite_url(current, cursor, limit),
+      status_code=status.HTTP_307_TEMPORARY_REDIRECT
+    )
+
+  accepted = parse_accept(accept)
+  fmt = next(fmt for fmt in renderable_formats() if fmt in accepted)
+
+  async def render() -> bytes:
+    thumbnails = await load_thumbnails(rows, storage, cache)
+    return await asyncio.to_thread(pack_sprite, sprite_tiles(rows, thumbnails), thumbnails, fmt)
+
+  # The fingerprint covers every photo on the sheet, so it alone names the file.
+  key = f'sprite-{current_user}-{version}.{fmt}'
+  return CachedFileResponse(
+    cache,
+    key,
+    await cache.acquire(key, render),
+    media_type=VARIANT_CONTENT_TYPES[fmt],
+    headers={'Vary': 'Accept', 'Cache-Control': 'private, max-age=31536000, immutable'}
   )
-  photos = result.scalars().all()
-  return [to_schema(photo) for photo in photos]
 
 
 @router.get('/{photo_id}', response_model=PhotoSchema)
 async def get_photo(
   photo_id: str, 
+  background_tasks: BackgroundTasks,
   db: AsyncSession = Depends(get_db),
   current_user: str = Depends(get_current_user)
 ):
@@ -64,9 +275,70 @@ async def get_photo(
       status_code=status.HTTP_404_NOT_FOUND, 
       detail='Photo not found'
     )
+  prioritize_viewed(background_tasks, db, current_user, [photo])
   return to_schema(photo)
 
 
+@router.get('/{photo_id}/variants/{size}')
+async def get_variant(
+  photo_id: str,
+  size: int,
+  background_tasks: BackgroundTasks,
+  accept: str | None = Header(default=None),
+  db: AsyncSession = Depends(get_db),
+  storage: StorageService = Depends(get_storage),
+  cache: VariantCache = Depends(get_variant_cache),
+  current_user: str = Depends(get_current_user)
+):
+  """Serve a variant, rendering it from the original on first request"""
+  validate_photo_id(photo_id)
+
+  if size not in settings.variant_sizes:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND,
+      detail='Variant not available'
+    )
+
+  result = await db.execute(
+    select(Photo).where(Photo.id == photo_id, Photo.user_id == current_user)
+  )
+  photo = result.scalar_one_or_none()
+  if not photo:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND,
+      detail='Photo not found'
+    )
+  prioritize_viewed(background_tasks, db, current_user, [photo])
+
+  # Pre-rendered variants (the upload-time thumbnail) are served from storage.
+  variant = select_variant(photo.variants, size, accept)
+  if variant and variant['size'] == size:
+    key = variant.get('key') or f"{photo.storage_key.rsplit('.', 1)[0]}/{size}.jpg"
+    signed = storage.create_download_url(key)
+    return RedirectResponse(
+      signed.url,
+      status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+      headers={'Vary': 'Accept', 'Cache-Control': 'private, max-age=60'}
+    )
+
+  accepted = parse_accept(accept)
+  fmt = next(fmt for fmt in renderable_formats() if fmt in accepted)
+
+  async def render() -> bytes:
+    original = await asyncio.to_thread(storage.get_object, photo.storage_key)
+    return await asyncio.to_thread(render_variant, original, size, fmt)
+
+  # Keyed by content so every photo sharing the original shares the render.
+  key = f'{photo.content_digest or photo.id}-{size}.{fmt}'
+  return CachedFileResponse(
+    cache,
+    key,
+    await cache.acquire(key, render),
+    media_type=VARIANT_CONTENT_TYPES[fmt],
+    headers={'Vary': 'Accept', 'Cache-Control': 'private, max-age=86400'}
+  )
+
+
 @router.patch('/{photo_id}/note', response_model=PhotoSchema)
 async def update_note(
   photo_id: str, 
@@ -160,10 +432,152 @@ async def clear_override(
   return to_schema(photo)
 
 
+def processing_jobs(photo_id: str, derivatives: bool = True, exif: bool = True) -> list[Job]:
+  """The processing job for a new photo; larger variants are rendered on first request"""
+  stages = [JobType.EXIF, JobType.GEOCODE, JobType.DERIVATIVE, JobType.CAPTION]
+  if not derivatives:
+    stages.remove(JobType.DERIVATIVE)
+  if not exif:
+    stages.remove(JobType.EXIF)
+  return [Job(
+    type=JobType.PROCESS,
+    photo_id=photo_id,
+    stages=[stage.value for stage in stages],
+    sizes=settings.upload_variant_sizes
+  )]
+
+
+def inspect_upload(file: UploadFile) -> tuple[UploadInfo, int]:
+  """CPU-bound part of an upload: streaming validation, then the perceptual hash"""
+  info = validate_upload_file(file)
+  return info, perceptual_hash(file.file)
+
+
+async def _inspect(file: UploadFile) -> tuple[UploadInfo, int]:
+  try:
+    return await run_cpu_bound(inspect_upload, file)
+  except HTTPException:
+    raise
+  except Exception as e:
+    raise HTTPException(
+      status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+      detail=f'Error processing file {file.filename}: {str(e)}'
+    )
+
+
+async def ingest_uploads(
+  files: list[UploadFile],
+  db: AsyncSession,
+  storage: StorageService,
+  current_user: str
+) -> dict:
+  """Validate, store and enqueue processing for uploaded files, then commit"""
+  # Validate and hash all files concurrently, off the event loop
+  inspected = await asyncio.gather(*(_inspect(file) for file in files))
+  return await store_uploads(files, inspected, db, storage, current_user)
+
+
+async def store_uploads(
+  files: list[UploadFile],
+  inspected: list[tuple[UploadInfo, int]],
+  db: AsyncSession,
+  storage: StorageService,
+  current_user: str,
+  sources: Optional[list[str]] = None
+) -> dict:
+  """Store, deduplicate and enqueue processing for validated uploads, then commit.
+
+  sources are the keys direct uploads already sit at: new blobs are copied
+  from there instead of uploaded, and each photo records its key as
+  upload_key. A key that already has a photo gets no second one.
+  """
+  try:
+    # Originals are content-addressed: identical bytes share one blob
+    blobs = await acquire_blobs(db, [
+      (info.digest, file.filename.split('.')[-1].lower(), info.size, info.content_type)
+      for file, (info, _) in zip(files, inspected)
+    ])
+    if sources is None:
+      await asyncio.gather(*(
+        asyncio.to_thread(storage.put_object, blob.storage_key, file.file, blob.content_type)
+        for file, (blob, created) in zip(files, blobs) if created
+      ))
+    else:
+      await asyncio.gather(*(
+        asyncio.to_thread(storage.copy_object, source, blob.storage_key)
+        for source, (blob, created) in zip(sources, blobs) if created
+      ))
+    matches = await phash_index.find_duplicates(db, current_user, [phash for _, phash in inspected])
+
+    # IDs are generated here so every row goes in with a single INSERT
+    rows, jobs = [], {}
+    for index, ((info, phash), (blob, _), duplicate) in enumerate(zip(inspected, blobs, matches)):
+      row = {
+        'id': uuid.uuid4(),
+        'user_id': current_user,
+        'storage_key': blob.storage_key,
+        'upload_key': sources[index] if sources is not None else None,
+        'content_digest': info.digest,
+        'variants': blob.variants or [],
+        'placeholder': blob.placeholder,
+        'exif': blob.exif or {'hasGps': False},
+        'caption_ai': None,
+        'place_auto': None,
+        'place_display': None,
+        'status': 'processing',
+        'phash': to_signed64(phash),
+        'duplicate_of': None
+      }
+      if duplicate is not None:
+        # Near-identical to a processed photo: link its results, skip the jobs
+        row.update(
+          duplicate_of=duplicate.id,
+          variants=duplicate.variants,
+          placeholder=duplicate.placeholder,
+          exif=duplicate.exif,
+          caption_ai=duplicate.caption_ai,
+          place_auto=duplicate.place_auto,
+          place_display=duplicate.place_display,
+          status=duplicate.status
+        )
+      else:
+        # Skip results already known for these bytes
+        jobs[row['id']] = processing_jobs(str(row['id']), derivatives=not blob.variants, exif=not blob.exif)
+      rows.append(row)
+
+    statement = upsert(db, Photo).values(rows).on_conflict_do_nothing(
+      index_elements=[Photo.user_id, Photo.upload_key]
+    ).returning(Photo.id)
+    inserted = set((await db.execute(statement)).scalars())
+    lost = [row for row in rows if row['id'] not in inserted]
+    if lost:
+      # Another finalize of the same upload key committed first: keep its photo
+      await release_blobs(db, [row['content_digest'] for row in lost])
+      rows = [row for row in rows if row['id'] in inserted]
+    jobs = [job for row in rows for job in jobs.get(row['id'], [])]
+    await enqueue_jobs(db, jobs, current_user)
+  except HTTPException:
+    raise
+  except Exception as e:
+    raise HTTPException(
+      status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+      detail=f'Error processing upload: {str(e)}'
+    )
+
+  await db.commit()
+  return {
+    'message': 'Upload accepted', 
+    'photos': [str(row['id']) for row in rows],
+    'duplicates': {str(row['id']): str(row['duplicate_of']) for row in rows if row['duplicate_of'] is not None},
+    'jobs': jobs
+  }
+
+
 @router.post('/upload', status_code=status.HTTP_202_ACCEPTED)
 async def upload_photos(
   files: list[UploadFile] = File(default=[]),
   db: AsyncSession = Depends(get_db),
+  storage: StorageService = Depends(get_storage),
   current_user: str = Depends(get_current_user)
 ):
   """Upload photos with comprehensive validation"""
@@ -179,45 +593,5 @@ async def upload_photos(
       detail='Too many files. Maximum 10 files per request.'
     )
 
-  uploaded_photos = []
-  
-  for file in files:
-    try:
-      # Validate file
-      validate_upload_file(file)
-      
-      # Generate secure filename
-      file_extension = file.filename.split('.')[-1].lower()
-      secure_filename = f"{uuid.uuid4()}.{file_extension}"
-      
-      photo = Photo(
-        user_id=current_user,
-        storage_key=f'{current_user}/{secure_filename}',
-        variants=['256', '1024', '2048'],
-        exif={'hasGps': False},
-        status='processing'
-      )
-      db.add(photo)
-      await db.flush()
-      
-      # Enqueue processing jobs
-      queue_manager.enqueue({'type': JobType.DERIVATIVE, 'photo_id': str(photo.id)})
-      queue_manager.enqueue({'type': JobType.EXIF, 'photo_id': str(photo.id)})
-      queue_manager.enqueue({'type': JobType.CAPTION, 'photo_id': str(photo.id)})
-      
-      uploaded_photos.append(str(photo.id))
-      
-    except HTTPException:
-      raise
-    except Exception as e:
-      raise HTTPException(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        detail=f'Error processing file {file.filename}: {str(e)}'
-      )
-
-  await db.commit()
-  return {
-    'message': 'Upload accepted', 
-    'photos': uploaded_photos,
-    'jobs': queue_manager.drain()
-  }
+  await ensure_queue_capacity(db, current_user)
+  return await ingest_uploads(files, db, storage, current_user)
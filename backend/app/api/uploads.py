@@ -0,0 +1,284 @@
+import asyncio
+from contextlib import ExitStack
+from tempfile import SpooledTemporaryFile
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, UploadFile, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect
+from app.api.deps import get_db, get_storage, get_upload_store
+from app.api.auth_deps import get_current_user
+from app.api.photos import ingest_uploads, inspect_upload, store_uploads
+from app.config import get_settings
+from app.models.entities import Photo
+from app.queues.jobs import ensure_queue_capacity
+from app.schemas import DirectUploadFinalize, DirectUploadRequest, ResumableUploadCreate
+from app.services.direct_uploads import SPOOL_BYTES, check_direct_upload, direct_upload_key, owns_direct_upload_key
+from app.services.offload import run_cpu_bound
+from app.services.resumable import ResumableUploadStore, StagedUpload
+from app.services.storage import StorageService
+
+router = APIRouter(prefix='/uploads', tags=['uploads'])
+settings = get_settings()
+
+TUS_VERSION = '1.0.0'
+
+
+def _get_upload(store: ResumableUploadStore, upload_id: str, user_id: str) -> StagedUpload:
+  upload = store.get(upload_id, user_id)
+  if not upload:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND,
+      detail='Upload not found'
+    )
+  return upload
+
+
+def _offset_headers(upload: StagedUpload) -> dict:
+  return {
+    'Upload-Offset': str(upload.offset),
+    'Upload-Length': str(upload.length),
+    'Tus-Resumable': TUS_VERSION,
+    'Cache-Control': 'no-store'
+  }
+
+
+def _check_batch_size(count: int) -> None:
+  if count > settings.direct_upload_batch_max:
+    raise HTTPException(
+      status_code=status.HTTP_400_BAD_REQUEST,
+      detail=f'Too many files. Maximum {settings.direct_upload_batch_max} files per request.'
+    )
+
+
+@router.post('/direct')
+async def create_direct_uploads(
+  payload: DirectUploadRequest,
+  db: AsyncSession = Depends(get_db),
+  storage: StorageService = Depends(get_storage),
+  current_user: str = Depends(get_current_user)
+):
+  """Presigned POSTs so clients send originals straight to storage"""
+  _check_batch_size(len(payload.files))
+  await ensure_queue_capacity(db, current_user)
+  for file in payload.files:
+    if file.contentType not in settings.allowed_file_types:
+      raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"File type {file.contentType} not allowed. Allowed types: {', '.join(settings.allowed_file_types)}"
+      )
+    if file.size > settings.max_file_size_mb * 1024 * 1024:
+      raise HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
+      )
+
+  uploads = []
+  for file in payload.files:
+    key = direct_upload_key(current_user, file.filename)
+    signed = storage.create_upload_url(key, file.contentType)
+    uploads.append({
+      'filename': file.filename,
+      'key': key,
+      'url': signed.url,
+      'fields': signed.fields,
+      'expiresAt': signed.expires_at.isoformat()
+    })
+  return {'uploads': uploads}
+
+
+async def _direct_upload_photos(db: AsyncSession, user_id: str, keys: list[str]) -> dict[str, str]:
+  result = await db.execute(
+    select(Photo.upload_key, Photo.id).where(Photo.user_id == user_id, Photo.upload_key.in_(keys))
+  )
+  return {key: str(photo_id) for key, photo_id in result.all()}
+
+
+@router.post('/direct/finalize', status_code=status.HTTP_202_ACCEPTED)
+async def finalize_direct_uploads(
+  payload: DirectUploadFinalize,
+  db: AsyncSession = Depends(get_db),
+  storage: StorageService = Depends(get_storage),
+  current_user: str = Depends(get_current_user)
+):
+  """Create photos and jobs for objects uploaded with presigned POSTs.
+
+  Each new object is read back once to hash it, then goes through the same
+  content addressing and duplicate detection as any other upload. Its bytes
+  are copied to the blob's key inside the bucket and the uploaded object is
+  deleted.
+  """
+  _check_batch_size(len(payload.uploads))
+  rejected = {}
+  items = {}
+  for item in payload.uploads:
+    if owns_direct_upload_key(current_user, item.key):
+      items[item.key] = item
+    else:
+      rejected[item.key] = 'Unknown upload key'
+
+  # Finalizing is idempotent: keys that already have a photo return it
+  existing = await _direct_upload_photos(db, current_user, list(items))
+  pending = [item for key, item in items.items() if key not in existing]
+
+  checks = await asyncio.gather(
+    *(check_direct_upload(storage, item.key, item.size) for item in pending),
+    return_exceptions=True
+  )
+  ingested = {'duplicates': {}, 'jobs': []}
+  with ExitStack() as stack:
+    files = {}
+    for item, checked in zip(pending, checks):
+      if isinstance(checked, HTTPException):
+        rejected[item.key] = checked.detail
+        continue
+      if isinstance(checked, Exception):
+        raise checked
+      files[item.key] = UploadFile(
+        file=stack.enter_context(SpooledTemporaryFile(max_size=SPOOL_BYTES)),
+        size=item.size,
+        filename=item.key.rsplit('/', 1)[-1],
+        headers=Headers({'content-type': checked})
+      )
+    await asyncio.gather(*(
+      asyncio.to_thread(storage.download_object, key, file.file) for key, file in files.items()
+    ))
+    inspected = await asyncio.gather(
+      *(run_cpu_bound(inspect_upload, file) for file in files.values()),
+      return_exceptions=True
+    )
+    valid = []
+    for key, result in zip(list(files), inspected):
+      if isinstance(result, HTTPException):
+        rejected[key] = result.detail
+        del files[key]
+      elif isinstance(result, Exception):
+        raise result
+      else:
+        valid.append(result)
+    if files:
+      ingested = await store_uploads(list(files.values()), valid, db, storage, current_user, sources=list(files))
+
+  # Read back rather than trusting this call's inserts: a concurrent finalize
+  # of the same key may have committed the photo instead.
+  photos = await _direct_upload_photos(db, current_user, list(items))
+  # The bytes now live under the blob's key.
+  await asyncio.gather(*(_delete_upload(storage, key) for key in files if key in photos))
+  return {
+    'message': 'Upload accepted',
+    'photos': photos,
+    'rejected': {key: reason for key, reason in rejected.items() if key not in photos},
+    'duplicates': ingested['duplicates'],
+    'jobs': ingested['jobs']
+  }
+
+
+async def _delete_upload(storage: StorageService, key: str) -> None:
+  try:
+    await asyncio.to_thread(storage.delete_object, key)
+  except Exception as e:
+    print(f"Could not delete finalized upload {key}: {e}")
+
+
+@router.post('/', status_code=status.HTTP_201_CREATED)
+async def create_upload(
+  payload: ResumableUploadCreate,
+  db: AsyncSession = Depends(get_db),
+  store: ResumableUploadStore = Depends(get_upload_store),
+  current_user: str = Depends(get_current_user)
+):
+  """Start a resumable upload; send the bytes with PATCH"""
+  await ensure_queue_capacity(db, current_user)
+  if payload.size > settings.max_file_size_mb * 1024 * 1024:
+    raise HTTPException(
+      status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+      detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
+    )
+
+  upload = store.create(current_user, payload.filename, payload.contentType, payload.size)
+  location = f'{settings.api_prefix}/uploads/{upload.id}'
+  return JSONResponse(
+    status_code=status.HTTP_201_CREATED,
+    content={'id': upload.id, 'offset': upload.offset, 'length': upload.length, 'location': location},
+    headers={'Location': location, **_offset_headers(upload)}
+  )
+
+
+@router.head('/{upload_id}')
+async def get_upload_offset(
+  upload_id: str,
+  store: ResumableUploadStore = Depends(get_upload_store),
+  current_user: str = Depends(get_current_user)
+):
+  """Report how many bytes the server has, so the client knows where to resume"""
+  upload = _get_upload(store, upload_id, current_user)
+  return Response(status_code=status.HTTP_200_OK, headers=_offset_headers(upload))
+
+
+@router.patch('/{upload_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def append_upload(
+  upload_id: str,
+  request: Request,
+  upload_offset: int = Header(alias='Upload-Offset'),
+  store: ResumableUploadStore = Depends(get_upload_store),
+  current_user: str = Depends(get_current_user)
+):
+  """Append a chunk at Upload-Offset"""
+  upload = _get_upload(store, upload_id, current_user)
+  try:
+    await store.append(upload, upload_offset, request.stream())
+  except ClientDisconnect:
+    # Whatever arrived is on disk; the client resumes from HEAD's offset.
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+  return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_offset_headers(upload))
+
+
+@router.post('/{upload_id}/finalize', status_code=status.HTTP_202_ACCEPTED)
+async def finalize_upload(
+  upload_id: str,
+  db: AsyncSession = Depends(get_db),
+  storage: StorageService = Depends(get_storage),
+  store: ResumableUploadStore = Depends(get_upload_store),
+  current_user: str = Depends(get_current_user)
+):
+  """Hand a completed upload to the regular validation and processing path.
+
+  Finalizing is idempotent: a retried call returns the photos the first one
+  created, and concurrent calls wait for each other on the upload's lock.
+  """
+  _get_upload(store, upload_id, current_user)
+  async with store.lock(upload_id):
+    # Re-read under the lock, as another call may have just finished
+    upload = _get_upload(store, upload_id, current_user)
+    if upload.result is not None:
+      return upload.result
+    if upload.offset != upload.length:
+      raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f'Upload incomplete: {upload.offset} of {upload.length} bytes received',
+        headers=_offset_headers(upload)
+      )
+
+    with store.open(upload) as staged:
+      file = UploadFile(
+        file=staged,
+        size=upload.length,
+        filename=upload.filename,
+        headers=Headers({'content-type': upload.content_type})
+      )
+      result = await ingest_uploads([file], db, storage, current_user)
+    store.complete(upload, result)
+  return result
+
+
+@router.delete('/{upload_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(
+  upload_id: str,
+  store: ResumableUploadStore = Depends(get_upload_store),
+  current_user: str = Depends(get_current_user)
+):
+  """Abandon a resumable upload and free its staging space"""
+  upload = _get_upload(store, upload_id, current_user)
+  store.discard(upload.id)
+  return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -26,12 +26,52 @@ class Settings(BaseSettings):
   jwt_algorithm: str = 'HS256'
   jwt_expire_minutes: int = 30
   signed_url_ttl_seconds: int = 3600
+
+  # Derivatives: only upload_variant_sizes are rendered at upload time, the
+  # rest of variant_sizes are rendered on first request into the disk cache.
+  variant_sizes: List[int] = [256, 1024, 2048]
+  upload_variant_sizes: List[int] = [256]
+  variant_cache_dir: str = '/tmp/photodisplay-variants'
+  variant_cache_max_mb: int = 512
+
+  # Uploads within this many bits (of 64) of an already processed photo of
+  # the same user reuse its results instead of being processed again.
+  duplicate_max_distance: int = 4
   
   # Security settings
   max_file_size_mb: int = 25
   allowed_file_types: List[str] = ['image/jpeg', 'image/png', 'image/webp', 'image/gif']
   rate_limit_requests: int = 100
   rate_limit_window: int = 60  # seconds
+
+  # Upload-time CPU work (validation, hashing) runs on this many threads
+  upload_cpu_workers: int = 4
+  loop_lag_interval_seconds: float = 0.1
+
+  # Resumable uploads are staged here until finalized or reaped
+  upload_staging_dir: str = '/tmp/photodisplay-uploads'
+  upload_staging_ttl_seconds: int = 24 * 3600
+  upload_reaper_interval_seconds: int = 600
+
+  # Direct-to-storage uploads land under this prefix via presigned POSTs
+  direct_upload_prefix: str = 'incoming'
+  direct_upload_batch_max: int = 100
+
+  # Background jobs: a claimed job is retried elsewhere if not finished within
+  # the visibility timeout; idle workers also poll in case a NOTIFY is missed.
+  job_visibility_timeout_seconds: int = 300
+  job_claim_batch_size: int = 10
+  job_poll_interval_seconds: float = 5.0
+
+  # GET /photos pages: the default and largest number of photos per page
+  photo_page_size: int = 100
+  photo_page_max: int = 500
+
+  # Admission control: uploads are turned away with Retry-After while the
+  # queue (or one user's share of it) is deeper than this.
+  job_queue_max_depth: int = 50000
+  job_queue_max_user_depth: int = 20000
+  job_admission_retry_after_seconds: int = 60
   
   @validator('cors_origins')
   def parse_cors_origins(cls, v):
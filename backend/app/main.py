@@ -1,15 +1,32 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from app.config import get_settings
-from app.api import photos, settings as settings_api, auth
+from app.api import photos, settings as settings_api, auth, uploads
+from app.api.deps import get_upload_store
 from app.middleware.security import RateLimitMiddleware, SecurityHeadersMiddleware, RequestLoggingMiddleware
+from app.services.offload import LoopLagMonitor
 
 
 def create_app() -> FastAPI:
   settings = get_settings()
-  app = FastAPI(title=settings.project_name)
+  loop_monitor = LoopLagMonitor(interval=settings.loop_lag_interval_seconds)
+
+  @asynccontextmanager
+  async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    reaper = asyncio.create_task(get_upload_store().run_reaper(settings.upload_reaper_interval_seconds))
+    yield
+    reaper.cancel()
+    with suppress(asyncio.CancelledError):
+      await reaper
+    await loop_monitor.stop()
+
+  app = FastAPI(title=settings.project_name, lifespan=lifespan)
   
   # Security middleware (order matters!)
   app.add_middleware(SecurityHeadersMiddleware)
@@ -27,9 +44,9 @@ def create_app() -> FastAPI:
     CORSMiddleware,
     allow_origins=settings.cors_origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PATCH", "DELETE"],
-    allow_headers=["Authorization", "Content-Type"],
-    expose_headers=["X-Total-Count"]
+    allow_methods=["GET", "HEAD", "POST", "PATCH", "DELETE"],
+    allow_headers=["Authorization", "Content-Type", "Upload-Offset", "Tus-Resumable"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "Location", "Upload-Offset", "Upload-Length", "Tus-Resumable"]
   )
   
   # Compression middleware
@@ -38,11 +55,16 @@ def create_app() -> FastAPI:
   app.include_router(auth.router, prefix=settings.api_prefix)
   app.include_router(photos.router, prefix=settings.api_prefix)
   app.include_router(settings_api.router, prefix=settings.api_prefix)
+  app.include_router(uploads.router, prefix=settings.api_prefix)
 
   @app.get('/healthz')
   async def healthz():
     return {'status': 'ok', 'version': '1.0.0'}
 
+  @app.get('/metrics', response_class=PlainTextResponse)
+  async def metrics():
+    return loop_monitor.render()
+
   return app
 
 
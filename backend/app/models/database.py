@@ -1,3 +1,4 @@
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 from app.config import get_settings
@@ -10,3 +11,9 @@ SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_co
 
 class Base(DeclarativeBase):
   pass
+
+
+def upsert(db: AsyncSession, table):
+  """Dialect-specific INSERT supporting on_conflict_do_update (Postgres, or SQLite in tests)"""
+  dialect = db.get_bind().dialect.name
+  return (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
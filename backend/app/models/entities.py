@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, DateTime, Integer, JSON, String, Text
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Index, Integer, JSON, String, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 import uuid
@@ -7,11 +7,20 @@ from app.models.database import Base
 
 class Photo(Base):
   __tablename__ = 'photos'
+  __table_args__ = (
+    # Serves the timeline's keyset pages; also covers lookups by user_id alone.
+    Index('idx_photos_user_created', 'user_id', 'created_at', 'id'),
+    # One photo per direct upload, however often or concurrently it is finalized.
+    Index('idx_photos_user_upload_key', 'user_id', 'upload_key', unique=True),
+  )
 
   id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-  user_id = Column(String, index=True, nullable=False)
+  user_id = Column(String, nullable=False)
   storage_key = Column(String, nullable=False)
+  # Where a direct upload landed before it was content-addressed
+  upload_key = Column(String)
   variants = Column(JSON, nullable=False, default=list)
+  placeholder = Column(Text)
   caption_ai = Column(Text)
   note_user = Column(Text)
   exif = Column(JSON, nullable=False, default=dict)
@@ -19,10 +28,78 @@ class Photo(Base):
   place_display = Column(JSON)
   location_override = Column(JSON)
   status = Column(String, nullable=False, default='processing')
+  content_digest = Column(String(64), index=True)
+  phash = Column(BigInteger)
+  duplicate_of = Column(UUID(as_uuid=True))
   created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
   updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
 
 
+class Blob(Base):
+  """A content-addressed original shared by every photo with the same bytes"""
+  __tablename__ = 'blobs'
+
+  digest = Column(String(64), primary_key=True)
+  storage_key = Column(String, nullable=False, unique=True)
+  size_bytes = Column(BigInteger, nullable=False)
+  content_type = Column(String, nullable=False)
+  ref_count = Column(Integer, nullable=False, default=1)
+  # Content-derived results, reused by every photo referencing the blob.
+  variants = Column(JSON)
+  placeholder = Column(Text)
+  exif = Column(JSON)
+  created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class QueuedJob(Base):
+  """A pending or in-flight background job; rows are deleted once done"""
+  __tablename__ = 'jobs'
+  __table_args__ = (
+    Index('idx_jobs_schedule', 'priority', 'fair_rank'),
+    Index('idx_jobs_user_rank', 'user_id', 'fair_rank'),
+  )
+
+  id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+  type = Column(String, nullable=False)
+  photo_id = Column(UUID(as_uuid=True))
+  user_id = Column(String)
+  payload = Column(JSON, nullable=False, default=dict)
+  # Lower runs first; within a priority, fair_rank interleaves users.
+  priority = Column(Integer, nullable=False, default=10)
+  fair_rank = Column(BigInteger, nullable=False, default=0)
+  # Claiming pushes available_at out by the visibility timeout, so a job
+  # whose worker died becomes claimable again once it passes.
+  available_at = Column(DateTime(timezone=True), nullable=False)
+  attempts = Column(Integer, nullable=False, default=0)
+  claimed_by = Column(String)
+  last_error = Column(Text)
+  created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class DeadJob(Base):
+  """A job that kept failing, parked for inspection instead of being retried forever"""
+  __tablename__ = 'dead_jobs'
+
+  id = Column(UUID(as_uuid=True), primary_key=True)
+  type = Column(String, nullable=False)
+  photo_id = Column(UUID(as_uuid=True))
+  payload = Column(JSON, nullable=False, default=dict)
+  attempts = Column(Integer, nullable=False)
+  last_error = Column(Text)
+  created_at = Column(DateTime(timezone=True), nullable=False)
+  failed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class GeocodeCell(Base):
+  """A reverse-geocoded geohash cell shared by every worker, keyed by backend and cell; a NULL label means no place"""
+  __tablename__ = 'geocode_cache'
+
+  cell = Column(String, primary_key=True)
+  label = Column(Text)
+  country = Column(String)
+  checked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
 class UserSettings(Base):
   __tablename__ = 'user_settings'
 
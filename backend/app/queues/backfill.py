@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import io
+import mimetypes
+import uuid
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.config import get_settings
+from app.models.database import engine
+from app.models.entities import Blob, Photo
+from app.queues.events import Job, JobPriority, JobType
+from app.queues.jobs import enqueue_jobs
+from app.services.blobs import acquire_blobs, blob_key
+from app.services.dedup import PerceptualIndex, perceptual_hash, to_signed64
+from app.services.storage import S3StorageService, StorageService
+
+CONTENT_FIELDS = ('exif', 'variants', 'placeholder')
+phash_index = PerceptualIndex(get_settings().duplicate_max_distance)
+
+
+class PhotoBackfillSink:
+  """The API's side of a bulk backfill: originals in storage, results in the photos table"""
+
+  def __init__(self, engine: AsyncEngine, storage: StorageService) -> None:
+    self.engine = engine
+    self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    self.storage = storage
+
+  async def list_keys(self, prefix: str) -> list[tuple[str, int]]:
+    return await asyncio.to_thread(self.storage.list_objects, prefix)
+
+  async def fetch(self, key: str) -> bytes:
+    return await asyncio.to_thread(self.storage.get_object, key)
+
+  async def fetch_range(self, key: str, length: int) -> bytes:
+    return await asyncio.to_thread(self.storage.get_object_range, key, length)
+
+  async def store(self, key: str, data: bytes, content_type: str) -> None:
+    await asyncio.to_thread(self.storage.put_object, key, io.BytesIO(data), content_type)
+
+  async def fingerprint(self, filename: str, data: bytes) -> dict:
+    """How an original from a local import is stored: content-addressed, like uploads.
+
+    Returns its blob key, the fields save() needs under a record's 'import',
+    and whether the bytes are already in storage, so they are uploaded once.
+    """
+    def inspect() -> tuple[str, int]:
+      return hashlib.sha256(data).hexdigest(), perceptual_hash(io.BytesIO(data))
+
+    digest, phash = await asyncio.to_thread(inspect)
+    async with self.sessions() as db:
+      key = await db.scalar(select(Blob.storage_key).where(Blob.digest == digest))
+    key = key or blob_key(digest, filename.rsplit('.', 1)[-1].lower())
+    content_type, _ = mimetypes.guess_type(filename)
+    return {
+      'storage_key': key,
+      'stored': await asyncio.to_thread(self.storage.head_object, key) is not None,
+      'import': {
+        'content_digest': digest,
+        'phash': phash,
+        'size_bytes': len(data),
+        'content_type': content_type or 'application/octet-stream'
+      }
+    }
+
+  async def save(self, records: list[dict], user_id: Optional[str] = None) -> int:
+    """Write a batch of results in one transaction, returning how many photos it touched.
+
+    Every photo on a record's storage key is updated, as is the blob stored
+    there. With a user_id, originals the user has no photo of yet are
+    imported as new photos, with their remaining stages queued in the bulk
+    lane. Records from fingerprint() take a blob reference like uploads, and
+    near-duplicates of the user's processed photos link to their results
+    instead of being queued.
+    """
+    if not records:
+      return 0
+    keys = [record['storage_key'] for record in records]
+    async with self.sessions() as db:
+      photo_ids, owners = defaultdict(list), defaultdict(set)
+      for photo_id, key, owner in (await db.execute(
+        select(Photo.id, Photo.storage_key, Photo.user_id).where(Photo.storage_key.in_(keys))
+      )).all():
+        photo_ids[key].append(photo_id)
+        owners[key].add(owner)
+
+      new = []
+      if user_id is not None:
+        for record in records:
+          key = record['storage_key']
+          # Blobs are shared between users, so an import is new unless this user has it.
+          if (user_id not in owners[key]) if 'import' in record else not photo_ids[key]:
+            new.append(record)
+      imported = [record for record in new if 'import' in record]
+      matches = [None] * len(imported)
+      if imported:
+        await acquire_blobs(db, [(
+          record['import']['content_digest'],
+          record['storage_key'].rsplit('.', 1)[-1],
+          record['import']['size_bytes'],
+          record['import']['content_type']
+        ) for record in imported])
+        matches = await phash_index.find_duplicates(
+          db, user_id, [record['import']['phash'] for record in imported]
+        )
+      duplicates = {id(record): match for record, match in zip(imported, matches)}
+
+      digests = dict((await db.execute(
+        select(Blob.storage_key, Blob.digest).where(Blob.storage_key.in_(keys))
+      )).all())
+      updates, blobs = [], []
+      for record in records:
+        key = record['storage_key']
+        content = {name: record[name] for name in CONTENT_FIELDS if name in record}
+        updates.extend({'id': photo_id, **content} for photo_id in photo_ids[key])
+        if key in digests:
+          blobs.append({'digest': digests[key], **content})
+
+      rows, jobs = [], []
+      for record in new:
+        content = {name: record[name] for name in CONTENT_FIELDS if name in record}
+        row = {
+          'id': uuid.uuid4(),
+          'user_id': user_id,
+          'storage_key': record['storage_key'],
+          'variants': [],
+          'exif': {'hasGps': False},
+          'status': 'processing',
+          **content
+        }
+        if 'import' in record:
+          row.update(
+            content_digest=record['import']['content_digest'],
+            phash=to_signed64(record['import']['phash'])
+          )
+        rows.append(row)
+        duplicate = duplicates.get(id(record))
+        if duplicate is not None:
+          row.update(
+            duplicate_of=duplicate.id,
+            caption_ai=duplicate.caption_ai,
+            place_auto=duplicate.place_auto,
+            place_display=duplicate.place_display,
+            status=duplicate.status
+          )
+          continue
+        stages = [JobType.GEOCODE.value, JobType.CAPTION.value]
+        if 'variants' not in content:
+          stages.insert(0, JobType.DERIVATIVE.value)
+        jobs.append(Job(
+          type=JobType.PROCESS,
+          photo_id=str(row['id']),
+          stages=stages,
+          sizes=get_settings().upload_variant_sizes
+        ))
+
+      # Bulk UPDATE by primary key: one executemany per table.
+      if updates:
+        await db.execute(update(Photo), updates)
+      if blobs:
+        await db.execute(update(Blob), blobs)
+      if rows:
+        await db.execute(insert(Photo), rows)
+        await enqueue_jobs(db, jobs, user_id, priority=JobPriority.BULK)
+      await db.commit()
+    return len(updates) + len(rows)
+
+  async def close(self) -> None:
+    await self.engine.dispose()
+
+
+def create_backfill_sink() -> PhotoBackfillSink:
+  """Default sink for `python -m photodisplay_workers.backfill`"""
+  return PhotoBackfillSink(engine, S3StorageService())
@@ -1,4 +1,4 @@
-from enum import Enum
+from enum import Enum, IntEnum
 from typing import Any, Dict
 
 
@@ -7,21 +7,17 @@ class JobType(str, Enum):
   GEOCODE = 'geocode'
   CAPTION = 'caption'
   DERIVATIVE = 'derivative'
+  # All of a photo's stages in one job, run as a DAG over a single fetch
+  PROCESS = 'process'
+
+
+class JobPriority(IntEnum):
+  """Scheduling lanes; lower is claimed first"""
+  INTERACTIVE = 0  # photos someone is looking at right now
+  UPLOAD = 10
+  BULK = 20  # imports and backfills
 
 
 class Job(Dict[str, Any]):
   type: JobType
   photo_id: str
-
-
-class QueueManager:
-  def __init__(self) -> None:
-    self._queue: list[Job] = []
-
-  def enqueue(self, job: Job) -> None:
-    self._queue.append(job)
-
-  def drain(self) -> list[Job]:
-    jobs = self._queue[:]
-    self._queue.clear()
-    return jobs
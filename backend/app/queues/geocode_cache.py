@@ -0,0 +1,36 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.models.database import engine, upsert
+from app.models.entities import GeocodeCell
+
+
+class GeocodeCacheStore:
+  """Persistent tier of the workers' geocode cache, shared through the geocode_cache table"""
+
+  def __init__(self, engine: AsyncEngine) -> None:
+    self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+  async def get(self, key: str) -> Optional[dict]:
+    async with self.sessions() as db:
+      row = await db.get(GeocodeCell, key)
+      if row is None:
+        return None
+      # SQLite (tests) hands back naive UTC timestamps.
+      checked_at = row.checked_at if row.checked_at.tzinfo else row.checked_at.replace(tzinfo=timezone.utc)
+      return {'label': row.label, 'country': row.country, 'checked_at': checked_at.timestamp()}
+
+  async def put(self, key: str, place: dict) -> None:
+    async with self.sessions() as db:
+      # A new answer replaces the old one, e.g. "no place" that has expired.
+      values = {'label': place['label'], 'country': place['country'], 'checked_at': datetime.now(timezone.utc)}
+      statement = upsert(db, GeocodeCell).values(cell=key, **values)
+      await db.execute(statement.on_conflict_do_update(index_elements=[GeocodeCell.cell], set_=values))
+      await db.commit()
+
+
+def create_geocode_store() -> GeocodeCacheStore:
+  """For the worker's --geocode-store"""
+  return GeocodeCacheStore(engine)
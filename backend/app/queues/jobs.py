@@ -0,0 +1,232 @@
+import asyncio
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.config import get_settings
+from app.models.entities import DeadJob, QueuedJob
+from app.queues.events import Job, JobPriority
+
+JOBS_CHANNEL = 'photodisplay_jobs'
+
+
+def _utcnow() -> datetime:
+  return datetime.now(timezone.utc)
+
+
+async def enqueue_jobs(
+  db: AsyncSession,
+  jobs: Sequence[Job],
+  user_id: Optional[str] = None,
+  priority: int = JobPriority.UPLOAD,
+  delay_seconds: float = 0
+) -> None:
+  """Add jobs in the caller's transaction, so they exist exactly when its rows do.
+
+  Each job gets a fair_rank after the user's queued work but no earlier than
+  the oldest pending rank, so a user's 20,000-photo import is interleaved
+  with everyone else's uploads instead of queued in front of them.
+
+  On Postgres idle workers are woken with NOTIFY, which is delivered on commit.
+  """
+  if not jobs:
+    return
+  current, user_last = (await db.execute(select(
+    select(func.min(QueuedJob.fair_rank)).scalar_subquery(),
+    select(func.max(QueuedJob.fair_rank)).where(QueuedJob.user_id == user_id).scalar_subquery()
+  ))).one()
+  base = max(current or 0, user_last or 0)
+
+  available_at = _utcnow() + timedelta(seconds=delay_seconds)
+  rows = []
+  for rank, job in enumerate(jobs, start=base + 1):
+    payload = {key: value for key, value in job.items() if key not in ('type', 'photo_id')}
+    rows.append({
+      'id': uuid.uuid4(),
+      'type': str(getattr(job['type'], 'value', job['type'])),
+      'photo_id': uuid.UUID(job['photo_id']) if job.get('photo_id') else None,
+      'user_id': user_id,
+      'payload': payload,
+      'priority': int(priority),
+      'fair_rank': rank,
+      'available_at': available_at,
+      'attempts': 0
+    })
+  await db.execute(insert(QueuedJob), rows)
+  if db.get_bind().dialect.name == 'postgresql':
+    await db.execute(select(func.pg_notify(JOBS_CHANNEL, ','.join(sorted({row['type'] for row in rows})))))
+
+
+async def prioritize_photos(db: AsyncSession, user_id: str, photo_ids: Sequence) -> int:
+  """Move queued work for photos on the user's screen into the interactive lane"""
+  if not photo_ids:
+    return 0
+  result = await db.execute(
+    update(QueuedJob)
+    .where(
+      QueuedJob.user_id == user_id,
+      QueuedJob.photo_id.in_(photo_ids),
+      QueuedJob.priority > JobPriority.INTERACTIVE
+    )
+    .values(priority=int(JobPriority.INTERACTIVE))
+  )
+  return result.rowcount
+
+
+async def ensure_queue_capacity(
+  db: AsyncSession,
+  user_id: str,
+  max_depth: Optional[int] = None,
+  max_user_depth: Optional[int] = None
+) -> None:
+  """Turn new uploads away while the queue is saturated, instead of growing the backlog.
+
+  Only jobs ahead of the bulk lane count: an import's backlog is claimed
+  after everything else, so it must not shut out interactive uploads.
+  """
+  settings = get_settings()
+  max_depth = settings.job_queue_max_depth if max_depth is None else max_depth
+  max_user_depth = settings.job_queue_max_user_depth if max_user_depth is None else max_user_depth
+  total, mine = (await db.execute(select(
+    func.count(),
+    func.count().filter(QueuedJob.user_id == user_id)
+  ).where(QueuedJob.priority < JobPriority.BULK))).one()
+
+  retry_after = {'Retry-After': str(settings.job_admission_retry_after_seconds)}
+  if mine >= max_user_depth:
+    raise HTTPException(
+      status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+      detail='Too many photos still processing, try again later',
+      headers=retry_after
+    )
+  if total >= max_depth:
+    raise HTTPException(
+      status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+      detail='Processing queue is full, try again later',
+      headers=retry_after
+    )
+
+
+class JobQueue:
+  """Workers' side of the jobs table.
+
+  claim() hands out up to a batch of due jobs, by priority lane and then
+  fair_rank, with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers
+  never wait on or double-claim each other's rows; SQLite (tests) ignores the
+  locking clause and serialises writers instead. A claim is a lease: finishing it is fenced on the attempt number,
+  so a worker that outlived its visibility timeout cannot complete a job
+  someone else has since claimed.
+  """
+
+  def __init__(
+    self,
+    engine: AsyncEngine,
+    visibility_timeout: float = 300,
+    poll_interval: float = 5.0,
+    worker_id: Optional[str] = None
+  ) -> None:
+    self.engine = engine
+    self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    self.visibility_timeout = visibility_timeout
+    self.poll_interval = poll_interval
+    self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    self._wakeup = asyncio.Event()
+    self._listener: Optional[AsyncConnection] = None
+
+  async def claim(self, limit: int, types: Optional[Sequence[str]] = None) -> list[QueuedJob]:
+    now = _utcnow()
+    due = select(QueuedJob.id).where(QueuedJob.available_at <= now)
+    if types:
+      due = due.where(QueuedJob.type.in_(types))
+    due = due.order_by(QueuedJob.priority, QueuedJob.fair_rank).limit(limit).with_for_update(skip_locked=True)
+    statement = (
+      update(QueuedJob)
+      .where(QueuedJob.id.in_(due.scalar_subquery()))
+      .values(
+        attempts=QueuedJob.attempts + 1,
+        available_at=now + timedelta(seconds=self.visibility_timeout),
+        claimed_by=self.worker_id
+      )
+      .returning(QueuedJob)
+      .execution_options(synchronize_session=False)
+    )
+    async with self.sessions.begin() as db:
+      return list((await db.execute(statement)).scalars())
+
+  def _leased(self, job: QueuedJob):
+    return (QueuedJob.id == job.id) & (QueuedJob.attempts == job.attempts)
+
+  @asynccontextmanager
+  async def _transaction(self, db: Optional[AsyncSession]) -> AsyncIterator[AsyncSession]:
+    """The caller's session, to commit with its own writes, or a new transaction"""
+    if db is not None:
+      yield db
+      return
+    async with self.sessions.begin() as db:
+      yield db
+
+  async def complete(self, job: QueuedJob, db: Optional[AsyncSession] = None) -> bool:
+    """Delete a finished job; False if its lease had already expired and moved on"""
+    async with self._transaction(db) as db:
+      result = await db.execute(delete(QueuedJob).where(self._leased(job)))
+    return result.rowcount == 1
+
+  async def retry(
+    self,
+    job: QueuedJob,
+    delay_seconds: float,
+    error: str,
+    db: Optional[AsyncSession] = None,
+    stages: Optional[Sequence[str]] = None
+  ) -> bool:
+    """Release a job to be claimed again after delay_seconds, for only the given stages if any"""
+    values = {'available_at': _utcnow() + timedelta(seconds=delay_seconds), 'claimed_by': None, 'last_error': error}
+    if stages is not None:
+      values['payload'] = {**job.payload, 'stages': list(stages)}
+    async with self._transaction(db) as db:
+      result = await db.execute(update(QueuedJob).where(self._leased(job)).values(**values))
+    return result.rowcount == 1
+
+  async def dead_letter(self, job: QueuedJob, error: str, db: Optional[AsyncSession] = None) -> bool:
+    """Move a job that keeps failing to dead_jobs so it is never claimed again"""
+    async with self._transaction(db) as db:
+      result = await db.execute(delete(QueuedJob).where(self._leased(job)))
+      if result.rowcount == 1:
+        db.add(DeadJob(
+          id=job.id,
+          type=job.type,
+          photo_id=job.photo_id,
+          payload=job.payload,
+          attempts=job.attempts,
+          last_error=error,
+          created_at=job.created_at
+        ))
+    return result.rowcount == 1
+
+  async def listen(self) -> None:
+    """Subscribe to enqueue notifications (Postgres only; elsewhere wait() just polls)"""
+    if self.engine.dialect.name != 'postgresql' or self._listener is not None:
+      return
+    self._listener = await self.engine.connect()
+    raw = await self._listener.get_raw_connection()
+    await raw.driver_connection.add_listener(JOBS_CHANNEL, lambda *_: self._wakeup.set())
+
+  async def wait(self) -> None:
+    """Sleep until jobs are enqueued or the poll interval passes"""
+    try:
+      await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+    except asyncio.TimeoutError:
+      pass
+    self._wakeup.clear()
+
+  async def close(self) -> None:
+    if self._listener is not None:
+      await self._listener.close()
+      self._listener = None
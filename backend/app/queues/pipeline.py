@@ -0,0 +1,58 @@
+import uuid
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.entities import Blob, Photo, QueuedJob
+from app.queues.events import JobType
+
+
+async def load_photo_task(db: AsyncSession, job: QueuedJob) -> Optional[dict]:
+  """What a worker needs to run a process job: the original's key, stages and known results"""
+  photo = await db.get(Photo, job.photo_id)
+  if photo is None:
+    return None
+  stages = job.payload.get('stages', [])
+  known = {}
+  if JobType.EXIF.value not in stages:
+    known['exif'] = photo.exif
+  return {
+    'photo_id': str(photo.id),
+    'storage_key': photo.storage_key,
+    'stages': stages,
+    'sizes': job.payload.get('sizes'),
+    'digest': photo.content_digest,
+    'known': known
+  }
+
+
+async def save_photo_record(db: AsyncSession, photo_id: str, record: dict) -> Optional[Photo]:
+  """Store a pipeline run's results on the photo, and content results on its blob for reuse.
+
+  The photo becomes 'ready' or 'error' with the run; partial results of a
+  failed run are kept so a retry only has to redo what failed.
+  """
+  photo = await db.get(Photo, uuid.UUID(photo_id))
+  if photo is None:
+    return None
+
+  content = {}
+  if 'exif' in record:
+    photo.exif = content['exif'] = record['exif']
+  if 'variants' in record:
+    photo.variants = content['variants'] = record['variants']
+    photo.placeholder = content['placeholder'] = record['placeholder']
+  if 'place' in record:
+    photo.place_auto = record['place']
+    if not (photo.location_override or {}).get('label'):
+      photo.place_display = record['place']
+  if 'caption' in record:
+    photo.caption_ai = record['caption'][:240]
+  photo.status = record['status']
+  if record.get('errors'):
+    print(f"Photo {photo_id} failed stages: {record['errors']}")
+
+  if content and photo.content_digest:
+    await db.execute(update(Blob).where(Blob.digest == photo.content_digest).values(**content))
+  return photo
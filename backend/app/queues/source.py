@@ -0,0 +1,90 @@
+import asyncio
+import io
+from typing import Optional
+
+from app.config import get_settings
+from app.models.database import engine
+from app.models.entities import QueuedJob
+from app.queues.jobs import JobQueue
+from app.queues.pipeline import load_photo_task, save_photo_record
+from app.services.storage import S3StorageService, StorageService
+
+
+class PhotoJobSource:
+  """The API's side of the worker runtime: jobs, originals and where results go"""
+
+  def __init__(self, queue: JobQueue, storage: StorageService) -> None:
+    self.queue = queue
+    self.storage = storage
+
+  async def start(self) -> None:
+    await self.queue.listen()
+
+  async def claim(self, limit: int) -> list[QueuedJob]:
+    return await self.queue.claim(limit)
+
+  async def wait(self) -> None:
+    await self.queue.wait()
+
+  async def task(self, job: QueuedJob) -> Optional[dict]:
+    async with self.queue.sessions() as db:
+      return await load_photo_task(db, job)
+
+  async def fetch(self, key: str) -> bytes:
+    return await asyncio.to_thread(self.storage.get_object, key)
+
+  async def fetch_range(self, key: str, length: int) -> bytes:
+    return await asyncio.to_thread(self.storage.get_object_range, key, length)
+
+  async def store(self, key: str, data: bytes, content_type: str) -> None:
+    await asyncio.to_thread(self.storage.put_object, key, io.BytesIO(data), content_type)
+
+  async def complete(self, job: QueuedJob) -> bool:
+    return await self.queue.complete(job)
+
+  async def save(self, job: QueuedJob, record: dict) -> bool:
+    """Store results and finish the job together, unless the lease was lost meanwhile"""
+    async with self.queue.sessions() as db:
+      if not await self.queue.complete(job, db):
+        return False
+      await save_photo_record(db, str(job.photo_id), record)
+      await db.commit()
+    return True
+
+  async def retry(
+    self,
+    job: QueuedJob,
+    delay_seconds: float,
+    error: str,
+    record: Optional[dict] = None,
+    stages: Optional[list[str]] = None
+  ) -> bool:
+    """Release the job for its remaining stages, keeping what the failed run did finish"""
+    async with self.queue.sessions() as db:
+      if not await self.queue.retry(job, delay_seconds, error, db, stages=stages):
+        return False
+      if record is not None and job.photo_id is not None:
+        # Still processing until the retry settles it one way or the other.
+        await save_photo_record(db, str(job.photo_id), {**record, 'status': 'processing'})
+      await db.commit()
+    return True
+
+  async def dead_letter(self, job: QueuedJob, error: str, record: Optional[dict] = None) -> bool:
+    async with self.queue.sessions() as db:
+      if not await self.queue.dead_letter(job, error, db):
+        return False
+      if record is not None and job.photo_id is not None:
+        await save_photo_record(db, str(job.photo_id), record)
+      await db.commit()
+    return True
+
+  async def close(self) -> None:
+    await self.queue.close()
+    await self.queue.engine.dispose()
+
+
+def create_job_source() -> PhotoJobSource:
+  """Default source for `python -m photodisplay_workers`"""
+  settings = get_settings()
+  queue = JobQueue(engine, settings.job_visibility_timeout_seconds, settings.job_poll_interval_seconds)
+  return PhotoJobSource(queue, S3StorageService())
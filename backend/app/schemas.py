@@ -4,12 +4,22 @@ from pydantic import BaseModel, Field
 from pydantic.config import ConfigDict
 
 
+class PhotoVariant(BaseModel):
+  size: int
+  format: Literal['jpeg', 'webp', 'avif'] = 'jpeg'
+  width: Optional[int] = None
+  height: Optional[int] = None
+  bytes: Optional[int] = None
+  key: Optional[str] = None
+
+
 class PhotoBase(BaseModel):
   model_config = ConfigDict(populate_by_name=True, json_encoders={datetime: lambda v: v.isoformat()})
 
   userId: str = Field(alias='userId')
   storageKey: str
-  variants: list[str]
+  variants: list[PhotoVariant]
+  placeholder: Optional[str] = None
   captionAi: Optional[str] = Field(default=None, max_length=240)
   noteUser: Optional[str] = Field(default=None, max_length=240)
   exif: dict
@@ -25,6 +35,52 @@ class Photo(PhotoBase):
   updatedAt: datetime = Field(alias='updatedAt')
 
 
+class PhotoSummary(BaseModel):
+  """A photo in the list: only the fields asked for with `fields=` are present"""
+  model_config = ConfigDict(json_encoders={datetime: lambda v: v.isoformat()})
+
+  id: str
+  thumbnail: Optional[str] = None
+  status: Optional[Literal['processing', 'ready', 'error']] = None
+  placeholder: Optional[str] = None
+  userId: Optional[str] = None
+  storageKey: Optional[str] = None
+  variants: Optional[list[PhotoVariant]] = None
+  captionAi: Optional[str] = None
+  noteUser: Optional[str] = None
+  exif: Optional[dict] = None
+  placeAuto: Optional[dict] = None
+  placeDisplay: Optional[dict] = None
+  locationOverride: Optional[dict] = None
+  createdAt: Optional[datetime] = None
+  updatedAt: Optional[datetime] = None
+
+
+class ResumableUploadCreate(BaseModel):
+  filename: str = Field(min_length=1, max_length=255)
+  size: int = Field(gt=0)
+  contentType: str = 'application/octet-stream'
+
+
+class DirectUploadFile(BaseModel):
+  filename: str = Field(min_length=1, max_length=255)
+  size: int = Field(gt=0)
+  contentType: str
+
+
+class DirectUploadRequest(BaseModel):
+  files: list[DirectUploadFile] = Field(min_length=1)
+
+
+class DirectUploadItem(BaseModel):
+  key: str = Field(min_length=1, max_length=512)
+  size: int = Field(gt=0)
+
+
+class DirectUploadFinalize(BaseModel):
+  uploads: list[DirectUploadItem] = Field(min_length=1)
+
+
 class PhotoUpdateNote(BaseModel):
   note: str = Field(min_length=0, max_length=240)
 
@@ -0,0 +1,66 @@
+from collections import Counter
+from typing import Sequence
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import upsert
+from app.models.entities import Blob
+
+
+def blob_key(digest: str, extension: str) -> str:
+  return f'blobs/{digest[:2]}/{digest}.{extension}'
+
+
+async def acquire_blobs(
+  db: AsyncSession, uploads: Sequence[tuple[str, str, int, str]]
+) -> list[tuple[Blob, bool]]:
+  """Take a reference per (digest, extension, size, content_type), in one statement.
+
+  Returns each upload's blob and whether this batch created it, in which case
+  the caller must store the bytes before committing; when a batch repeats a
+  digest only its first occurrence is flagged. Concurrent first uploads of
+  the same bytes serialise on the primary key, so only one of them stores.
+  """
+  counts = Counter(digest for digest, *_ in uploads)
+  rows = {}
+  for digest, extension, size_bytes, content_type in uploads:
+    rows.setdefault(digest, {
+      'digest': digest,
+      'storage_key': blob_key(digest, extension),
+      'size_bytes': size_bytes,
+      'content_type': content_type,
+      'ref_count': counts[digest]
+    })
+
+  # One row per digest: Postgres refuses to update the same row twice in a statement.
+  # Rows go in digest order, so concurrent batches lock shared blobs in the same
+  # order and wait on each other instead of deadlocking.
+  statement = upsert(db, Blob).values([rows[digest] for digest in sorted(rows)])
+  statement = statement.on_conflict_do_update(
+    index_elements=[Blob.digest],
+    set_={'ref_count': Blob.ref_count + statement.excluded.ref_count}
+  ).returning(Blob)
+  result = await db.execute(statement, execution_options={'populate_existing': True})
+  blobs = {blob.digest: blob for blob in result.scalars()}
+
+  acquired, seen = [], set()
+  for digest, *_ in uploads:
+    blob = blobs[digest]
+    acquired.append((blob, digest not in seen and blob.ref_count == counts[digest]))
+    seen.add(digest)
+  return acquired
+
+
+async def acquire_blob(
+  db: AsyncSession, digest: str, extension: str, size_bytes: int, content_type: str
+) -> tuple[Blob, bool]:
+  """Take a reference on the blob for digest, creating its row on first sight"""
+  [acquired] = await acquire_blobs(db, [(digest, extension, size_bytes, content_type)])
+  return acquired
+
+
+async def release_blobs(db: AsyncSession, digests: Sequence[str]) -> None:
+  """Give back references taken by acquire_blobs, one per digest listed"""
+  for digest, count in sorted(Counter(digests).items()):
+    await db.execute(update(Blob).where(Blob.digest == digest).values(ref_count=Blob.ref_count - count))
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import BinaryIO, Hashable, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.entities import Photo
+
+HASH_BITS = 64
+
+
+def dhash(image: Image.Image) -> int:
+  """64-bit difference hash: sign of horizontal gradients on a 9x8 grayscale thumbnail"""
+  # Ask JPEG for a 1/8-scale decode; the hash only needs a few pixels.
+  image.draft('L', (64, 64))
+  pixels = np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+  bits = pixels[:, 1:] > pixels[:, :-1]
+  return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def perceptual_hash(file: BinaryIO) -> int:
+  file.seek(0)
+  try:
+    with Image.open(file) as image:
+      return dhash(image)
+  finally:
+    file.seek(0)
+
+
+def to_signed64(value: int) -> int:
+  """Map an unsigned 64-bit hash onto a signed BIGINT column"""
+  return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed64(value: int) -> int:
+  return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def hamming(a: int, b: int) -> int:
+  return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+  """Exact Hamming-radius search over 64-bit hashes via multi-index hashing.
+
+  The hash is split into max_distance + 1 disjoint chunks. By pigeonhole, any
+  hash within max_distance bits agrees exactly with the query on at least one
+  chunk, so a lookup is one dict probe per chunk plus a popcount per candidate.
+  """
+
+  def __init__(self, max_distance: int = 4) -> None:
+    self.max_distance = max_distance
+    chunks = max_distance + 1
+    widths = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+    shifts = [sum(widths[i + 1:]) for i in range(chunks)]
+    self._chunks = [(shift, (1 << width) - 1) for shift, width in zip(shifts, widths)]
+    self._tables: list[dict[int, list[tuple[int, Hashable]]]] = [{} for _ in self._chunks]
+    self.size = 0
+
+  def add(self, value: int, item: Hashable) -> None:
+    self.size += 1
+    for table, (shift, mask) in zip(self._tables, self._chunks):
+      table.setdefault((value >> shift) & mask, []).append((value, item))
+
+  def search(self, value: int, max_distance: Optional[int] = None) -> list[tuple[int, Hashable]]:
+    """All items within max_distance (at most the index radius), nearest first"""
+    radius = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+    matches: dict[Hashable, int] = {}
+    for table, (shift, mask) in zip(self._tables, self._chunks):
+      for candidate, item in table.get((value >> shift) & mask, ()):
+        if item not in matches:
+          distance = hamming(value, candidate)
+          if distance <= radius:
+            matches[item] = distance
+    return sorted(((distance, item) for item, distance in matches.items()), key=lambda match: match[0])
+
+
+class PerceptualIndex:
+  """Per-user hash indexes, loaded lazily and topped up incrementally.
+
+  Each lookup first pulls rows created since the last one seen, so photos
+  added by other API processes are picked up without reloading the whole
+  index. created_at is stamped when a row's transaction starts, not when it
+  commits, so a row can become visible with a timestamp behind the
+  watermark; every top-up re-reads an overlap window before it and skips
+  the ids already indexed.
+  """
+
+  def __init__(self, max_distance: int = 4, max_users: int = 1000, overlap_seconds: float = 300) -> None:
+    self.max_distance = max_distance
+    self.max_users = max_users
+    self.overlap = timedelta(seconds=overlap_seconds)
+    self._indexes: OrderedDict[str, tuple[MultiIndexHash, set, Optional[datetime]]] = OrderedDict()
+
+  async def refresh(self, db: AsyncSession, user_id: str) -> MultiIndexHash:
+    index, seen, watermark = self._indexes.pop(user_id, None) or (MultiIndexHash(self.max_distance), set(), None)
+    query = select(Photo.id, Photo.phash, Photo.created_at).where(
+      Photo.user_id == user_id, Photo.phash.is_not(None)
+    )
+    if watermark is not None:
+      query = query.where(Photo.created_at > watermark - self.overlap)
+    for photo_id, phash, created_at in (await db.execute(query)).all():
+      if photo_id in seen:
+        continue
+      seen.add(photo_id)
+      index.add(from_signed64(phash), photo_id)
+      watermark = max(watermark, created_at) if watermark else created_at
+
+    self._indexes[user_id] = (index, seen, watermark)
+    while len(self._indexes) > self.max_users:
+      self._indexes.popitem(last=False)
+    return index
+
+  async def find_duplicates(
+    self, db: AsyncSession, user_id: str, values: Sequence[int]
+  ) -> list[Optional[Photo]]:
+    """Nearest already-processed photo of this user within max_distance bits, per value.
+
+    One refresh and one lookup cover the whole batch.
+    """
+    index = await self.refresh(db, user_id)
+    candidates = [[photo_id for _, photo_id in index.search(value)] for value in values]
+    ids = {photo_id for matches in candidates for photo_id in matches}
+    ready = {}
+    if ids:
+      result = await db.execute(
+        select(Photo).where(Photo.id.in_(ids), Photo.user_id == user_id, Photo.status == 'ready')
+      )
+      ready = {photo.id: photo for photo in result.scalars()}
+    return [next((ready[photo_id] for photo_id in matches if photo_id in ready), None) for matches in candidates]
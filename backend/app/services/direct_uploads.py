@@ -0,0 +1,55 @@
+import asyncio
+import uuid
+
+from fastapi import HTTPException, status
+
+from app.config import get_settings
+from app.services.offload import run_cpu_bound
+from app.services.storage import StorageService
+from app.utils.file_validation import HEADER_LIMIT, validate_image_header
+
+settings = get_settings()
+
+# Downloaded originals stay in memory up to this size, then spill to disk
+SPOOL_BYTES = 1024 * 1024
+
+
+def direct_upload_key(user_id: str, filename: str) -> str:
+  """Fresh storage key under the user's incoming prefix; only the extension is kept from the client"""
+  extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+  if not extension.isalnum() or len(extension) > 5:
+    extension = 'bin'
+  return f'{settings.direct_upload_prefix}/{user_id}/{uuid.uuid4().hex}.{extension}'
+
+
+def owns_direct_upload_key(user_id: str, key: str) -> bool:
+  prefix = f'{settings.direct_upload_prefix}/{user_id}/'
+  name = key[len(prefix):]
+  return key.startswith(prefix) and bool(name) and '/' not in name and '..' not in name
+
+
+async def check_direct_upload(storage: StorageService, key: str, size: int) -> str:
+  """Confirm a presigned upload landed intact and is an allowed image, returning its content type.
+
+  Only object metadata and a bounded header prefix are read, so a bad upload
+  is turned away before its bytes are fetched.
+  """
+  info = await asyncio.to_thread(storage.head_object, key)
+  if info is None:
+    raise HTTPException(
+      status_code=status.HTTP_404_NOT_FOUND,
+      detail='Object has not been uploaded'
+    )
+  if info.size != size:
+    raise HTTPException(
+      status_code=status.HTTP_409_CONFLICT,
+      detail=f'Size mismatch: expected {size} bytes, stored {info.size}'
+    )
+  if info.size > settings.max_file_size_mb * 1024 * 1024:
+    raise HTTPException(
+      status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+      detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
+    )
+  header = await asyncio.to_thread(storage.get_object_range, key, min(info.size, HEADER_LIMIT))
+  content_type, *_ = await run_cpu_bound(validate_image_header, header)
+  return content_type
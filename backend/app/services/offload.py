@@ -0,0 +1,78 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from app.config import get_settings
+
+T = TypeVar('T')
+
+
+@functools.lru_cache
+def get_cpu_executor() -> ThreadPoolExecutor:
+  """Bounded pool for upload-time CPU work (libmagic, hashing, PIL).
+
+  hashlib, libmagic and Pillow's codecs release the GIL, so threads run
+  in parallel while keeping the event loop free for other requests.
+  """
+  settings = get_settings()
+  return ThreadPoolExecutor(max_workers=settings.upload_cpu_workers, thread_name_prefix='upload-cpu')
+
+
+async def run_cpu_bound(fn: Callable[..., T], *args: Any) -> T:
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(get_cpu_executor(), functools.partial(fn, *args))
+
+
+class LoopLagMonitor:
+  """Measures how long the event loop is blocked.
+
+  A task sleeps for `interval` seconds and records how late it wakes up:
+  any overshoot is time during which no other coroutine could run.
+  """
+
+  def __init__(self, interval: float = 0.1, warn_after: float = 0.25) -> None:
+    self.interval = interval
+    self.warn_after = warn_after
+    self.blocked_seconds_total = 0.0
+    self.lag_seconds_max = 0.0
+    self.lag_seconds_last = 0.0
+    self.samples = 0
+    self._task: Optional[asyncio.Task] = None
+
+  def start(self) -> None:
+    if self._task is None:
+      self._task = asyncio.get_running_loop().create_task(self._run())
+
+  async def stop(self) -> None:
+    if self._task is not None:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+      self._task = None
+
+  async def _run(self) -> None:
+    while True:
+      started = time.perf_counter()
+      await asyncio.sleep(self.interval)
+      lag = max(0.0, time.perf_counter() - started - self.interval)
+      self.samples += 1
+      self.lag_seconds_last = lag
+      self.lag_seconds_max = max(self.lag_seconds_max, lag)
+      self.blocked_seconds_total += lag
+      if lag >= self.warn_after:
+        print(f"Event loop blocked for {lag:.3f}s")
+
+  def render(self) -> str:
+    """Prometheus text exposition of the lag counters"""
+    return (
+      '# TYPE event_loop_blocked_seconds_total counter\n'
+      f'event_loop_blocked_seconds_total {self.blocked_seconds_total:.6f}\n'
+      '# TYPE event_loop_lag_seconds_max gauge\n'
+      f'event_loop_lag_seconds_max {self.lag_seconds_max:.6f}\n'
+      '# TYPE event_loop_lag_seconds gauge\n'
+      f'event_loop_lag_seconds {self.lag_seconds_last:.6f}\n'
+    )
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Optional
+
+from fastapi import HTTPException, status
+
+
+@dataclass
+class StagedUpload:
+  id: str
+  user_id: str
+  filename: str
+  content_type: str
+  length: int
+  offset: int = 0
+  # What finalizing returned, once it has; the part file is gone by then.
+  result: Optional[dict] = None
+
+
+class ResumableUploadStore:
+  """Local staging area for tus-style resumable uploads.
+
+  Each upload is an append-only `<id>.part` file next to a `<id>.json`
+  sidecar. The current offset is simply the size of the part file, so
+  whatever reached the disk before a connection dropped is kept and the
+  client resumes from there. A finalized upload keeps only its sidecar,
+  holding the result, so a retried finalize returns the same photos until
+  the reaper removes it.
+  """
+
+  def __init__(self, root: str | Path, ttl_seconds: int) -> None:
+    self.root = Path(root)
+    self.ttl_seconds = ttl_seconds
+    self.root.mkdir(parents=True, exist_ok=True)
+    self._locks: dict[str, asyncio.Lock] = {}
+
+  def _part(self, upload_id: str) -> Path:
+    return self.root / f'{upload_id}.part'
+
+  def _meta(self, upload_id: str) -> Path:
+    return self.root / f'{upload_id}.json'
+
+  def create(self, user_id: str, filename: str, content_type: str, length: int) -> StagedUpload:
+    upload = StagedUpload(
+      id=uuid.uuid4().hex,
+      user_id=user_id,
+      filename=filename,
+      content_type=content_type,
+      length=length
+    )
+    self._part(upload.id).touch()
+    self._write_meta(upload)
+    return upload
+
+  def _write_meta(self, upload: StagedUpload) -> None:
+    meta = asdict(upload)
+    meta.pop('offset')
+    if meta['result'] is None:
+      meta.pop('result')
+    # Replaced in one rename, so a reader never sees half a sidecar.
+    partial = self.root / f'{upload.id}.json.tmp'
+    partial.write_text(json.dumps(meta))
+    partial.replace(self._meta(upload.id))
+
+  def get(self, upload_id: str, user_id: str) -> Optional[StagedUpload]:
+    if not upload_id.isalnum():
+      return None
+    try:
+      meta = json.loads(self._meta(upload_id).read_text())
+      offset = meta['length'] if 'result' in meta else self._part(upload_id).stat().st_size
+    except (FileNotFoundError, ValueError):
+      return None
+    if meta['user_id'] != user_id:
+      return None
+    return StagedUpload(offset=offset, **meta)
+
+  def _lock(self, upload_id: str) -> asyncio.Lock:
+    return self._locks.setdefault(upload_id, asyncio.Lock())
+
+  @asynccontextmanager
+  async def lock(self, upload_id: str) -> AsyncIterator[None]:
+    """Hold the upload against appends and other finalizes in this process"""
+    async with self._lock(upload_id):
+      yield
+
+  async def append(self, upload: StagedUpload, offset: int, chunks: AsyncIterator[bytes]) -> int:
+    """Append streamed chunks at offset, returning the new offset.
+
+    Bytes are written as they arrive, so if the stream is cut off the part
+    file keeps everything received up to that point.
+    """
+    lock = self._lock(upload.id)
+    if lock.locked():
+      raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail='Upload is already receiving data'
+      )
+    if upload.result is not None:
+      raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail='Upload is already finalized'
+      )
+    async with lock:
+      current = self._part(upload.id).stat().st_size
+      if offset != current:
+        raise HTTPException(
+          status_code=status.HTTP_409_CONFLICT,
+          detail=f'Upload-Offset mismatch, expected {current}',
+          headers={'Upload-Offset': str(current)}
+        )
+      with self._part(upload.id).open('ab') as part:
+        async for chunk in chunks:
+          if current + len(chunk) > upload.length:
+            raise HTTPException(
+              status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+              detail='Chunk exceeds declared upload length',
+              headers={'Upload-Offset': str(current)}
+            )
+          await asyncio.to_thread(part.write, chunk)
+          current += len(chunk)
+      upload.offset = current
+      return current
+
+  def open(self, upload: StagedUpload) -> BinaryIO:
+    return self._part(upload.id).open('rb')
+
+  def complete(self, upload: StagedUpload, result: dict) -> None:
+    """Record what finalizing returned and free the staged bytes"""
+    upload.result = result
+    self._write_meta(upload)
+    self._part(upload.id).unlink(missing_ok=True)
+
+  def discard(self, upload_id: str) -> None:
+    self._part(upload_id).unlink(missing_ok=True)
+    self._meta(upload_id).unlink(missing_ok=True)
+    self._locks.pop(upload_id, None)
+
+  def reap(self, now: Optional[float] = None) -> int:
+    """Delete uploads that have not received data within the TTL"""
+    cutoff = (now or time.time()) - self.ttl_seconds
+    reaped = 0
+    for meta in self.root.glob('*.json'):
+      upload_id = meta.stem
+      part = self._part(upload_id)
+      try:
+        last_activity = max(meta.stat().st_mtime, part.stat().st_mtime if part.exists() else 0)
+      except FileNotFoundError:
+        continue
+      if last_activity < cutoff:
+        self.discard(upload_id)
+        reaped += 1
+    # Part files whose sidecar never got written.
+    for part in self.root.glob('*.part'):
+      try:
+        orphaned = not self._meta(part.stem).exists() and part.stat().st_mtime < cutoff
+      except FileNotFoundError:
+        continue
+      if orphaned:
+        part.unlink(missing_ok=True)
+        reaped += 1
+    return reaped
+
+  async def run_reaper(self, interval_seconds: float) -> None:
+    while True:
+      await asyncio.sleep(interval_seconds)
+      reaped = await asyncio.to_thread(self.reap)
+      if reaped:
+        print(f"Reaped {reaped} stale resumable uploads")
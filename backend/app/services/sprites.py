@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import io
+from typing import Optional, Sequence
+
+from PIL import Image
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.entities import Photo
+from app.services.storage import StorageService
+from app.services.variant_cache import ENCODER_OPTIONS, VariantCache, render_variant
+from app.utils.pagination import decode_cursor
+from app.utils.variants import select_variant
+
+SPRITE_CELL = 256
+SPRITE_COLUMNS = 10
+
+
+async def load_sprite_page(db: AsyncSession, user_id: str, cursor: Optional[str], limit: int) -> Sequence:
+  """Rows on one sprite page: the same newest-first keyset page GET /photos/ returns for cursor and limit.
+
+  A page reached by cursor keeps its rows as new uploads arrive, so its
+  sheet keeps its fingerprint and stays cached; only the first page moves.
+  """
+  query = select(
+    Photo.id, Photo.storage_key, Photo.content_digest, Photo.variants, Photo.status, Photo.updated_at
+  ).where(Photo.user_id == user_id)
+  if cursor:
+    query = query.where(tuple_(Photo.created_at, Photo.id) < decode_cursor(cursor))
+  result = await db.execute(query.order_by(Photo.created_at.desc(), Photo.id.desc()).limit(limit))
+  return result.all()
+
+
+def sprite_fingerprint(rows: Sequence) -> str:
+  """Changes only when a photo on this page is added, replaced or updated"""
+  digest = hashlib.sha256()
+  for row in rows:
+    digest.update(f'{row.id}:{row.content_digest}:{row.updated_at}\n'.encode())
+  return digest.hexdigest()[:16]
+
+
+async def load_thumbnail(row, storage: StorageService, cache: VariantCache) -> bytes:
+  """The photo's 256px JPEG, via the shared variant cache"""
+  async def render() -> bytes:
+    variant = select_variant(row.variants, SPRITE_CELL, None)
+    if variant and variant['size'] == SPRITE_CELL and variant.get('key'):
+      return await asyncio.to_thread(storage.get_object, variant['key'])
+    original = await asyncio.to_thread(storage.get_object, row.storage_key)
+    return await asyncio.to_thread(render_variant, original, SPRITE_CELL, 'jpeg')
+
+  async with cache.open(f'{row.content_digest or row.id}-{SPRITE_CELL}.jpeg', render) as path:
+    return await asyncio.to_thread(path.read_bytes)
+
+
+async def load_thumbnails(
+  rows: Sequence, storage: StorageService, cache: VariantCache, concurrency: int = 8
+) -> list[bytes]:
+  semaphore = asyncio.Semaphore(concurrency)
+
+  async def fetch(row) -> bytes:
+    async with semaphore:
+      return await load_thumbnail(row, storage, cache)
+
+  return await asyncio.gather(*(fetch(row) for row in rows))
+
+
+def sprite_size(count: int) -> tuple[int, int]:
+  """Width and height of the sheet for count thumbnails"""
+  columns = min(SPRITE_COLUMNS, max(1, count))
+  return columns * SPRITE_CELL, max(1, -(-count // columns)) * SPRITE_CELL
+
+
+def sprite_tiles(rows: Sequence, thumbnails: Sequence[bytes]) -> list[dict]:
+  """Offset map of each photo's thumbnail within the sheet"""
+  columns = min(SPRITE_COLUMNS, max(1, len(thumbnails)))
+  tiles = []
+  for index, (row, data) in enumerate(zip(rows, thumbnails)):
+    # Only the header is parsed here, nothing is decoded.
+    with Image.open(io.BytesIO(data)) as thumb:
+      scale = min(SPRITE_CELL / thumb.width, SPRITE_CELL / thumb.height, 1.0)
+      width, height = round(thumb.width * scale), round(thumb.height * scale)
+    tiles.append({
+      'id': str(row.id),
+      'x': (index % columns) * SPRITE_CELL,
+      'y': (index // columns) * SPRITE_CELL,
+      'width': width,
+      'height': height
+    })
+  return tiles
+
+
+def pack_sprite(tiles: Sequence[dict], thumbnails: Sequence[bytes], fmt: str = 'jpeg') -> bytes:
+  """Paste thumbnails into one sheet at the positions given by sprite_tiles"""
+  sheet = Image.new('RGB', sprite_size(len(thumbnails)), (17, 24, 39))
+  for tile, data in zip(tiles, thumbnails):
+    with Image.open(io.BytesIO(data)) as thumb:
+      thumb = thumb.convert('RGB')
+      if thumb.size != (tile['width'], tile['height']):
+        thumb = thumb.resize((tile['width'], tile['height']))
+      sheet.paste(thumb, (tile['x'], tile['y']))
+  buffer = io.BytesIO()
+  sheet.save(buffer, format=fmt.upper(), **ENCODER_OPTIONS[fmt])
+  return buffer.getvalue()
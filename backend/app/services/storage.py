@@ -1,9 +1,10 @@
 import datetime as dt
-from dataclasses import dataclass
-from typing import Protocol
+from dataclasses import dataclass, field
+from typing import BinaryIO, Optional, Protocol
 
 import boto3
 from botocore.client import BaseClient
+from botocore.exceptions import ClientError
 from app.config import get_settings
 
 settings = get_settings()
@@ -17,11 +18,27 @@ def _client() -> BaseClient:
 class SignedUrl:
   url: str
   expires_at: dt.datetime
+  # Form fields a presigned POST must carry alongside the file
+  fields: dict = field(default_factory=dict)
+
+
+@dataclass
+class ObjectInfo:
+  size: int
+  content_type: Optional[str]
 
 
 class StorageService(Protocol):
   def create_upload_url(self, key: str, content_type: str) -> SignedUrl: ...
   def create_download_url(self, key: str) -> SignedUrl: ...
+  def put_object(self, key: str, body: BinaryIO, content_type: str) -> None: ...
+  def get_object(self, key: str) -> bytes: ...
+  def get_object_range(self, key: str, length: int) -> bytes: ...
+  def download_object(self, key: str, file: BinaryIO) -> None: ...
+  def copy_object(self, source: str, key: str) -> None: ...
+  def delete_object(self, key: str) -> None: ...
+  def head_object(self, key: str) -> Optional[ObjectInfo]: ...
+  def list_objects(self, prefix: str) -> list[tuple[str, int]]: ...
 
 
 class S3StorageService:
@@ -30,14 +47,21 @@ class S3StorageService:
 
   def create_upload_url(self, key: str, content_type: str) -> SignedUrl:
     expiration = settings.signed_url_ttl_seconds
-    url = self.client.generate_presigned_post(
+    post = self.client.generate_presigned_post(
       Bucket=settings.storage_bucket,
       Key=key,
       Fields={'Content-Type': content_type},
-      Conditions=[["content-length-range", 1, 25 * 1024 * 1024]],
+      Conditions=[
+        {'Content-Type': content_type},
+        ["content-length-range", 1, settings.max_file_size_mb * 1024 * 1024]
+      ],
       ExpiresIn=expiration
     )
-    return SignedUrl(url=url['url'], expires_at=dt.datetime.utcnow() + dt.timedelta(seconds=expiration))
+    return SignedUrl(
+      url=post['url'],
+      expires_at=dt.datetime.utcnow() + dt.timedelta(seconds=expiration),
+      fields=post['fields']
+    )
 
   def create_download_url(self, key: str) -> SignedUrl:
     expiration = settings.signed_url_ttl_seconds
@@ -47,3 +71,42 @@ class S3StorageService:
       ExpiresIn=expiration
     )
     return SignedUrl(url=url, expires_at=dt.datetime.utcnow() + dt.timedelta(seconds=expiration))
+
+  def put_object(self, key: str, body: BinaryIO, content_type: str) -> None:
+    self.client.upload_fileobj(body, settings.storage_bucket, key, ExtraArgs={'ContentType': content_type})
+
+  def get_object(self, key: str) -> bytes:
+    response = self.client.get_object(Bucket=settings.storage_bucket, Key=key)
+    return response['Body'].read()
+
+  def get_object_range(self, key: str, length: int) -> bytes:
+    response = self.client.get_object(Bucket=settings.storage_bucket, Key=key, Range=f'bytes=0-{length - 1}')
+    return response['Body'].read()
+
+  def download_object(self, key: str, file: BinaryIO) -> None:
+    self.client.download_fileobj(settings.storage_bucket, key, file)
+
+  def copy_object(self, source: str, key: str) -> None:
+    # Server-side: the bytes never pass through the API.
+    self.client.copy({'Bucket': settings.storage_bucket, 'Key': source}, settings.storage_bucket, key)
+
+  def delete_object(self, key: str) -> None:
+    self.client.delete_object(Bucket=settings.storage_bucket, Key=key)
+
+  def head_object(self, key: str) -> Optional[ObjectInfo]:
+    try:
+      response = self.client.head_object(Bucket=settings.storage_bucket, Key=key)
+    except ClientError as e:
+      if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+        return None
+      raise
+    return ObjectInfo(size=response['ContentLength'], content_type=response.get('ContentType'))
+
+  def list_objects(self, prefix: str) -> list[tuple[str, int]]:
+    """(key, size) of every object under prefix"""
+    paginator = self.client.get_paginator('list_objects_v2')
+    return [
+      (item['Key'], item['Size'])
+      for page in paginator.paginate(Bucket=settings.storage_bucket, Prefix=prefix)
+      for item in page.get('Contents', [])
+    ]
@@ -0,0 +1,160 @@
+import asyncio
+import io
+import os
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+from fastapi.responses import FileResponse
+from PIL import Image
+
+# Matches the derivative worker's encoder settings so lazy and pre-rendered
+# variants look the same.
+ENCODER_OPTIONS: dict[str, dict] = {
+  'jpeg': {'quality': 85},
+  'webp': {'quality': 80, 'method': 4},
+  'avif': {'quality': 60},
+}
+
+
+def renderable_formats() -> list[str]:
+  """Variant formats the installed Pillow can encode, smallest output first"""
+  Image.init()
+  return [fmt for fmt in ('avif', 'webp', 'jpeg') if fmt.upper() in Image.SAVE]
+
+
+def render_variant(original: bytes, size: int, fmt: str = 'jpeg') -> bytes:
+  """Render one variant from the original, decoding JPEGs at reduced scale"""
+  with Image.open(io.BytesIO(original)) as image:
+    image.draft('RGB', (size, size))
+    frame = image.convert('RGB')
+  frame.thumbnail((size, size))
+  buffer = io.BytesIO()
+  frame.save(buffer, format=fmt.upper(), **ENCODER_OPTIONS[fmt])
+  return buffer.getvalue()
+
+
+class VariantCache:
+  """Local disk cache for lazily rendered variants.
+
+  Entries are evicted least-recently-used once the cache exceeds max_bytes,
+  and concurrent misses for the same key share a single render. Callers
+  acquire() an entry and release() it once they are done with the file: an
+  evicted entry that is still being read is unlinked by its last release.
+  """
+
+  def __init__(self, root: str | Path, max_bytes: int) -> None:
+    self.root = Path(root)
+    self.max_bytes = max_bytes
+    self.root.mkdir(parents=True, exist_ok=True)
+    self._entries: OrderedDict[str, int] = OrderedDict()
+    self._bytes = 0
+    self._inflight: dict[str, asyncio.Future] = {}
+    self._readers: Counter[str] = Counter()
+    # Evicted while being read, unlinked on the last release.
+    self._doomed: set[str] = set()
+    self._load()
+
+  @property
+  def size_bytes(self) -> int:
+    return self._bytes
+
+  def _load(self) -> None:
+    # Rebuild the LRU order from disk so a restart keeps the warm set.
+    files = [path for path in self.root.iterdir() if path.is_file() and not path.name.endswith('.tmp')]
+    for path in sorted(files, key=lambda p: p.stat().st_mtime):
+      self._entries[path.name] = path.stat().st_size
+      self._bytes += path.stat().st_size
+    self._evict()
+
+  def _write(self, path: Path, data: bytes) -> None:
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+  def _evict(self) -> None:
+    # Never evict the most recent entry, even if it alone exceeds the budget.
+    while self._bytes > self.max_bytes and len(self._entries) > 1:
+      name, size = self._entries.popitem(last=False)
+      self._bytes -= size
+      if self._readers[name]:
+        self._doomed.add(name)
+      else:
+        (self.root / name).unlink(missing_ok=True)
+
+  async def acquire(self, key: str, render: Callable[[], Awaitable[bytes]]) -> Path:
+    """The entry's file, rendered on a miss; it stays on disk until release(key)"""
+    # Counted before waiting on the render, so a fill for another key
+    # can't unlink this one before the caller gets to read it.
+    self._readers[key] += 1
+    try:
+      return await self._get_or_render(key, render)
+    except BaseException:
+      self.release(key)
+      raise
+
+  def release(self, key: str) -> None:
+    self._readers[key] -= 1
+    if self._readers[key] > 0:
+      return
+    del self._readers[key]
+    if key in self._doomed:
+      self._doomed.discard(key)
+      (self.root / key).unlink(missing_ok=True)
+
+  @asynccontextmanager
+  async def open(self, key: str, render: Callable[[], Awaitable[bytes]]) -> AsyncIterator[Path]:
+    path = await self.acquire(key, render)
+    try:
+      yield path
+    finally:
+      self.release(key)
+
+  async def _get_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> Path:
+    path = self.root / key
+    if key in self._entries and path.exists():
+      self._entries.move_to_end(key)
+      return path
+
+    task = self._inflight.get(key)
+    if task is None:
+      # The render runs as its own task so a disconnecting client doesn't
+      # cancel it for everyone else waiting on the same key.
+      task = asyncio.ensure_future(self._fill(key, path, render))
+      self._inflight[key] = task
+      task.add_done_callback(lambda done: self._finish(key, done))
+    return await asyncio.shield(task)
+
+  async def _fill(self, key: str, path: Path, render: Callable[[], Awaitable[bytes]]) -> Path:
+    data = await render()
+    await asyncio.to_thread(self._write, path, data)
+    # Written afresh, so an earlier eviction no longer applies.
+    self._doomed.discard(key)
+    if key in self._entries:
+      self._bytes -= self._entries.pop(key)
+    self._entries[key] = len(data)
+    self._bytes += len(data)
+    self._evict()
+    return path
+
+  def _finish(self, key: str, task: asyncio.Future) -> None:
+    self._inflight.pop(key, None)
+    # Waiters re-raise failures themselves; don't warn when all of them left.
+    if not task.cancelled():
+      task.exception()
+
+
+class CachedFileResponse(FileResponse):
+  """Serves an acquired cache entry and releases it once sent, or once the client leaves"""
+
+  def __init__(self, cache: VariantCache, key: str, path: Path, **kwargs) -> None:
+    super().__init__(path, **kwargs)
+    self.cache = cache
+    self.key = key
+
+  async def __call__(self, scope, receive, send) -> None:
+    try:
+      await super().__call__(scope, receive, send)
+    finally:
+      self.cache.release(self.key)
@@ -1,77 +1,366 @@
+import hashlib
+import io
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Generator, Optional
+
 import magic
 from fastapi import HTTPException, status, UploadFile
 from PIL import Image
-import io
 from app.config import get_settings
 
 settings = get_settings()
 
 
-def validate_file_type(file: UploadFile) -> None:
-    """Validate file type using python-magic"""
-    if not file.content_type:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File type could not be determined"
-        )
-    
-    # Read first 1024 bytes for magic number detection
-    file.file.seek(0)
-    file_header = file.file.read(1024)
-    file.file.seek(0)
-    
-    # Detect actual file type
-    detected_type = magic.from_buffer(file_header, mime=True)
-    
-    if detected_type not in settings.allowed_file_types:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File type {detected_type} not allowed. Allowed types: {', '.join(settings.allowed_file_types)}"
-        )
+ALLOWED_IMAGE_FORMATS = ['JPEG', 'PNG', 'WEBP', 'GIF']
+HEADER_LIMIT = 512 * 1024  # Largest prefix kept around to parse the image header
+MAGIC_LENGTH = 16  # Enough leading bytes to tell the formats apart
 
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG markers without a length field: TEM and the restart markers
+_JPEG_STANDALONE = {0x01, *range(0xD0, 0xD8)}
+_JPEG_START_OF_SCAN, _JPEG_END_OF_IMAGE = 0xDA, 0xD9
 
-def validate_file_size(file: UploadFile) -> None:
-    """Validate file size"""
-    max_size = settings.max_file_size_mb * 1024 * 1024  # Convert MB to bytes
-    
-    # Get file size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > max_size:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
-        )
+# A structure walker yields how many bytes it wants next and is sent at most
+# that many, straight out of the incoming chunk. Yielding -n hands the last
+# n bytes back, to be sent again by the next request.
+Walker = Generator[int, bytes, None]
+
+
+def _webp_dimensions(header: bytes) -> tuple[int, int]:
+    chunk = header[12:16]
+    if chunk == b'VP8X':
+        return 1 + int.from_bytes(header[24:27], 'little'), 1 + int.from_bytes(header[27:30], 'little')
+    if chunk == b'VP8 ' and header[23:26] == b'\x9d\x01\x2a':
+        return int.from_bytes(header[26:28], 'little') & 0x3FFF, int.from_bytes(header[28:30], 'little') & 0x3FFF
+    if chunk == b'VP8L' and header[20:21] == b'\x2f':
+        bits = int.from_bytes(header[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    raise ValueError('Unrecognised WebP header')
+
+
+def _read(length: int) -> Generator[int, bytes, bytes]:
+  data = b''
+  while len(data) < length:
+    data += yield length - len(data)
+  return data
+
+
+def _skip(length: int, crc: int = 0) -> Generator[int, bytes, int]:
+  """Pass over length bytes without keeping them, returning their running CRC-32"""
+  while length > 0:
+    piece = yield length
+    crc = zlib.crc32(piece, crc)
+    length -= len(piece)
+  return crc
+
+
+def _jpeg_marker() -> Generator[int, bytes, int]:
+  if (yield from _read(1)) != b'\xff':
+    raise ValueError('Expected a JPEG marker')
+  while (marker := (yield from _read(1))[0]) == 0xFF:
+    pass  # fill bytes
+  return marker
+
+
+def _jpeg_scan() -> Generator[int, bytes, int]:
+  """Pass over entropy-coded data, returning the marker that ends it"""
+  after_ff = False
+  while True:
+    piece = yield 64 * 1024
+    index = 0
+    while True:
+      if not after_ff:
+        index = piece.find(b'\xff', index)
+        if index < 0:
+          break
+        index += 1
+      after_ff = False
+      if index == len(piece):
+        after_ff = True
+        break
+      marker = piece[index]
+      # Stuffed zero bytes, restart markers and fill bytes stay in the scan.
+      if marker == 0x00 or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+        after_ff = marker == 0xFF
+        index += 1
+        continue
+      if index + 1 < len(piece):
+        yield -(len(piece) - index - 1)
+      return marker
+
+
+def _walk_jpeg() -> Walker:
+  if (yield from _read(2)) != b'\xff\xd8':
+    raise ValueError('Missing JPEG start of image')
+  marker = yield from _jpeg_marker()
+  while marker != _JPEG_END_OF_IMAGE:
+    if marker not in _JPEG_STANDALONE:
+      length = int.from_bytes((yield from _read(2)), 'big')
+      if length < 2:
+        raise ValueError('Bad JPEG segment length')
+      yield from _skip(length - 2)
+      if marker == _JPEG_START_OF_SCAN:
+        marker = yield from _jpeg_scan()
+        continue
+    marker = yield from _jpeg_marker()
+
+
+def _walk_png() -> Walker:
+  if (yield from _read(8)) != PNG_SIGNATURE:
+    raise ValueError('Missing PNG signature')
+  kind = None
+  while kind != b'IEND':
+    header = yield from _read(8)
+    length, kind = int.from_bytes(header[:4], 'big'), header[4:]
+    if length >= 2 ** 31:
+      raise ValueError('Bad PNG chunk length')
+    crc = yield from _skip(length, zlib.crc32(kind))
+    if int.from_bytes((yield from _read(4)), 'big') != crc:
+      raise ValueError(f'PNG {kind!r} chunk fails its CRC')
+
+
+def _walk_webp() -> Walker:
+  header = yield from _read(12)
+  if header[:4] != b'RIFF' or header[8:] != b'WEBP':
+    raise ValueError('Missing WebP header')
+  remaining = int.from_bytes(header[4:8], 'little') - 4
+  if remaining <= 0:
+    raise ValueError('Empty WebP file')
+  while remaining > 0:
+    size = int.from_bytes((yield from _read(8))[4:], 'little')
+    padded = size + (size & 1)
+    remaining -= 8 + padded
+    if remaining < 0:
+      raise ValueError('WebP chunk runs past the RIFF size')
+    yield from _skip(padded)
+
+
+def _gif_sub_blocks() -> Walker:
+  while size := (yield from _read(1))[0]:
+    yield from _skip(size)
+
+
+def _walk_gif() -> Walker:
+  header = yield from _read(13)
+  if header[:6] not in (b'GIF87a', b'GIF89a'):
+    raise ValueError('Missing GIF header')
+  if header[10] & 0x80:
+    yield from _skip(3 << ((header[10] & 0x07) + 1))
+  while (block := (yield from _read(1))[0]) != 0x3B:
+    if block == 0x21:
+      yield from _skip(1)  # extension label
+    elif block == 0x2C:
+      descriptor = yield from _read(9)
+      if descriptor[8] & 0x80:
+        yield from _skip(3 << ((descriptor[8] & 0x07) + 1))
+      yield from _skip(1)  # LZW minimum code size
+    else:
+      raise ValueError(f'Unknown GIF block {block:#x}')
+    yield from _gif_sub_blocks()
+
+
+class StructureCheck:
+  """Walk an image's container structure as its bytes stream past.
+
+  JPEG segments and scans, PNG chunks (with their CRCs), WebP RIFF chunks and
+  GIF blocks are followed by their lengths, holding a few bytes at a time and
+  decoding no pixels. Data that ends before the end marker, or whose
+  structure doesn't add up, is rejected.
+  """
 
+  def __init__(self, lead: bytes) -> None:
+    if lead.startswith(b'\xff\xd8'):
+      self._walker = _walk_jpeg()
+    elif lead.startswith(PNG_SIGNATURE):
+      self._walker = _walk_png()
+    elif lead[:4] == b'RIFF' and lead[8:12] == b'WEBP':
+      self._walker = _walk_webp()
+    elif lead[:6] in (b'GIF87a', b'GIF89a'):
+      self._walker = _walk_gif()
+    else:
+      raise ValueError('Unrecognised image format')
+    self._wanted: Optional[int] = next(self._walker)
 
-def validate_image_integrity(file: UploadFile) -> None:
-    """Validate that the file is a valid image"""
+  @property
+  def complete(self) -> bool:
+    return self._wanted is None
+
+  def _send(self, piece: bytes) -> Optional[int]:
     try:
-        file.file.seek(0)
-        image_data = file.file.read()
-        file.file.seek(0)
-        
-        # Try to open with PIL
-        image = Image.open(io.BytesIO(image_data))
-        image.verify()  # Verify the image
-        
-        # Additional security check - ensure it's actually an image
-        if image.format not in ['JPEG', 'PNG', 'WEBP', 'GIF']:
+      return self._walker.send(piece)
+    except StopIteration:
+      return None
+
+  def feed(self, chunk: bytes) -> None:
+    position = 0
+    # Bytes after the end marker are ignored, as decoders do.
+    while self._wanted is not None and position < len(chunk):
+      piece = chunk[position:position + self._wanted]
+      position += len(piece)
+      self._wanted = self._send(piece)
+      while self._wanted is not None and self._wanted < 0:
+        position += self._wanted
+        self._wanted = self._send(b'')
+
+
+@dataclass
+class UploadInfo:
+    digest: str
+    size: int
+    content_type: str
+    format: str
+    width: int
+    height: int
+
+
+class StreamingValidator:
+    """Validate an upload from its chunks in a single pass.
+
+    Enforces the size cap, sniffs the magic header from the first bytes,
+    hashes everything with SHA-256 and parses the image header from a
+    bounded prefix. With verify, every chunk is also walked by a
+    StructureCheck, so a truncated or malformed body is rejected in the same
+    pass without buffering or decoding the file.
+    """
+
+    def __init__(self, max_size: int, verify: bool = True) -> None:
+        self.max_size = max_size
+        self._verify = verify
+        self._structure: Optional[StructureCheck] = None
+        self._lead = bytearray()
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._header = bytearray()
+        self._content_type: Optional[str] = None
+        self._image: Optional[tuple[str, int, int]] = None
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File too large. Maximum size: {settings.max_file_size_mb}MB"
+            )
+        self._digest.update(chunk)
+        if self._verify:
+            self._check_structure(chunk)
+
+        if self._image is None:
+            self._header.extend(chunk[:HEADER_LIMIT - len(self._header)])
+            if self._content_type is None and len(self._header) >= 1024:
+                self._check_type()
+            self._parse_header()
+
+    def _check_structure(self, chunk: bytes, final: bool = False) -> None:
+        try:
+            if self._structure is None:
+                # Wait for enough bytes to pick the format's walker.
+                self._lead.extend(chunk)
+                if len(self._lead) < MAGIC_LENGTH and not final:
+                    return
+                chunk, self._lead = bytes(self._lead), bytearray()
+                self._structure = StructureCheck(chunk)
+            self._structure.feed(chunk)
+        except ValueError:
+            self._corrupt()
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self._content_type
+
+    def _check_type(self) -> None:
+        self._content_type = magic.from_buffer(bytes(self._header[:2048]), mime=True)
+        if self._content_type not in settings.allowed_file_types:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid image format"
+                detail=f"File type {self._content_type} not allowed. Allowed types: {', '.join(settings.allowed_file_types)}"
             )
-            
-    except Exception as e:
+
+    def _parse_header(self, final: bool = False) -> None:
+        try:
+            header = bytes(self._header)
+            if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+                # Pillow's WebP plugin reads the whole file to open it.
+                self._image = ('WEBP', *_webp_dimensions(header))
+            else:
+                # Image.open only reads the header; pixel data is never decoded.
+                with Image.open(io.BytesIO(header)) as image:
+                    self._image = (image.format, image.width, image.height)
+        except Exception:
+            if final or len(self._header) >= HEADER_LIMIT:
+                self._corrupt()
+            return
+        if self._content_type is None:
+            self._check_type()
+        self._header = bytearray()
+
+    def _corrupt(self) -> None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or corrupted image file"
         )
 
+    def image(self) -> tuple[str, int, int]:
+        """Format and dimensions, once the allowed type and header are confirmed"""
+        if self._content_type is None:
+            self._check_type()
+        if self._image is None:
+            self._parse_header(final=True)
+
+        image_format, width, height = self._image
+        if image_format not in ALLOWED_IMAGE_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid image format"
+            )
+        if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Image dimensions too large"
+            )
+        return self._image
+
+    def finish(self) -> UploadInfo:
+        image_format, width, height = self.image()
+        if self._verify:
+            if self._structure is None:
+                self._check_structure(b'', final=True)
+            if not self._structure.complete:
+                # The data ended before the image did.
+                self._corrupt()
+        return UploadInfo(
+            digest=self._digest.hexdigest(),
+            size=self.size,
+            content_type=self._content_type,
+            format=image_format,
+            width=width,
+            height=height
+        )
+
+
+def validate_upload_stream(file: BinaryIO, chunk_size: int = 64 * 1024) -> UploadInfo:
+    """Read the upload exactly once, validating and hashing as it goes"""
+    validator = StreamingValidator(settings.max_file_size_mb * 1024 * 1024)
+    file.seek(0)
+    try:
+        while chunk := file.read(chunk_size):
+            validator.feed(chunk)
+        return validator.finish()
+    finally:
+        file.seek(0)
+
+
+def validate_image_header(header: bytes) -> tuple[str, str, int, int]:
+    """Content type, format and dimensions from the first bytes of a stored object"""
+    # Only a prefix of the object: check the header, not the image data.
+    validator = StreamingValidator(len(header), verify=False)
+    validator.feed(header)
+    image_format, width, height = validator.image()
+    return validator.content_type, image_format, width, height
 
-def validate_upload_file(file: UploadFile) -> None:
+
+def validate_upload_file(file: UploadFile) -> UploadInfo:
     """Comprehensive file validation"""
     if not file.filename:
         raise HTTPException(
@@ -86,7 +375,11 @@ def validate_upload_file(file: UploadFile) -> None:
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid filename"
         )
+
+    if not file.content_type:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File type could not be determined"
+        )
     
-    validate_file_size(file)
-    validate_file_type(file)
-    validate_image_integrity(file)
+    return validate_upload_stream(file.file)
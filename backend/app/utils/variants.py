@@ -0,0 +1,56 @@
+from typing import Any, Optional
+
+# Formats the derivative worker can emit, with their MIME types.
+VARIANT_CONTENT_TYPES = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+}
+
+
+def normalize_variants(variants: list[Any] | None) -> list[dict]:
+    """Convert stored variants to metadata dicts, upgrading legacy size labels"""
+    normalized = []
+    for variant in variants or []:
+        if isinstance(variant, dict):
+            normalized.append(variant)
+        elif str(variant).isdigit():
+            # Rows written before multi-format variants only stored '256', '1024', ...
+            normalized.append({'size': int(variant), 'format': 'jpeg'})
+    return normalized
+
+
+def parse_accept(accept: str | None) -> set[str]:
+    """Return the variant formats a client explicitly accepts.
+
+    JPEG is always acceptable. WebP and AVIF must be listed by name: legacy
+    smart-TV browsers send "*/*" but cannot decode them.
+    """
+    formats = {'jpeg'}
+    for part in (accept or '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        for fmt, content_type in VARIANT_CONTENT_TYPES.items():
+            if fmt != 'jpeg' and media_type.strip().lower() == content_type and quality > 0:
+                formats.add(fmt)
+    return formats
+
+
+def select_variant(variants: list[Any] | None, size: int, accept: str | None) -> Optional[dict]:
+    """Pick the smallest acceptable encoding of the closest size to the one requested"""
+    candidates = [v for v in normalize_variants(variants) if v.get('format') in parse_accept(accept)]
+    if not candidates:
+        return None
+
+    sizes = sorted({v['size'] for v in candidates})
+    # Prefer the smallest size that still covers the request, else the largest we have.
+    chosen_size = next((s for s in sizes if s >= size), sizes[-1])
+    same_size = [v for v in candidates if v['size'] == chosen_size]
+    return min(same_size, key=lambda v: v.get('bytes') or float('inf'))
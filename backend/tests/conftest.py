@@ -1,7 +1,14 @@
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.api.deps import get_db
 from app.main import app
 from app.config import get_settings
+from app.models.database import Base
 
 @pytest.fixture
 def client():
@@ -13,3 +20,23 @@ def client():
     
     with TestClient(app, base_url="http://localhost") as c:
         yield c
+
+
+@pytest.fixture
+def database(tmp_path):
+    """SQLite stand-in for Postgres, served to the app through get_db"""
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/app.db', poolclass=NullPool)
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def sqlite_db():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    asyncio.run(create_tables())
+    app.dependency_overrides[get_db] = sqlite_db
+    yield engine
+    app.dependency_overrides.pop(get_db, None)
+    asyncio.run(engine.dispose())
@@ -0,0 +1,120 @@
+import asyncio
+import io
+import uuid
+
+from PIL import Image
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.models.database import Base
+from app.models.entities import Blob, Photo, QueuedJob
+from app.queues.backfill import PhotoBackfillSink
+
+
+def _record(key):
+    return {
+        'storage_key': key,
+        'status': 'ready',
+        'exif': {'hasGps': False, 'cameraModel': 'EOS R5'},
+        'variants': [{'size': 256, 'format': 'jpeg', 'key': key.rsplit('.', 1)[0] + '/256.jpg'}],
+        'placeholder': 'data:image/webp;base64,AA=='
+    }
+
+
+def test_backfill_updates_existing_photos_and_imports_new_ones(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/backfill.db')
+        async with engine.begin() as conn:
+            await conn.run_sync(
+                Base.metadata.create_all, tables=[Photo.__table__, Blob.__table__, QueuedJob.__table__]
+            )
+        sink = PhotoBackfillSink(engine, storage=None)
+        async with sink.sessions() as db:
+            db.add(Blob(digest='ab' * 32, storage_key='blobs/ab/x.jpg', size_bytes=1, content_type='image/jpeg'))
+            for user_id in ('user-1', 'user-2'):
+                db.add(Photo(id=uuid.uuid4(), user_id=user_id, storage_key='blobs/ab/x.jpg', status='ready'))
+            await db.commit()
+
+        touched = await sink.save([_record('blobs/ab/x.jpg'), _record('imports/user-3/trip/1.jpg')], 'user-3')
+        async with sink.sessions() as db:
+            photos = (await db.execute(select(Photo).order_by(Photo.user_id))).scalars().all()
+            blob = await db.get(Blob, 'ab' * 32)
+            jobs = (await db.execute(select(QueuedJob))).scalars().all()
+        await sink.close()
+        return touched, photos, blob, jobs
+
+    touched, photos, blob, jobs = asyncio.run(scenario())
+    assert touched == 3
+    assert [photo.user_id for photo in photos] == ['user-1', 'user-2', 'user-3']
+    assert all(photo.exif['cameraModel'] == 'EOS R5' and len(photo.variants) == 1 for photo in photos)
+    assert [photo.status for photo in photos] == ['ready', 'ready', 'processing']
+    assert blob.placeholder == 'data:image/webp;base64,AA=='
+    [job] = jobs
+    assert job.photo_id == photos[2].id and job.priority == 20
+    assert job.payload['stages'] == ['geocode', 'caption']
+
+
+class MemoryStorage:
+    def __init__(self, keys=()):
+        self.keys = set(keys)
+
+    def head_object(self, key):
+        return object() if key in self.keys else None
+
+
+def _jpeg(color=None, quality=95):
+    image = Image.new('RGB', (64, 48), color) if color else (
+        Image.linear_gradient('L').rotate(90).resize((64, 48)).convert('RGB')
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def test_local_imports_are_content_addressed_and_deduplicated(tmp_path):
+    gradient = _jpeg()
+
+    async def scenario():
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/backfill.db')
+        async with engine.begin() as conn:
+            await conn.run_sync(
+                Base.metadata.create_all, tables=[Photo.__table__, Blob.__table__, QueuedJob.__table__]
+            )
+        sink = PhotoBackfillSink(engine, storage=MemoryStorage())
+        first = await sink.fingerprint('a.jpg', gradient)
+        await sink.save([{**_record(first['storage_key']), 'import': first['import']}], 'user-3')
+        async with sink.sessions() as db:
+            [photo] = (await db.execute(select(Photo))).scalars().all()
+            photo.status = 'ready'
+            photo.caption_ai = 'A gradient'
+            await db.commit()
+
+        # The same bytes again, a re-encode of them, and a different photo.
+        imports = [
+            await sink.fingerprint('copy.JPG', gradient),
+            await sink.fingerprint('b.jpg', _jpeg(quality=60)),
+            await sink.fingerprint('c.jpg', _jpeg('red'))
+        ]
+        records = [{**_record(f['storage_key']), 'import': f['import']} for f in imports]
+        await sink.save(records, 'user-3')
+        # A rerun of the same batch imports nothing twice.
+        await sink.save(records, 'user-3')
+        async with sink.sessions() as db:
+            photos = {photo.storage_key: photo for photo in (await db.execute(select(Photo))).scalars()}
+            blobs = (await db.execute(select(Blob))).scalars().all()
+            jobs = (await db.execute(select(QueuedJob))).scalars().all()
+        await sink.close()
+        return first, imports, photos, blobs, jobs
+
+    first, (again, near, other), photos, blobs, jobs = asyncio.run(scenario())
+    digest = first['import']['content_digest']
+    assert first['storage_key'] == f'blobs/{digest[:2]}/{digest}.jpg'
+    assert again['storage_key'] == first['storage_key']
+    assert set(photos) == {first['storage_key'], near['storage_key'], other['storage_key']}
+    assert all(photo.content_digest and photo.phash is not None for photo in photos.values())
+    assert sorted(blob.ref_count for blob in blobs) == [1, 1, 1]
+    # The re-encode links to the processed photo instead of being queued.
+    original, duplicate = photos[first['storage_key']], photos[near['storage_key']]
+    assert duplicate.duplicate_of == original.id and duplicate.caption_ai == 'A gradient'
+    assert {job.photo_id for job in jobs} == {original.id, photos[other['storage_key']].id}
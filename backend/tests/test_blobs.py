@@ -0,0 +1,67 @@
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models.database import Base
+from app.models.entities import Blob
+from app.services.blobs import acquire_blob, acquire_blobs, blob_key
+
+
+def test_acquire_blob_counts_references():
+    async def scenario():
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[Blob.__table__])
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            first, created_first = await acquire_blob(db, 'ab' * 32, 'jpg', 10, 'image/jpeg')
+            second, created_second = await acquire_blob(db, 'ab' * 32, 'jpeg', 10, 'image/jpeg')
+            await db.commit()
+        await engine.dispose()
+        return first, created_first, second, created_second
+
+    first, created_first, second, created_second = asyncio.run(scenario())
+    assert created_first and not created_second
+    assert second.ref_count == 2
+    assert second.storage_key == blob_key('ab' * 32, 'jpg')
+
+
+def test_acquire_blobs_batches_repeated_digests():
+    async def scenario():
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[Blob.__table__])
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            await acquire_blob(db, 'cd' * 32, 'png', 5, 'image/png')
+            acquired = await acquire_blobs(db, [
+                ('ab' * 32, 'jpg', 10, 'image/jpeg'),
+                ('cd' * 32, 'png', 5, 'image/png'),
+                ('ab' * 32, 'jpg', 10, 'image/jpeg'),
+            ])
+            await db.commit()
+        await engine.dispose()
+        return acquired
+
+    acquired = asyncio.run(scenario())
+    assert [created for _, created in acquired] == [True, False, False]
+    assert [blob.ref_count for blob, _ in acquired] == [2, 2, 2]
+
+
+def test_acquire_blobs_locks_in_digest_order():
+    async def scenario():
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[Blob.__table__])
+        statements = []
+        event.listen(
+            engine.sync_engine, 'before_cursor_execute',
+            lambda conn, cursor, statement, parameters, context, many: statements.append(parameters)
+        )
+        async with AsyncSession(engine) as db:
+            await acquire_blobs(db, [(digit * 64, 'jpg', 1, 'image/jpeg') for digit in 'fa3c'])
+        await engine.dispose()
+        return statements
+
+    [parameters] = asyncio.run(scenario())
+    digests = [value for value in parameters if isinstance(value, str) and len(value) == 64]
+    assert digests == sorted(digests) and len(digests) == 4
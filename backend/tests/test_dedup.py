@@ -0,0 +1,85 @@
+import asyncio
+import datetime as dt
+import io
+import random
+import uuid
+
+from PIL import Image, ImageDraw
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models.database import Base
+from app.models.entities import Photo
+from app.services.dedup import (
+    MultiIndexHash, PerceptualIndex, from_signed64, hamming, perceptual_hash, to_signed64
+)
+
+
+def _photo(size, fmt='JPEG'):
+    image = Image.new('RGB', (640, 480), 'navy')
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((100, 80, 400, 380), fill='orange')
+    draw.rectangle((420, 50, 600, 300), fill='white')
+    buffer = io.BytesIO()
+    image.resize(size).save(buffer, format=fmt)
+    buffer.seek(0)
+    return buffer
+
+
+def test_hash_survives_resize_and_reencode():
+    original = perceptual_hash(_photo((640, 480)))
+    assert hamming(original, perceptual_hash(_photo((320, 240), 'PNG'))) <= 4
+
+
+def test_signed_roundtrip():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed64(value)
+        assert -(1 << 63) <= signed < (1 << 63)
+        assert from_signed64(signed) == value
+
+
+def test_index_matches_brute_force():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    index = MultiIndexHash(max_distance=6)
+    for position, value in enumerate(hashes):
+        index.add(value, position)
+
+    probe = hashes[42] ^ 0b1011  # three bits away from an indexed hash
+    expected = sorted(
+        (hamming(probe, value), position) for position, value in enumerate(hashes) if hamming(probe, value) <= 6
+    )
+    assert sorted(index.search(probe, 6)) == expected
+    assert index.search(probe, 6)[0] == (3, 42)
+
+
+def test_index_picks_up_rows_committed_behind_the_watermark(tmp_path):
+    base = dt.datetime(2024, 1, 1, 12, 0)
+    rows = [
+        {'id': uuid.uuid4(), 'created_at': base, 'phash': 1},
+        # Created in a transaction that started earlier but committed after the first refresh.
+        {'id': uuid.uuid4(), 'created_at': base - dt.timedelta(seconds=30), 'phash': 3},
+        {'id': uuid.uuid4(), 'created_at': base + dt.timedelta(seconds=5), 'phash': 7},
+    ]
+
+    async def scenario():
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/dedup.db')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[Photo.__table__])
+        index = PerceptualIndex(max_distance=4, overlap_seconds=60)
+        sizes = []
+        for row in rows:
+            async with engine.begin() as conn:
+                await conn.execute(insert(Photo), [{
+                    **row, 'user_id': 'user-1', 'storage_key': f'{row["id"]}.jpg', 'status': 'ready'
+                }])
+            async with AsyncSession(engine) as db:
+                sizes.append((await index.refresh(db, 'user-1')).size)
+        async with AsyncSession(engine) as db:
+            final = await index.refresh(db, 'user-1')
+        await engine.dispose()
+        return sizes, final
+
+    sizes, final = asyncio.run(scenario())
+    assert sizes == [1, 2, 3] and final.size == 3
+    assert [item for _, item in final.search(1)] == [rows[0]['id'], rows[1]['id'], rows[2]['id']]
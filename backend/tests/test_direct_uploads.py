@@ -0,0 +1,183 @@
+import asyncio
+import datetime as dt
+import hashlib
+import io
+from pathlib import Path
+
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api import uploads as uploads_api
+from app.api.auth_deps import get_current_user
+from app.api.deps import get_storage
+from app.main import app
+from app.models.entities import Blob, Photo
+from app.services.storage import ObjectInfo, SignedUrl
+
+
+class FilesystemStorage:
+    """Local stand-in for the bucket; a presigned POST is simulated by writing the file"""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key):
+        return self.root / key
+
+    def create_upload_url(self, key, content_type):
+        return SignedUrl(
+            url=f'file://{self.root}',
+            expires_at=dt.datetime.utcnow() + dt.timedelta(hours=1),
+            fields={'key': key, 'Content-Type': content_type}
+        )
+
+    def create_download_url(self, key):
+        return SignedUrl(url=f'file://{self._path(key)}', expires_at=dt.datetime.utcnow())
+
+    def upload(self, signed, data):
+        path = self._path(signed['fields']['key'])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def put_object(self, key, body, content_type):
+        self._path(key).parent.mkdir(parents=True, exist_ok=True)
+        self._path(key).write_bytes(body.read())
+
+    def get_object(self, key):
+        return self._path(key).read_bytes()
+
+    def get_object_range(self, key, length):
+        with self._path(key).open('rb') as f:
+            return f.read(length)
+
+    def download_object(self, key, file):
+        file.write(self._path(key).read_bytes())
+
+    def copy_object(self, source, key):
+        self._path(key).parent.mkdir(parents=True, exist_ok=True)
+        self._path(key).write_bytes(self._path(source).read_bytes())
+
+    def delete_object(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def head_object(self, key):
+        path = self._path(key)
+        return ObjectInfo(size=path.stat().st_size, content_type=None) if path.exists() else None
+
+
+def _jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), 'teal').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def test_presigned_upload_and_finalize(client, database, tmp_path):
+    storage = FilesystemStorage(tmp_path / 'bucket')
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    app.dependency_overrides[get_storage] = lambda: storage
+    try:
+        image = _jpeg()
+        files = [
+            {'filename': 'a.jpg', 'size': len(image), 'contentType': 'image/jpeg'},
+            {'filename': 'b.jpg', 'size': len(image), 'contentType': 'image/jpeg'},
+            {'filename': 'c.jpg', 'size': 9, 'contentType': 'image/jpeg'},
+        ]
+        presigned = client.post('/api/uploads/direct', json={'files': files})
+        assert presigned.status_code == 200
+        uploads = presigned.json()['uploads']
+        assert all(upload['key'].startswith('incoming/user-1/') for upload in uploads)
+
+        storage.upload(uploads[0], image)
+        storage.upload(uploads[1], image[:-10])  # truncated transfer
+        storage.upload(uploads[2], b'not a jpg')
+        finalize = {'uploads': [
+            {'key': upload['key'], 'size': file['size']} for upload, file in zip(uploads, files)
+        ] + [{'key': 'incoming/user-2/x.jpg', 'size': 1}]}
+
+        first = client.post('/api/uploads/direct/finalize', json=finalize)
+        assert first.status_code == 202
+        body = first.json()
+        assert list(body['photos']) == [uploads[0]['key']]
+        assert set(body['rejected']) == {uploads[1]['key'], uploads[2]['key'], 'incoming/user-2/x.jpg'}
+        [job] = body['jobs']
+        assert job['type'] == 'process'
+        assert job['stages'] == ['exif', 'geocode', 'derivative', 'caption']
+
+        again = client.post('/api/uploads/direct/finalize', json=finalize).json()
+        assert again['photos'] == body['photos']
+        assert again['jobs'] == []
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        app.dependency_overrides.pop(get_storage, None)
+
+
+def _rows(database, model):
+    async def rows():
+        async with AsyncSession(database) as session:
+            return (await session.execute(select(model))).scalars().all()
+
+    return asyncio.run(rows())
+
+
+def test_direct_uploads_are_content_addressed(client, database, tmp_path):
+    storage = FilesystemStorage(tmp_path / 'bucket')
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    app.dependency_overrides[get_storage] = lambda: storage
+    try:
+        image = _jpeg()
+        files = [{'filename': name, 'size': len(image), 'contentType': 'image/jpeg'} for name in ('a.jpg', 'b.jpg')]
+        uploads = client.post('/api/uploads/direct', json={'files': files}).json()['uploads']
+        for upload in uploads:
+            storage.upload(upload, image)
+
+        body = client.post('/api/uploads/direct/finalize', json={'uploads': [
+            {'key': upload['key'], 'size': len(image)} for upload in uploads
+        ]}).json()
+
+        assert set(body['photos']) == {upload['key'] for upload in uploads}
+        [blob] = _rows(database, Blob)
+        assert blob.digest == hashlib.sha256(image).hexdigest() and blob.ref_count == 2
+        photos = _rows(database, Photo)
+        assert {photo.storage_key for photo in photos} == {blob.storage_key}
+        assert {photo.upload_key for photo in photos} == set(body['photos'])
+        # One copy of the bytes remains, under the blob's key.
+        assert storage.get_object(blob.storage_key) == image
+        assert all(storage.head_object(upload['key']) is None for upload in uploads)
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        app.dependency_overrides.pop(get_storage, None)
+
+
+def test_racing_finalize_keeps_the_first_photo(client, database, tmp_path, monkeypatch):
+    storage = FilesystemStorage(tmp_path / 'bucket')
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    app.dependency_overrides[get_storage] = lambda: storage
+    try:
+        image = _jpeg()
+        files = [{'filename': 'a.jpg', 'size': len(image), 'contentType': 'image/jpeg'}]
+        [upload] = client.post('/api/uploads/direct', json={'files': files}).json()['uploads']
+        storage.upload(upload, image)
+        finalize = {'uploads': [{'key': upload['key'], 'size': len(image)}]}
+        first = client.post('/api/uploads/direct/finalize', json=finalize).json()
+
+        # A second finalize that looked before the first committed: the object
+        # is still there and no photo was visible yet.
+        storage.upload(upload, image)
+        lookup = uploads_api._direct_upload_photos
+        calls = []
+
+        async def stale_lookup(db, user_id, keys):
+            calls.append(keys)
+            return {} if len(calls) == 1 else await lookup(db, user_id, keys)
+
+        monkeypatch.setattr(uploads_api, '_direct_upload_photos', stale_lookup)
+        second = client.post('/api/uploads/direct/finalize', json=finalize).json()
+
+        assert second['photos'] == first['photos'] and second['jobs'] == []
+        assert len(_rows(database, Photo)) == 1
+        [blob] = _rows(database, Blob)
+        assert blob.ref_count == 1
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        app.dependency_overrides.pop(get_storage, None)
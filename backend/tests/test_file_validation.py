@@ -0,0 +1,112 @@
+import hashlib
+import io
+import tracemalloc
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from app.utils.file_validation import StreamingValidator, validate_upload_stream
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _image(fmt, size=(1200, 900)):
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 60).convert('RGB').save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG', 'WEBP', 'GIF'])
+def test_single_pass_validates_and_hashes(fmt):
+    data = _image(fmt)
+    file = CountingFile(data)
+
+    info = validate_upload_stream(file, chunk_size=4096)
+
+    assert file.bytes_read == len(data)
+    assert file.tell() == 0
+    assert info.digest == hashlib.sha256(data).hexdigest()
+    assert info.size == len(data)
+    assert (info.format, info.width, info.height) == (fmt, 1200, 900)
+
+
+def test_rejects_oversized_stream_early():
+    validator = StreamingValidator(max_size=10)
+    with pytest.raises(HTTPException) as exc:
+        validator.feed(b'x' * 11)
+    assert exc.value.status_code == 413
+
+
+def test_rejects_non_images():
+    with pytest.raises(HTTPException) as exc:
+        validate_upload_stream(io.BytesIO(b'hello world ' * 200))
+    assert exc.value.status_code == 400
+
+
+def test_rejects_corrupt_header():
+    data = bytearray(_image('PNG'))
+    data[16:24] = b'\x00' * 8  # zero width/height in IHDR
+    with pytest.raises(HTTPException) as exc:
+        validate_upload_stream(io.BytesIO(bytes(data)))
+    assert exc.value.status_code == 400
+
+
+def test_accepts_files_smaller_than_the_sniff_window():
+    data = _image('WEBP', size=(40, 30))
+    assert len(data) < 1024
+    info = validate_upload_stream(io.BytesIO(data))
+    assert (info.content_type, info.width, info.height) == ('image/webp', 40, 30)
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG', 'WEBP', 'GIF'])
+def test_rejects_truncated_images(fmt):
+    data = _image(fmt)
+    with pytest.raises(HTTPException) as exc:
+        validate_upload_stream(io.BytesIO(data[:len(data) // 2]), chunk_size=4096)
+    assert exc.value.status_code == 400
+
+
+def test_rejects_corrupt_png_body():
+    data = bytearray(_image('PNG'))
+    data[len(data) // 2] ^= 0xFF  # inside the compressed pixel data
+    with pytest.raises(HTTPException) as exc:
+        validate_upload_stream(io.BytesIO(bytes(data)), chunk_size=4096)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize('options', [{}, {'progressive': True}, {'restart_marker_blocks': 1}])
+def test_walks_jpeg_scans_at_any_chunk_size(options):
+    buffer = io.BytesIO()
+    Image.effect_noise((300, 200), 60).convert('RGB').save(buffer, format='JPEG', **options)
+    data = buffer.getvalue()
+    for chunk_size in (1, 7, 4096):
+        assert validate_upload_stream(io.BytesIO(data), chunk_size=chunk_size).size == len(data)
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG'])
+def test_large_uploads_are_checked_in_bounded_memory(fmt):
+    data = _image(fmt, size=(3000, 2000))
+    chunk_size = 64 * 1024
+    assert len(data) > 40 * chunk_size
+    pillow_images = Image.core.get_stats()['new_count']
+
+    tracemalloc.start()
+    try:
+        validate_upload_stream(io.BytesIO(data), chunk_size=chunk_size)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # The chunk in flight and a few copies of the header prefix; no pixels.
+    assert peak < 6 * chunk_size
+    assert Image.core.get_stats()['new_count'] == pillow_images
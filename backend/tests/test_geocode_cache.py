@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.models.database import Base
+from app.models.entities import GeocodeCell
+from app.queues.geocode_cache import GeocodeCacheStore
+
+
+def test_cells_are_stored_including_places_not_found():
+    async def scenario():
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[GeocodeCell.__table__])
+        store = GeocodeCacheStore(engine)
+        missing = await store.get('nominatim:eycs0p8')
+        await store.put('nominatim:eycs0p8', {'label': None, 'country': None})
+        nowhere = await store.get('nominatim:eycs0p8')
+        await store.put('nominatim:eycs0p8', {'label': 'Lisbon, Portugal', 'country': 'Portugal'})
+        found = await store.get('nominatim:eycs0p8')
+        await engine.dispose()
+        return missing, nowhere, found
+
+    missing, nowhere, found = asyncio.run(scenario())
+    assert missing is None
+    assert nowhere['label'] is None
+    assert abs(nowhere['checked_at'] - time.time()) < 60
+    assert found['label'] == 'Lisbon, Portugal' and found['checked_at'] >= nowhere['checked_at']
@@ -0,0 +1,168 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models.database import Base
+from app.models.entities import DeadJob, QueuedJob
+from app.queues.events import Job, JobPriority, JobType
+from app.queues.jobs import JobQueue, enqueue_jobs, ensure_queue_capacity, prioritize_photos
+
+
+async def _queue_with_jobs(tmp_path, count):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/jobs.db')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[QueuedJob.__table__])
+    async with AsyncSession(engine) as db:
+        await enqueue_jobs(db, [
+            Job(type=JobType.CAPTION if i % 2 else JobType.EXIF, photo_id=str(uuid.uuid4()), sizes=[256])
+            for i in range(count)
+        ])
+        await db.commit()
+    return engine
+
+
+def test_claims_are_disjoint_batches(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 5)
+        first = JobQueue(engine, worker_id='a')
+        second = JobQueue(engine, worker_id='b')
+        batch_a = await first.claim(2)
+        batch_b = await second.claim(10)
+        nothing = await first.claim(10)
+        exif = await JobQueue(engine).claim(10, types=['exif'])
+        completed = [await first.complete(job) for job in batch_a]
+        await engine.dispose()
+        return batch_a, batch_b, nothing, exif, completed
+
+    batch_a, batch_b, nothing, exif, completed = asyncio.run(scenario())
+    assert len(batch_a) == 2 and len(batch_b) == 3 and nothing == [] and exif == []
+    assert not {job.id for job in batch_a} & {job.id for job in batch_b}
+    assert batch_a[0].payload == {'sizes': [256]} and batch_a[0].attempts == 1
+    assert completed == [True, True]
+
+
+def test_expired_lease_is_reclaimed_and_fenced(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 1)
+        [stale] = await JobQueue(engine, visibility_timeout=0, worker_id='a').claim(1)
+        [reclaimed] = await JobQueue(engine, worker_id='b').claim(1)
+        stale_done = await JobQueue(engine).complete(stale)
+        retried = await JobQueue(engine).retry(reclaimed, 0, 'timeout talking to geocoder')
+        [again] = await JobQueue(engine).claim(1)
+        await engine.dispose()
+        return stale, reclaimed, stale_done, retried, again
+
+    stale, reclaimed, stale_done, retried, again = asyncio.run(scenario())
+    assert reclaimed.id == stale.id and reclaimed.attempts == 2
+    assert not stale_done
+    assert retried
+    assert again.attempts == 3 and again.last_error == 'timeout talking to geocoder'
+
+
+def test_retry_can_narrow_the_stages(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 1)
+        queue = JobQueue(engine)
+        [job] = await queue.claim(1)
+        await queue.retry(job, 0, 'caption: TimeoutError', stages=['caption'])
+        [again] = await queue.claim(1)
+        await engine.dispose()
+        return again
+
+    again = asyncio.run(scenario())
+    assert again.payload == {'sizes': [256], 'stages': ['caption']}
+
+
+def test_wait_falls_back_to_polling_without_listen(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 0)
+        queue = JobQueue(engine, poll_interval=0.01)
+        await queue.listen()
+        await queue.wait()
+        await queue.close()
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_dead_letter_parks_the_job(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 1)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[DeadJob.__table__])
+        queue = JobQueue(engine)
+        [job] = await queue.claim(1)
+        parked = await queue.dead_letter(job, 'ValueError: cannot identify image')
+        remaining = await queue.claim(1)
+        async with AsyncSession(engine) as db:
+            dead = await db.get(DeadJob, job.id)
+        await engine.dispose()
+        return parked, remaining, dead
+
+    parked, remaining, dead = asyncio.run(scenario())
+    assert parked and remaining == []
+    assert dead.attempts == 1 and dead.last_error.startswith('ValueError')
+
+
+def _process_jobs(count):
+    return [Job(type=JobType.PROCESS, photo_id=str(uuid.uuid4())) for _ in range(count)]
+
+
+def test_small_upload_is_interleaved_with_a_bulk_import(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 0)
+        async with AsyncSession(engine) as db:
+            await enqueue_jobs(db, _process_jobs(20), 'bulk-user')
+            await enqueue_jobs(db, _process_jobs(2), 'other-user')
+            await db.commit()
+        claimed = await JobQueue(engine).claim(5)
+        await engine.dispose()
+        return claimed
+
+    claimed = asyncio.run(scenario())
+    # Ranks tie with the bulk import's, so the small upload is done within its first few jobs
+    assert [job.user_id for job in claimed].count('other-user') == 2
+
+
+def test_viewed_photos_jump_the_queue(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 0)
+        jobs = _process_jobs(10)
+        async with AsyncSession(engine) as db:
+            await enqueue_jobs(db, jobs, 'user-1')
+            bumped = await prioritize_photos(db, 'user-1', [uuid.UUID(jobs[-1]['photo_id'])])
+            ignored = await prioritize_photos(db, 'user-2', [uuid.UUID(jobs[0]['photo_id'])])
+            await db.commit()
+        [first] = await JobQueue(engine).claim(1)
+        await engine.dispose()
+        return jobs, bumped, ignored, first
+
+    jobs, bumped, ignored, first = asyncio.run(scenario())
+    assert bumped == 1 and ignored == 0
+    assert str(first.photo_id) == jobs[-1]['photo_id'] and first.priority == 0
+
+
+def test_admission_control_sheds_load(tmp_path):
+    async def scenario():
+        engine = await _queue_with_jobs(tmp_path, 0)
+        async with AsyncSession(engine) as db:
+            await enqueue_jobs(db, _process_jobs(3), 'user-1')
+            await enqueue_jobs(db, _process_jobs(2), 'user-2')
+            # A bulk import's backlog does not count against uploads.
+            await enqueue_jobs(db, _process_jobs(20), 'user-2', priority=JobPriority.BULK)
+            await ensure_queue_capacity(db, 'user-2', max_depth=10, max_user_depth=3)
+            errors = []
+            for user_id, max_depth in (('user-1', 10), ('user-2', 5)):
+                with pytest.raises(HTTPException) as rejected:
+                    await ensure_queue_capacity(db, user_id, max_depth=max_depth, max_user_depth=3)
+                errors.append(rejected.value)
+        await engine.dispose()
+        return errors
+
+    per_user, saturated = asyncio.run(scenario())
+    assert per_user.status_code == 429 and 'Retry-After' in per_user.headers
+    assert saturated.status_code == 503 and 'Retry-After' in saturated.headers
@@ -0,0 +1,30 @@
+import asyncio
+import time
+
+from app.services.offload import LoopLagMonitor, run_cpu_bound
+
+
+def test_monitor_records_blocking_and_not_offloaded_work():
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01, warn_after=10)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.2)  # blocks the loop
+        await asyncio.sleep(0.03)
+        blocked = monitor.blocked_seconds_total
+
+        await run_cpu_bound(time.sleep, 0.2)  # runs on the pool
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+        return blocked, monitor.blocked_seconds_total, monitor.lag_seconds_max
+
+    blocked, total, worst = asyncio.run(scenario())
+    assert blocked >= 0.15
+    assert total - blocked < 0.1
+    assert worst >= 0.15
+
+
+def test_metrics_endpoint(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'event_loop_blocked_seconds_total' in response.text
@@ -0,0 +1,119 @@
+import asyncio
+import datetime as dt
+import uuid
+
+from sqlalchemy import insert
+
+from app.api.auth_deps import get_current_user
+from app.main import app
+from app.models.entities import Photo
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def _add_photos(engine, user_id, created):
+    rows = [{
+        'id': uuid.uuid4(),
+        'user_id': user_id,
+        'storage_key': f'{user_id}/{index}.jpg',
+        'variants': [],
+        'exif': {'hasGps': False},
+        'status': 'ready',
+        'created_at': created_at
+    } for index, created_at in enumerate(created)]
+
+    async def add():
+        async with engine.begin() as conn:
+            await conn.execute(insert(Photo), rows)
+
+    asyncio.run(add())
+    return rows
+
+
+def _pages(client, **params):
+    pages, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/photos/', params=query)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return pages
+
+
+def test_cursor_round_trip():
+    created_at = dt.datetime(2024, 5, 1, 12, 30, tzinfo=dt.timezone.utc)
+    photo_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(created_at, photo_id)) == (created_at, photo_id)
+
+
+def test_keyset_pages_cover_every_photo_once(client, database):
+    base = dt.datetime(2024, 1, 1)
+    # Ties on created_at are broken by id, so none are skipped or repeated.
+    created = [base + dt.timedelta(minutes=index // 3) for index in range(25)]
+    rows = _add_photos(database, 'user-1', created)
+    _add_photos(database, 'user-2', created[:5])
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    try:
+        pages = _pages(client, limit=10)
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    listed = [photo['id'] for page in pages for photo in page]
+    expected = sorted(rows, key=lambda row: (row['created_at'], row['id']), reverse=True)
+    assert listed == [str(row['id']) for row in expected]
+
+
+def test_total_count_only_when_asked(client, database):
+    _add_photos(database, 'user-1', [dt.datetime(2024, 1, 1, hour) for hour in range(3)])
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    try:
+        plain = client.get('/api/photos/', params={'limit': 2})
+        counted = client.get('/api/photos/', params={'limit': 2, 'count': 'true'})
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert 'X-Total-Count' not in plain.headers
+    assert counted.headers['X-Total-Count'] == '3'
+    assert counted.headers['X-Next-Cursor']
+
+
+def test_invalid_cursor_and_limit_are_rejected(client, database):
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    try:
+        assert client.get('/api/photos/', params={'cursor': 'not-a-cursor'}).status_code == 400
+        assert client.get('/api/photos/', params={'limit': 0}).status_code == 422
+        assert client.get('/api/photos/', params={'limit': 10_000}).status_code == 422
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+
+def test_list_is_compact_by_default(client, database):
+    [row] = _add_photos(database, 'user-1', [dt.datetime(2024, 1, 1)])
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    try:
+        [photo] = client.get('/api/photos/').json()
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert photo == {
+        'id': str(row['id']),
+        'thumbnail': f'/api/photos/{row["id"]}/variants/256',
+        'status': 'ready',
+        'placeholder': None
+    }
+
+
+def test_sparse_fieldsets(client, database):
+    _add_photos(database, 'user-1', [dt.datetime(2024, 1, 1)])
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    try:
+        [photo] = client.get('/api/photos/', params={'fields': 'status,exif,createdAt'}).json()
+        unknown = client.get('/api/photos/', params={'fields': 'status,password'})
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert set(photo) == {'id', 'status', 'exif', 'createdAt'}
+    assert photo['exif'] == {'hasGps': False}
+    assert unknown.status_code == 400
@@ -0,0 +1,47 @@
+import asyncio
+import uuid
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models.database import Base
+from app.models.entities import Blob, Photo, QueuedJob
+from app.queues.pipeline import load_photo_task, save_photo_record
+
+
+def test_record_updates_photo_and_blob():
+    async def scenario():
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[Photo.__table__, Blob.__table__])
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            photo_id = uuid.uuid4()
+            db.add(Blob(digest='ab' * 32, storage_key='blobs/ab/x.jpg', size_bytes=1, content_type='image/jpeg'))
+            db.add(Photo(
+                id=photo_id, user_id='user-1', storage_key='blobs/ab/x.jpg', content_digest='ab' * 32,
+                exif={'hasGps': True, 'lat': 1.0, 'lon': 2.0},
+                location_override={'type': 'label', 'label': 'Home', 'source': 'user'},
+                place_display={'label': 'Home'}
+            ))
+            await db.commit()
+
+            job = QueuedJob(photo_id=photo_id, type='process', payload={'stages': ['geocode', 'caption'], 'sizes': [256]})
+            task = await load_photo_task(db, job)
+            photo = await save_photo_record(db, str(photo_id), {
+                'status': 'ready',
+                'variants': [{'size': 256, 'format': 'jpeg', 'key': 'blobs/ab/x/256.jpg'}],
+                'placeholder': 'data:image/webp;base64,AA==',
+                'place': {'label': 'Lisbon', 'country': 'Portugal'},
+                'caption': 'x' * 300,
+                'errors': {}
+            })
+            await db.commit()
+            blob = await db.get(Blob, 'ab' * 32, populate_existing=True)
+        await engine.dispose()
+        return task, photo, blob
+
+    task, photo, blob = asyncio.run(scenario())
+    assert task['stages'] == ['geocode', 'caption']
+    assert task['known'] == {'exif': {'hasGps': True, 'lat': 1.0, 'lon': 2.0}}
+    assert photo.status == 'ready' and len(photo.caption_ai) == 240
+    assert photo.place_auto['label'] == 'Lisbon' and photo.place_display == {'label': 'Home'}
+    assert blob.variants[0]['key'] == 'blobs/ab/x/256.jpg' and blob.placeholder.startswith('data:')
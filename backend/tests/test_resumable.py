@@ -0,0 +1,184 @@
+import asyncio
+import io
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.auth_deps import get_current_user
+from app.api.deps import get_storage, get_upload_store
+from app.main import app
+from app.models.entities import Photo
+from app.services.resumable import ResumableUploadStore
+
+
+def test_interrupted_upload_resumes_from_persisted_offset(tmp_path):
+    store = ResumableUploadStore(tmp_path, ttl_seconds=60)
+    payload = os.urandom(300_000)
+    upload = store.create('user-1', 'photo.jpg', 'image/jpeg', len(payload))
+
+    async def dropped_connection():
+        yield payload[:100_000]
+        yield payload[100_000:150_000]
+        raise ConnectionResetError()
+
+    async def rest():
+        yield payload[150_000:]
+
+    async def scenario():
+        with pytest.raises(ConnectionResetError):
+            await store.append(upload, 0, dropped_connection())
+        resumed = store.get(upload.id, 'user-1')
+        assert resumed.offset == 150_000
+
+        with pytest.raises(HTTPException) as conflict:
+            await store.append(resumed, 0, rest())
+        assert conflict.value.status_code == 409
+        assert conflict.value.headers['Upload-Offset'] == '150000'
+
+        return await store.append(resumed, resumed.offset, rest())
+
+    assert asyncio.run(scenario()) == len(payload)
+    with store.open(store.get(upload.id, 'user-1')) as staged:
+        assert staged.read() == payload
+    assert store.get(upload.id, 'someone-else') is None
+
+
+def test_append_rejects_bytes_past_declared_length(tmp_path):
+    store = ResumableUploadStore(tmp_path, ttl_seconds=60)
+    upload = store.create('user-1', 'photo.jpg', 'image/jpeg', 10)
+
+    async def too_much():
+        yield b'x' * 11
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(store.append(upload, 0, too_much()))
+    assert error.value.status_code == 413
+
+
+def test_reaper_removes_stale_uploads(tmp_path):
+    store = ResumableUploadStore(tmp_path, ttl_seconds=60)
+    stale = store.create('user-1', 'old.jpg', 'image/jpeg', 10)
+    fresh = store.create('user-1', 'new.jpg', 'image/jpeg', 10)
+    past = time.time() - 3600
+    for suffix in ('part', 'json'):
+        os.utime(tmp_path / f'{stale.id}.{suffix}', (past, past))
+
+    assert store.reap() == 1
+    assert store.get(stale.id, 'user-1') is None
+    assert store.get(fresh.id, 'user-1') is not None
+
+
+def test_resumable_upload_api(client, database, tmp_path):
+    store = ResumableUploadStore(tmp_path, ttl_seconds=60)
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    app.dependency_overrides[get_upload_store] = lambda: store
+    try:
+        payload = os.urandom(5000)
+        created = client.post('/api/uploads/', json={
+            'filename': 'photo.jpg', 'size': len(payload), 'contentType': 'image/jpeg'
+        })
+        assert created.status_code == 201
+        location = created.headers['Location']
+
+        first = client.patch(location, content=payload[:2000], headers={'Upload-Offset': '0'})
+        assert first.status_code == 204
+        assert first.headers['Upload-Offset'] == '2000'
+
+        head = client.head(location)
+        assert head.headers['Upload-Offset'] == '2000'
+        assert head.headers['Upload-Length'] == '5000'
+
+        stale = client.patch(location, content=payload[:2000], headers={'Upload-Offset': '0'})
+        assert stale.status_code == 409
+
+        rest = client.patch(location, content=payload[2000:], headers={'Upload-Offset': '2000'})
+        assert rest.headers['Upload-Offset'] == '5000'
+
+        assert client.delete(location).status_code == 204
+        assert client.head(location).status_code == 404
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        app.dependency_overrides.pop(get_upload_store, None)
+
+
+class MemoryStorage:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, key, body, content_type):
+        self.objects[key] = body.read()
+
+
+def test_finalize_is_idempotent(client, database, tmp_path):
+    store = ResumableUploadStore(tmp_path / 'staging', ttl_seconds=60)
+    storage = MemoryStorage()
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    app.dependency_overrides[get_upload_store] = lambda: store
+    app.dependency_overrides[get_storage] = lambda: storage
+    try:
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), 'teal').save(buffer, format='JPEG')
+        payload = buffer.getvalue()
+        created = client.post('/api/uploads/', json={
+            'filename': 'photo.jpg', 'size': len(payload), 'contentType': 'image/jpeg'
+        })
+        location = created.headers['Location']
+
+        client.patch(location, content=payload[:100], headers={'Upload-Offset': '0'})
+        incomplete = client.post(f'{location}/finalize')
+        assert incomplete.status_code == 409
+        assert incomplete.headers['Upload-Offset'] == '100'
+
+        client.patch(location, content=payload[100:], headers={'Upload-Offset': '100'})
+        first = client.post(f'{location}/finalize')
+        assert first.status_code == 202
+        assert len(first.json()['photos']) == 1
+
+        # The staged bytes are gone, but a retry gets the same photo back
+        upload_id = location.rsplit('/', 1)[-1]
+        assert not (tmp_path / 'staging' / f'{upload_id}.part').exists()
+        retried = client.post(f'{location}/finalize')
+        assert retried.status_code == 202
+        assert retried.json() == first.json()
+        assert client.head(location).headers['Upload-Offset'] == str(len(payload))
+
+        late = client.patch(location, content=b'x', headers={'Upload-Offset': str(len(payload))})
+        assert late.status_code == 409
+
+        async def count_photos():
+            async with AsyncSession(database) as session:
+                return await session.scalar(select(func.count()).select_from(Photo))
+
+        assert asyncio.run(count_photos()) == 1
+        assert list(storage.objects.values()) == [payload]
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        app.dependency_overrides.pop(get_upload_store, None)
+        app.dependency_overrides.pop(get_storage, None)
+
+
+def test_concurrent_finalizes_wait_for_each_other(tmp_path):
+    store = ResumableUploadStore(tmp_path, ttl_seconds=60)
+    upload = store.create('user-1', 'photo.jpg', 'image/jpeg', 0)
+    ingested = []
+
+    async def finalize():
+        async with store.lock(upload.id):
+            current = store.get(upload.id, 'user-1')
+            if current.result is not None:
+                return current.result
+            await asyncio.sleep(0.01)
+            ingested.append(upload.id)
+            store.complete(current, {'photos': ['photo-1']})
+            return current.result
+
+    async def scenario():
+        return await asyncio.gather(finalize(), finalize())
+
+    assert asyncio.run(scenario()) == [{'photos': ['photo-1']}] * 2
+    assert ingested == [upload.id]
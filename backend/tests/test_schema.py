@@ -0,0 +1,20 @@
+import re
+from pathlib import Path
+
+from app.models.database import Base
+import app.models.entities  # noqa: F401 (registers the tables)
+
+SCHEMA = Path(__file__).resolve().parents[2] / 'db_schema.sql'
+
+
+def _schema_columns():
+    tables = {}
+    for name, body in re.findall(r'CREATE TABLE IF NOT EXISTS (\w+) \((.*?)\n\);', SCHEMA.read_text(), re.S):
+        tables[name] = {line.split()[0] for line in body.strip().splitlines() if line.strip()}
+    return tables
+
+
+def test_models_match_the_schema_file():
+    schema = _schema_columns()
+    for table in Base.metadata.sorted_tables:
+        assert {column.name for column in table.columns} == schema[table.name], table.name
@@ -0,0 +1,103 @@
+import asyncio
+import io
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from PIL import Image
+from sqlalchemy import insert
+
+from app.api.auth_deps import get_current_user
+from app.api.deps import get_storage, get_variant_cache
+from app.main import app
+from app.models.entities import Photo
+from app.services.sprites import SPRITE_CELL, pack_sprite, sprite_fingerprint, sprite_tiles
+from app.services.variant_cache import VariantCache
+
+Row = namedtuple('Row', 'id content_digest updated_at')
+
+
+def _thumb(size, color):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def test_tiles_and_sheet_line_up():
+    rows = [Row(f'photo-{i}', None, None) for i in range(12)]
+    thumbnails = [_thumb((256, 192), 'red') if i % 2 else _thumb((144, 256), 'blue') for i in range(12)]
+
+    tiles = sprite_tiles(rows, thumbnails)
+    assert tiles[1] == {'id': 'photo-1', 'x': SPRITE_CELL, 'y': 0, 'width': 256, 'height': 192}
+    assert tiles[10] == {'id': 'photo-10', 'x': 0, 'y': SPRITE_CELL, 'width': 144, 'height': 256}
+
+    sheet = Image.open(io.BytesIO(pack_sprite(tiles, thumbnails)))
+    assert sheet.size == (10 * SPRITE_CELL, 2 * SPRITE_CELL)
+    red = sheet.getpixel((SPRITE_CELL + 100, 100))
+    assert red[0] > 200 and red[2] < 60
+
+
+def test_fingerprint_tracks_page_contents():
+    rows = [Row(f'photo-{i}', 'abc', datetime(2024, 1, 1)) for i in range(3)]
+    edited = rows[:2] + [Row('photo-2', 'abc', datetime(2024, 1, 2))]
+    assert sprite_fingerprint(rows) == sprite_fingerprint(list(rows))
+    assert sprite_fingerprint(rows) != sprite_fingerprint(edited)
+
+
+class MemoryStorage:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get_object(self, key):
+        return self.objects[key]
+
+
+def test_sprite_pages_match_list_pages(client, database, tmp_path):
+    base = datetime(2024, 1, 1)
+    rows = [{
+        'id': uuid.uuid4(),
+        'user_id': 'user-1',
+        'storage_key': f'user-1/{index}.jpg',
+        'variants': [],
+        'status': 'ready',
+        'created_at': base + timedelta(minutes=index)
+    } for index in range(12)]
+
+    async def add():
+        async with database.begin() as conn:
+            await conn.execute(insert(Photo), rows)
+
+    asyncio.run(add())
+    storage = MemoryStorage({row['storage_key']: _thumb((400, 300), 'green') for row in rows})
+    app.dependency_overrides[get_current_user] = lambda: 'user-1'
+    app.dependency_overrides[get_storage] = lambda: storage
+    cache = VariantCache(tmp_path / 'cache', 10 * 1024 * 1024)
+    app.dependency_overrides[get_variant_cache] = lambda: cache
+    try:
+        pages, cursor = [], None
+        while True:
+            params = {'limit': 5, **({'cursor': cursor} if cursor else {})}
+            listed = client.get('/api/photos/', params=params)
+            manifest = client.get('/api/photos/sprites', params=params).json()
+            pages.append(([photo['id'] for photo in listed.json()], manifest))
+            cursor = listed.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        sheet = client.get(pages[1][1]['image'], headers={'Accept': 'image/jpeg'})
+        # The thumbnails and the served sheet were all released.
+        assert not cache._readers
+        stale = client.get(
+            pages[1][1]['image'].replace(pages[1][1]['version'], 'outdated'), follow_redirects=False
+        )
+    finally:
+        for dependency in (get_current_user, get_storage, get_variant_cache):
+            app.dependency_overrides.pop(dependency, None)
+
+    assert [len(ids) for ids, _ in pages] == [5, 5, 2]
+    for ids, manifest in pages:
+        assert [tile['id'] for tile in manifest['tiles']] == ids
+    assert pages[0][0][0] == str(rows[-1]['id'])
+    manifest = pages[1][1]
+    assert Image.open(io.BytesIO(sheet.content)).size == (manifest['width'], manifest['height'])
+    assert (manifest['width'], manifest['height']) == (5 * SPRITE_CELL, SPRITE_CELL)
+    assert stale.status_code == 307 and stale.headers['location'] == manifest['image']
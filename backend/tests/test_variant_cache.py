@@ -0,0 +1,88 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from app.services.variant_cache import VariantCache, render_variant
+
+
+def test_concurrent_misses_render_once(tmp_path):
+    cache = VariantCache(tmp_path, max_bytes=1024)
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b'x' * 10
+
+    async def scenario():
+        return await asyncio.gather(*(cache.acquire('a-256.jpeg', render) for _ in range(5)))
+
+    paths = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert {p.read_bytes() for p in paths} == {b'x' * 10}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = VariantCache(tmp_path, max_bytes=25)
+
+    def payload(data):
+        async def render():
+            return data
+        return render
+
+    async def get(key, data):
+        async with cache.open(key, payload(data)):
+            pass
+
+    async def scenario():
+        await get('a', b'a' * 10)
+        await get('b', b'b' * 10)
+        await get('a', b'!')  # hit, a becomes most recent
+        await get('c', b'c' * 10)
+
+    asyncio.run(scenario())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['a', 'c']
+    assert cache.size_bytes == 20
+    assert VariantCache(tmp_path, max_bytes=25).size_bytes == 20
+
+
+def test_evicted_entry_stays_readable_until_released(tmp_path):
+    cache = VariantCache(tmp_path, max_bytes=15)
+
+    def payload(data):
+        async def render():
+            return data
+        return render
+
+    async def scenario():
+        held = await cache.acquire('a', payload(b'a' * 10))
+        async with cache.open('b', payload(b'b' * 10)) as path:
+            # b pushed a out of the LRU, but a is still being served.
+            assert path.read_bytes() == b'b' * 10
+        assert held.read_bytes() == b'a' * 10
+        assert cache.size_bytes == 10
+        cache.release('a')
+        assert not held.exists()
+
+        # Rendered again while an evicted copy was still held: the last
+        # release of the old reader must not delete the new file.
+        await cache.acquire('c', payload(b'c' * 10))
+        await cache.acquire('d', payload(b'd' * 10))
+        again = await cache.acquire('c', payload(b'C' * 10))
+        cache.release('c')
+        assert again.read_bytes() == b'C' * 10
+        cache.release('c')
+        cache.release('d')
+
+    asyncio.run(scenario())
+    assert [p.name for p in tmp_path.iterdir()] == ['c']
+    assert (tmp_path / 'c').read_bytes() == b'C' * 10 and cache.size_bytes == 10
+
+
+def test_render_variant_fits_size():
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), 'red').save(buffer, format='JPEG')
+    rendered = Image.open(io.BytesIO(render_variant(buffer.getvalue(), 256, 'webp')))
+    assert rendered.format == 'WEBP'
+    assert rendered.size == (256, 192)
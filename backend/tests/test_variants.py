@@ -0,0 +1,33 @@
+from app.utils.variants import normalize_variants, parse_accept, select_variant
+
+VARIANTS = [
+    {'size': 256, 'format': 'jpeg', 'bytes': 9000},
+    {'size': 256, 'format': 'webp', 'bytes': 6000},
+    {'size': 256, 'format': 'avif', 'bytes': 4000},
+    {'size': 1024, 'format': 'jpeg', 'bytes': 90000},
+    {'size': 1024, 'format': 'webp', 'bytes': 60000},
+]
+
+
+def test_wildcard_only_allows_jpeg():
+    assert parse_accept('*/*') == {'jpeg'}
+    assert parse_accept('image/avif,image/webp,image/*;q=0.8') == {'jpeg', 'webp', 'avif'}
+    assert parse_accept('image/webp;q=0') == {'jpeg'}
+
+
+def test_select_smallest_acceptable_format():
+    assert select_variant(VARIANTS, 256, 'image/avif,image/webp,*/*')['format'] == 'avif'
+    assert select_variant(VARIANTS, 256, 'image/webp,*/*')['format'] == 'webp'
+    assert select_variant(VARIANTS, 256, None)['format'] == 'jpeg'
+
+
+def test_select_closest_size():
+    assert select_variant(VARIANTS, 512, 'image/webp')['size'] == 1024
+    assert select_variant(VARIANTS, 4096, 'image/webp')['size'] == 1024
+
+
+def test_legacy_size_labels():
+    assert normalize_variants(['256', '1024']) == [
+        {'size': 256, 'format': 'jpeg'},
+        {'size': 1024, 'format': 'jpeg'},
+    ]
@@ -2,7 +2,9 @@ CREATE TABLE IF NOT EXISTS photos (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   user_id TEXT NOT NULL,
   storage_key TEXT NOT NULL,
+  upload_key TEXT,
   variants JSONB NOT NULL DEFAULT '[]'::jsonb,
+  placeholder TEXT,
   caption_ai TEXT,
   note_user TEXT,
   exif JSONB NOT NULL DEFAULT '{}'::jsonb,
@@ -10,10 +12,58 @@ CREATE TABLE IF NOT EXISTS photos (
   place_display JSONB,
   location_override JSONB,
   status TEXT NOT NULL DEFAULT 'processing',
+  content_digest TEXT,
+  phash BIGINT,
+  duplicate_of UUID,
   created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+CREATE TABLE IF NOT EXISTS blobs (
+  digest TEXT PRIMARY KEY,
+  storage_key TEXT NOT NULL UNIQUE,
+  size_bytes BIGINT NOT NULL,
+  content_type TEXT NOT NULL,
+  ref_count INTEGER NOT NULL DEFAULT 1,
+  variants JSONB,
+  placeholder TEXT,
+  exif JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  type TEXT NOT NULL,
+  photo_id UUID,
+  user_id TEXT,
+  payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+  priority INTEGER NOT NULL DEFAULT 10,
+  fair_rank BIGINT NOT NULL DEFAULT 0,
+  available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  claimed_by TEXT,
+  last_error TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS dead_jobs (
+  id UUID PRIMARY KEY,
+  type TEXT NOT NULL,
+  photo_id UUID,
+  payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+  attempts INTEGER NOT NULL,
+  last_error TEXT,
+  created_at TIMESTAMPTZ NOT NULL,
+  failed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS geocode_cache (
+  cell TEXT PRIMARY KEY,
+  label TEXT,
+  country TEXT,
+  checked_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
 CREATE TABLE IF NOT EXISTS user_settings (
   user_id TEXT PRIMARY KEY,
   detail_only BOOLEAN DEFAULT FALSE,
@@ -21,4 +71,21 @@ CREATE TABLE IF NOT EXISTS user_settings (
   updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_photos_user_id ON photos (user_id);
+-- Upgrades for databases created from an earlier version of this file
+ALTER TABLE photos ADD COLUMN IF NOT EXISTS upload_key TEXT;
+
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'geocode_cache' AND column_name = 'created_at'
+  ) THEN
+    ALTER TABLE geocode_cache RENAME COLUMN created_at TO checked_at;
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_photos_user_created ON photos (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_photos_content_digest ON photos (content_digest);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_photos_user_upload_key ON photos (user_id, upload_key);
+CREATE INDEX IF NOT EXISTS idx_jobs_schedule ON jobs (priority, fair_rank);
+CREATE INDEX IF NOT EXISTS idx_jobs_user_rank ON jobs (user_id, fair_rank);
@@ -1,4 +1,4 @@
-import { PhotoMetadata, UserSettings } from './types';
+import { PhotoMetadata, PhotoSummary, SpriteManifest, UserSettings } from './types';
 
 const API_BASE = import.meta.env.VITE_API_BASE ?? '/api';
 
@@ -14,7 +14,7 @@ function setAuthToken(token: string | null) {
   }
 }
 
-async function request<T>(path: string, init?: RequestInit): Promise<T> {
+async function send(path: string, init?: RequestInit): Promise<Response> {
   const headers: Record<string, string> = {
     'Content-Type': 'application/json',
     ...(init?.headers as Record<string, string> ?? {})
@@ -41,9 +41,23 @@ async function request<T>(path: string, init?: RequestInit): Promise<T> {
     throw new Error(message || `Request failed: ${res.status}`);
   }
 
+  return res;
+}
+
+async function request<T>(path: string, init?: RequestInit): Promise<T> {
+  const res = await send(path, init);
   return (await res.json()) as T;
 }
 
+// Fields of each listed photo the grid and slideshow render.
+const LIST_FIELDS = 'id,status,placeholder,captionAi,placeDisplay';
+
+export type PhotoPage = {
+  photos: PhotoSummary[];
+  // Cursor for the following page; null on the last one.
+  next: string | null;
+};
+
 export const apiClient = {
   // Authentication
   login: async (username: string, password: string) => {
@@ -86,7 +100,20 @@ export const apiClient = {
   getCurrentUser: () => request<{ user_id: string }>('/auth/me'),
   
   // Photo operations
-  listPhotos: () => request<PhotoMetadata[]>('/photos'),
+  listPhotos: async (cursor?: string): Promise<PhotoPage> => {
+    const query = new URLSearchParams({ fields: LIST_FIELDS });
+    if (cursor) query.set('cursor', cursor);
+    const res = await send(`/photos/?${query}`);
+    return { photos: (await res.json()) as PhotoSummary[], next: res.headers.get('X-Next-Cursor') };
+  },
+  // The sprite sheet for the list page at cursor, as an object URL the grid can draw from.
+  getSprites: async (cursor?: string): Promise<{ manifest: SpriteManifest; url: string }> => {
+    const query = new URLSearchParams();
+    if (cursor) query.set('cursor', cursor);
+    const manifest = await request<SpriteManifest>(`/photos/sprites?${query}`);
+    const sheet = await send(`/photos/sprites/${manifest.version}?${query}`);
+    return { manifest, url: URL.createObjectURL(await sheet.blob()) };
+  },
   getPhoto: (id: string) => request<PhotoMetadata>(`/photos/${id}`),
   updateNote: (id: string, note: string) =>
     request<PhotoMetadata>(`/photos/${id}/note`, {
@@ -1,5 +1,5 @@
 import { Link } from 'preact-router/match';
-import { PhotoMetadata } from '../types';
+import { PhotoSummary, SpriteCell } from '../types';
 
 const statusStyles: Record<string, string> = {
   processing: 'bg-yellow-500/20 text-yellow-200',
@@ -7,7 +7,20 @@ const statusStyles: Record<string, string> = {
   ready: 'bg-emerald-500/20 text-emerald-200'
 };
 
-export const PhotoGrid = ({ photos }: { photos: PhotoMetadata[] }) => (
+// The photo's cell of its page's sprite sheet, cropped to fill the square like object-cover.
+const SpriteThumb = ({ cell, alt }: { cell: SpriteCell; alt: string }) => (
+  <svg
+    viewBox={`${cell.x} ${cell.y} ${cell.width} ${cell.height}`}
+    preserveAspectRatio="xMidYMid slice"
+    role="img"
+    aria-label={alt}
+    class="h-full w-full transition duration-300 group-hover:scale-105"
+  >
+    <image href={cell.url} width={cell.sheetWidth} height={cell.sheetHeight} />
+  </svg>
+);
+
+export const PhotoGrid = ({ photos, sprites = {} }: { photos: PhotoSummary[]; sprites?: Record<string, SpriteCell> }) => (
   <section
     aria-label="Photo gallery"
     class="grid flex-1 grid-cols-2 gap-3 md:grid-cols-4 lg:grid-cols-5"
@@ -23,15 +36,22 @@ export const PhotoGrid = ({ photos }: { photos: PhotoMetadata[] }) => (
           class="group relative block overflow-hidden rounded-lg bg-gray-800"
           data-testid="photo-thumb"
         >
-          <div class="aspect-square bg-gray-900">
-            <img
-              loading="lazy"
-              src={`/media/${photo.id}/256`}
-              srcset={`/media/${photo.id}/256 256w, /media/${photo.id}/1024 1024w`}
-              sizes="(min-width: 1024px) 20vw, (min-width: 768px) 25vw, 45vw"
-              alt={photo.captionAi ?? 'Photo thumbnail'}
-              class="h-full w-full object-cover transition duration-300 group-hover:scale-105"
-            />
+          <div
+            class="aspect-square bg-gray-900 bg-cover bg-center"
+            style={photo.placeholder ? { backgroundImage: `url(${photo.placeholder})` } : undefined}
+          >
+            {sprites[photo.id] ? (
+              <SpriteThumb cell={sprites[photo.id]} alt={photo.captionAi ?? 'Photo thumbnail'} />
+            ) : (
+              <img
+                loading="lazy"
+                src={`/media/${photo.id}/256`}
+                srcset={`/media/${photo.id}/256 256w, /media/${photo.id}/1024 1024w`}
+                sizes="(min-width: 1024px) 20vw, (min-width: 768px) 25vw, 45vw"
+                alt={photo.captionAi ?? 'Photo thumbnail'}
+                class="h-full w-full object-cover transition duration-300 group-hover:scale-105"
+              />
+            )}
           </div>
           <div class="absolute left-2 top-2 rounded px-2 py-1 text-xs font-medium uppercase tracking-wide text-white">
             <span class={`rounded px-1 py-0.5 ${badgeClass}`}>{photo.status}</span>
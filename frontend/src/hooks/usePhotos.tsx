@@ -1,13 +1,18 @@
 import { ComponentChildren, createContext } from 'preact';
-import { useContext, useEffect, useMemo, useState } from 'preact/hooks';
+import { useContext, useEffect, useMemo, useRef, useState } from 'preact/hooks';
 import { apiClient } from '../apiClient';
-import { PhotoMetadata, UserSettings } from '../types';
+import { PhotoMetadata, PhotoSummary, SpriteCell, UserSettings } from '../types';
 
 type PhotoContextValue = {
-  photos: PhotoMetadata[];
+  photos: PhotoSummary[];
   loading: boolean;
   error?: string;
   refresh: () => void;
+  // Older photos are loaded a page at a time, as the grid scrolls to them.
+  hasMore: boolean;
+  loadMore: () => Promise<void>;
+  // Thumbnails by photo id, drawn from each loaded page's sprite sheet.
+  sprites: Record<string, SpriteCell>;
   settings?: UserSettings;
   updateSettings: (settings: Partial<UserSettings>) => Promise<void>;
   updatePhoto: (photo: PhotoMetadata) => void;
@@ -16,28 +21,87 @@ type PhotoContextValue = {
 const PhotoContext = createContext<PhotoContextValue | undefined>(undefined);
 
 export const PhotoProvider = ({ children }: { children: ComponentChildren }) => {
-  const [photos, setPhotos] = useState<PhotoMetadata[]>([]);
+  const [photos, setPhotos] = useState<PhotoSummary[]>([]);
   const [settings, setSettings] = useState<UserSettings>();
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string>();
+  const [next, setNext] = useState<string | null>(null);
+  const [sprites, setSprites] = useState<Record<string, SpriteCell>>({});
+  const spriteUrls = useRef<string[]>([]);
+  // Bumped by every refresh, so pages requested before it are dropped on arrival.
+  const generation = useRef(0);
+  const pageLoading = useRef(false);
+
+  // The sheet for the page at cursor; the grid shows single thumbnails until it arrives.
+  const loadSprites = async (current: number, cursor?: string) => {
+    try {
+      const { manifest, url } = await apiClient.getSprites(cursor);
+      if (current !== generation.current) {
+        URL.revokeObjectURL(url);
+        return;
+      }
+      spriteUrls.current.push(url);
+      setSprites((loaded) => {
+        const cells = { ...loaded };
+        for (const { id, ...tile } of manifest.tiles) {
+          cells[id] = { url, sheetWidth: manifest.width, sheetHeight: manifest.height, ...tile };
+        }
+        return cells;
+      });
+    } catch (err) {
+      console.error(err);
+    }
+  };
 
   const fetchAll = async () => {
+    const current = ++generation.current;
+    pageLoading.current = false;
+    spriteUrls.current.forEach((url) => URL.revokeObjectURL(url));
+    spriteUrls.current = [];
+    setSprites({});
     try {
       setLoading(true);
-      const [photosResponse, settingsResponse] = await Promise.all([
+      const [firstPage, settingsResponse] = await Promise.all([
         apiClient.listPhotos(),
         apiClient.getSettings().catch(() => undefined)
       ]);
-      setPhotos(photosResponse);
+      if (current !== generation.current) return;
+      setPhotos(firstPage.photos);
+      setNext(firstPage.next);
+      if (firstPage.photos.length) loadSprites(current);
       if (settingsResponse) {
         setSettings(settingsResponse);
       }
       setError(undefined);
     } catch (err) {
+      if (current !== generation.current) return;
+      console.error(err);
+      setError(err instanceof Error ? err.message : 'Failed to load photos');
+    } finally {
+      if (current === generation.current) setLoading(false);
+    }
+  };
+
+  const loadMore = async () => {
+    if (!next || pageLoading.current) return;
+    const current = generation.current;
+    pageLoading.current = true;
+    try {
+      const page = await apiClient.listPhotos(next);
+      if (current !== generation.current) return;
+      if (page.photos.length) loadSprites(current, next);
+      setPhotos((loaded) => {
+        // A photo opened in detail view may already have been added.
+        const seen = new Set(loaded.map((photo) => photo.id));
+        return [...loaded, ...page.photos.filter((photo) => !seen.has(photo.id))];
+      });
+      setNext(page.next);
+    } catch (err) {
+      if (current !== generation.current) return;
       console.error(err);
       setError(err instanceof Error ? err.message : 'Failed to load photos');
     } finally {
-      setLoading(false);
+      if (current === generation.current) pageLoading.current = false;
     }
   };
 
@@ -51,6 +115,9 @@ export const PhotoProvider = ({ children }: { children: ComponentChildren }) =>
       loading,
       error,
       refresh: fetchAll,
+      hasMore: next !== null,
+      loadMore,
+      sprites,
       settings,
       updateSettings: async (payload) => {
         const updated = await apiClient.updateSettings(payload);
@@ -63,7 +130,7 @@ export const PhotoProvider = ({ children }: { children: ComponentChildren }) =>
         });
       }
     }),
-    [photos, loading, error, settings]
+    [photos, loading, error, settings, next, sprites]
   );
 
   return <PhotoContext.Provider value={value}>{children}</PhotoContext.Provider>;
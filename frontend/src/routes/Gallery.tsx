@@ -1,5 +1,5 @@
 import { RouteComponentProps } from 'preact-router';
-import { useState } from 'preact/hooks';
+import { useEffect, useRef, useState } from 'preact/hooks';
 import { Link } from 'preact-router/match';
 import { usePhotos } from '../hooks/usePhotos';
 import { ErrorBanner } from '../components/ErrorBanner';
@@ -8,8 +8,22 @@ import { PhotoGrid } from '../components/PhotoGrid';
 import { UploadSection } from '../components/UploadSection';
 
 const Gallery = (_props: RouteComponentProps) => {
-  const { photos, loading, error, refresh } = usePhotos();
+  const { photos, loading, error, refresh, hasMore, loadMore, sprites } = usePhotos();
   const [showHelp, setShowHelp] = useState(false);
+  const sentinel = useRef<HTMLDivElement>(null);
+
+  // Fetch the next page when the end of the grid comes within a screen of view.
+  useEffect(() => {
+    if (!hasMore || !sentinel.current) return;
+    const observer = new IntersectionObserver(
+      (entries) => {
+        if (entries.some((entry) => entry.isIntersecting)) loadMore();
+      },
+      { rootMargin: '100% 0px' }
+    );
+    observer.observe(sentinel.current);
+    return () => observer.disconnect();
+  }, [hasMore, loadMore]);
 
   if (loading) {
     return <LoadingScreen message="Loading photos" />;
@@ -41,7 +55,10 @@ const Gallery = (_props: RouteComponentProps) => {
       </div>
       {error ? <ErrorBanner message={error} onRetry={refresh} /> : null}
       {photos.length ? (
-        <PhotoGrid photos={photos} />
+        <>
+          <PhotoGrid photos={photos} sprites={sprites} />
+          {hasMore ? <div ref={sentinel} aria-hidden="true" data-testid="grid-sentinel" class="h-px" /> : null}
+        </>
       ) : (
         <p class="text-center text-gray-400">Upload your first photo to begin.</p>
       )}
@@ -13,17 +13,33 @@ export interface PhotoLocationOverride {
   source: 'user';
 }
 
+export interface PhotoVariant {
+  size: number;
+  format: 'jpeg' | 'webp' | 'avif';
+  width?: number;
+  height?: number;
+  bytes?: number;
+  key?: string;
+}
+
 export interface PhotoMetadata {
   id: string;
   userId: string;
   storageKey: string;
-  variants: string[];
+  variants: PhotoVariant[];
+  placeholder?: string;
   captionAi?: string;
   noteUser?: string;
   exif: {
     hasGps: boolean;
     lat?: number;
     lon?: number;
+    capturedAt?: string;
+    orientation?: number;
+    cameraMake?: string;
+    cameraModel?: string;
+    width?: number;
+    height?: number;
   };
   placeAuto?: PhotoLocation;
   placeDisplay?: PhotoLocation;
@@ -33,6 +49,32 @@ export interface PhotoMetadata {
   status: PhotoStatus;
 }
 
+// A photo as GET /photos lists it: only the fields the views ask for with
+// `fields=`. The detail view loads the full PhotoMetadata.
+export type PhotoSummary = Pick<PhotoMetadata, 'id' | 'status' | 'placeholder' | 'captionAi' | 'placeDisplay'> & {
+  thumbnail?: string;
+};
+
+// GET /photos/sprites: where each photo of one list page sits in its sheet.
+export interface SpriteManifest {
+  version: string;
+  image: string;
+  width: number;
+  height: number;
+  tiles: { id: string; x: number; y: number; width: number; height: number }[];
+}
+
+// A photo's thumbnail inside a loaded sprite sheet.
+export interface SpriteCell {
+  url: string;
+  sheetWidth: number;
+  sheetHeight: number;
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+}
+
 export interface UserSettings {
   userId: string;
   detailOnly: boolean;
@@ -0,0 +1,85 @@
+"""Caption cost with full originals, the caption-sized derivative, and micro-batched derivatives, offline.
+
+Uses FakeCaptionClient, which charges --latency-s per call plus upload time
+at --upload-mbps, so the numbers show payload size, batching and concurrency
+effects without a real model. A second pass over the same photos is served
+from the captioner's cache. The batched run includes one corrupt image, which
+must fail alone.
+
+  python benchmarks/caption_bench.py --photos 16 --megapixels 12
+"""
+import argparse
+import asyncio
+import io
+import time
+
+from PIL import Image
+
+from photodisplay_workers.ai_caption_worker import AiCaptionWorker, FakeBatchCaptionClient, FakeCaptionClient
+from photodisplay_workers.derivative_worker import DerivativeWorker
+
+
+def make_photo(megapixels: float, seed: int) -> bytes:
+  width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+  height = width * 3 // 4
+  noise = Image.effect_noise((width, height), 40 + seed).convert('RGB')
+  gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+  buffer = io.BytesIO()
+  Image.blend(noise, gradient, 0.5).save(buffer, format='JPEG', quality=92)
+  return buffer.getvalue()
+
+
+async def caption_all(captioner: AiCaptionWorker, images: list[bytes]) -> tuple[float, int]:
+  start = time.perf_counter()
+  results = await asyncio.gather(*(captioner.generate_caption(image) for image in images), return_exceptions=True)
+  return time.perf_counter() - start, sum(isinstance(result, Exception) for result in results)
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--photos', type=int, default=16)
+  parser.add_argument('--megapixels', type=float, default=12)
+  parser.add_argument('--size', type=int, default=1024)
+  parser.add_argument('--max-in-flight', type=int, default=8)
+  parser.add_argument('--batch-size', type=int, default=16)
+  parser.add_argument('--batch-window-ms', type=float, default=200)
+  parser.add_argument('--latency-s', type=float, default=0.5)
+  parser.add_argument('--upload-mbps', type=float, default=50)
+  args = parser.parse_args()
+
+  originals = [make_photo(args.megapixels, seed) for seed in range(args.photos)]
+  # What the pipeline hands the captioner: the derivative it already rendered.
+  renderer = DerivativeWorker(sizes=[args.size], formats=['JPEG'])
+  derivatives = [renderer.generate(original)[0].data for original in originals]
+  print(
+    f'{args.photos} photos: originals {sum(map(len, originals)) / len(originals) / 1e6:.1f} MB, '
+    f'{args.size}px derivatives {sum(map(len, derivatives)) / len(derivatives) / 1e3:.0f} KB on average'
+  )
+
+  # A truncated JPEG: its header reads, decoding it fails.
+  corrupt = derivatives[0][:len(derivatives[0]) // 2]
+  runs = (
+    ('original', originals, 1_000_000, FakeCaptionClient),
+    ('derivative', derivatives, args.size, FakeCaptionClient),
+    ('batched', derivatives[1:] + [corrupt], args.size, FakeBatchCaptionClient),
+  )
+  for name, images, size, client_type in runs:
+    client = client_type(latency=args.latency_s, upload_mbps=args.upload_mbps)
+    captioner = AiCaptionWorker(
+      client,
+      image_size=size,
+      max_in_flight=args.max_in_flight,
+      batch_size=args.batch_size,
+      batch_window=args.batch_window_ms / 1000
+    )
+    first, failed = asyncio.run(caption_all(captioner, images))
+    sent, calls = client.bytes_sent, client.calls
+    cached, _ = asyncio.run(caption_all(captioner, images))
+    print(
+      f'{name:>10}: {first:6.2f} s, {sent / 1e6:7.1f} MB sent, {calls} model calls, {failed} failed; '
+      f'cached pass {cached * 1000:.1f} ms'
+    )
+
+
+if __name__ == '__main__':
+  main()
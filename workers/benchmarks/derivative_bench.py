@@ -0,0 +1,94 @@
+"""Per-photo latency and peak RSS of DerivativeWorker.generate.
+
+Compares the original full-frame pipeline (copy + thumbnail per size) with
+the draft-decoded cascade. Each pipeline runs in its own process so the peak
+RSS reading is not polluted by the other one (Linux/macOS only).
+
+  python benchmarks/derivative_bench.py --megapixels 48 --runs 5
+"""
+import argparse
+import io
+import multiprocessing
+import multiprocessing.forkserver
+import resource
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+from photodisplay_workers.derivative_worker import DerivativeWorker, Variant
+
+
+def legacy_generate(payload: bytes, sizes: list[int]) -> list[Variant]:
+  with Image.open(io.BytesIO(payload)) as image:
+    image = image.convert('RGB')
+    variants: list[Variant] = []
+    for size in sizes:
+      copy = image.copy()
+      copy.thumbnail((size, size))
+      buffer = io.BytesIO()
+      copy.save(buffer, format='JPEG', quality=85)
+      variants.append(Variant(size=size, data=buffer.getvalue()))
+    return variants
+
+
+def make_photo(megapixels: float) -> bytes:
+  width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+  height = width * 3 // 4
+  # A gradient plus noise compresses like a real photo, unlike a flat fill.
+  noise = Image.effect_noise((width, height), 48).convert('RGB')
+  gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+  image = Image.blend(noise, gradient, 0.5)
+  buffer = io.BytesIO()
+  image.save(buffer, format='JPEG', quality=92)
+  return buffer.getvalue()
+
+
+def _peak_rss_mb() -> float:
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is KiB on Linux and bytes on macOS.
+  return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _run(name: str, payload: bytes, runs: int, queue) -> None:
+  worker = DerivativeWorker(formats=['JPEG'])
+  generate = (lambda data: legacy_generate(data, worker.sizes)) if name == 'legacy' else worker.generate
+  baseline = _peak_rss_mb()
+  timings = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    generate(payload)
+    timings.append(time.perf_counter() - start)
+  queue.put((name, timings, _peak_rss_mb() - baseline, _peak_rss_mb()))
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--megapixels', type=float, default=48)
+  parser.add_argument('--runs', type=int, default=5)
+  args = parser.parse_args()
+
+  # Linux keeps the RSS high-water mark across exec, so start the fork server
+  # while this process is still small and fork each measurement from it.
+  ctx = multiprocessing.get_context('forkserver')
+  ctx.set_forkserver_preload(['photodisplay_workers.derivative_worker'])
+  multiprocessing.forkserver.ensure_running()
+  queue = ctx.Queue()
+
+  payload = make_photo(args.megapixels)
+  print(f'source: {args.megapixels:g} MP JPEG, {len(payload) / 1e6:.1f} MB, {args.runs} runs')
+
+  for name in ('legacy', 'cascade'):
+    process = ctx.Process(target=_run, args=(name, payload, args.runs, queue))
+    process.start()
+    name, timings, growth, peak = queue.get()
+    process.join()
+    print(
+      f'{name:>8}: median {statistics.median(timings) * 1000:7.1f} ms  '
+      f'min {min(timings) * 1000:7.1f} ms  peak RSS {peak:7.1f} MB (+{growth:.1f} MB)'
+    )
+
+
+if __name__ == '__main__':
+  main()
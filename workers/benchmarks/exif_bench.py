@@ -0,0 +1,77 @@
+"""Cost of EXIF extraction from a full fetch versus a ranged header read.
+
+Storage is simulated in memory: each read sleeps for --latency-ms plus its
+size over --bandwidth-mbps, so the numbers reflect bytes moved, not disk.
+
+  python benchmarks/exif_bench.py --megapixels 24 --runs 20
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+from PIL import Image
+
+from photodisplay_workers.exif_worker import extract_exif, read_exif_header
+
+
+def make_photo(megapixels: float) -> bytes:
+  width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+  height = width * 3 // 4
+  noise = Image.effect_noise((width, height), 48).convert('RGB')
+  gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+  exif = Image.Exif()
+  exif.update({0x010F: 'Canon', 0x0110: 'EOS R5', 0x0112: 6})
+  exif[0x8769] = {0x9003: '2024:06:01 09:30:00'}
+  exif[0x8825] = {1: 'N', 2: (48.0, 51.0, 29.0), 3: 'E', 4: (2.0, 17.0, 40.0)}
+  buffer = io.BytesIO()
+  Image.blend(noise, gradient, 0.5).save(buffer, format='JPEG', quality=92, exif=exif)
+  return buffer.getvalue()
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--megapixels', type=float, default=24)
+  parser.add_argument('--runs', type=int, default=20)
+  parser.add_argument('--latency-ms', type=float, default=20)
+  parser.add_argument('--bandwidth-mbps', type=float, default=200)
+  args = parser.parse_args()
+
+  payload = make_photo(args.megapixels)
+  moved = []
+
+  async def transfer(data: bytes) -> bytes:
+    moved.append(len(data))
+    await asyncio.sleep(args.latency_ms / 1000 + len(data) * 8 / (args.bandwidth_mbps * 1e6))
+    return data
+
+  async def full():
+    return extract_exif(await transfer(payload))
+
+  async def ranged():
+    return extract_exif(await read_exif_header(lambda length: transfer(payload[:length])))
+
+  async def measure(extract):
+    moved.clear()
+    timings = []
+    for _ in range(args.runs):
+      start = time.perf_counter()
+      result = await extract()
+      timings.append(time.perf_counter() - start)
+    return timings, sum(moved) / args.runs, result
+
+  print(
+    f'source: {args.megapixels:g} MP JPEG, {len(payload) / 1e6:.1f} MB, {args.runs} runs, '
+    f'{args.latency_ms:g} ms + {args.bandwidth_mbps:g} Mbit/s per read'
+  )
+  results = []
+  for name, extract in (('full', full), ('ranged', ranged)):
+    timings, per_photo, result = asyncio.run(measure(extract))
+    results.append(result)
+    print(f'{name:>7}: median {statistics.median(timings) * 1000:7.1f} ms  {per_photo / 1024:9.1f} KB read')
+  assert results[0] == results[1], 'ranged read disagrees with the full parse'
+
+
+if __name__ == '__main__':
+  main()
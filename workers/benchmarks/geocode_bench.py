@@ -0,0 +1,56 @@
+"""Offline reverse-geocoding latency of the gazetteer's k-d tree.
+
+Uses a GeoNames dump when given one, otherwise random places. Answers are
+checked against a brute-force scan of a sample.
+
+  python benchmarks/geocode_bench.py --places 200000 --queries 100000
+  python benchmarks/geocode_bench.py --gazetteer cities500.txt
+"""
+import argparse
+import time
+
+import numpy as np
+
+from photodisplay_workers.gazetteer import Gazetteer, KDTree, to_unit_vectors
+
+
+def random_coordinates(rng: np.random.Generator, count: int) -> tuple[np.ndarray, np.ndarray]:
+  # Uniform over the sphere's surface, not over the lat/lon rectangle.
+  return np.degrees(np.arcsin(rng.uniform(-1, 1, count))), rng.uniform(-180, 180, count)
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--gazetteer', help='GeoNames dump to index instead of random places')
+  parser.add_argument('--places', type=int, default=200_000)
+  parser.add_argument('--queries', type=int, default=100_000)
+  parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64, 4096])
+  args = parser.parse_args()
+  rng = np.random.default_rng(0)
+
+  start = time.perf_counter()
+  if args.gazetteer:
+    tree = Gazetteer.load(args.gazetteer).tree
+  else:
+    tree = KDTree(to_unit_vectors(*random_coordinates(rng, args.places)))
+  places = int((tree.leaf_index >= 0).sum())
+  print(f'index: {places} places, depth {tree.depth}, built in {time.perf_counter() - start:.2f} s')
+
+  queries = to_unit_vectors(*random_coordinates(rng, args.queries))
+  for batch_size in args.batch_sizes:
+    count = min(args.queries, batch_size * 2000)
+    start = time.perf_counter()
+    for offset in range(0, count, batch_size):
+      tree.query(queries[offset:offset + batch_size])
+    elapsed = time.perf_counter() - start
+    print(f'batch {batch_size:>5}: {elapsed / count * 1e6:8.2f} us per lookup')
+
+  sample = queries[:200]
+  distances, _ = tree.query(sample)
+  points = tree.leaf_points[tree.leaf_index >= 0]
+  exact = np.sqrt(((sample[:, None, :] - points[None]) ** 2).sum(axis=-1)).min(axis=1)
+  assert np.allclose(distances, exact), 'k-d tree disagrees with brute force'
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,70 @@
+"""Remote lookups and wall time for clustered photos through the geocode cache.
+
+Photos are scattered within --spread-m metres of a few --clusters, the way a
+user's library bunches around home and trips. The remote geocoder is a fake
+that answers after --latency-ms, paced like Nominatim by GeocodeWorker's
+throttle (--min-interval, scaled down so the run stays short).
+
+  python benchmarks/geocode_cache_bench.py --photos 2000 --clusters 20
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+
+from photodisplay_workers.geocode_cache import GeocodeCache
+from photodisplay_workers.geocode_worker import GeocodeWorker, Place
+
+
+def clustered_photos(photos: int, clusters: int, spread_m: float) -> list[tuple[float, float]]:
+  rng = random.Random(0)
+  centers = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(clusters)]
+  points = []
+  for _ in range(photos):
+    lat, lon = rng.choice(centers)
+    distance, bearing = rng.uniform(0, spread_m), rng.uniform(0, 2 * math.pi)
+    points.append((
+      lat + distance * math.cos(bearing) / 111_320,
+      lon + distance * math.sin(bearing) / (111_320 * math.cos(math.radians(lat)))
+    ))
+  return points
+
+
+async def run(points: list[tuple[float, float]], precision, args) -> tuple[int, float]:
+  worker = GeocodeWorker(cache=GeocodeCache(precision=precision) if precision else None, min_interval=args.min_interval)
+  calls = 0
+
+  async def remote(lat: float, lon: float) -> Place:
+    nonlocal calls
+    calls += 1
+    await worker._wait_turn()
+    await asyncio.sleep(args.latency_ms / 1000)
+    return Place(label=f'{lat:.3f},{lon:.3f}')
+
+  worker.nominatim = remote
+  start = time.perf_counter()
+  await asyncio.gather(*(worker.reverse_geocode(lat, lon) for lat, lon in points))
+  return calls, time.perf_counter() - start
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--photos', type=int, default=2000)
+  parser.add_argument('--clusters', type=int, default=20)
+  parser.add_argument('--spread-m', type=float, default=300)
+  parser.add_argument('--latency-ms', type=float, default=5)
+  parser.add_argument('--min-interval', type=float, default=0.001)
+  parser.add_argument('--precisions', type=int, nargs='+', default=[6, 7, 8])
+  args = parser.parse_args()
+
+  points = clustered_photos(args.photos, args.clusters, args.spread_m)
+  print(f'{args.photos} photos in {args.clusters} clusters of {args.spread_m:g} m')
+  for precision in [None, *args.precisions]:
+    calls, elapsed = asyncio.run(run(points, precision, args))
+    name = f'precision {precision}' if precision else 'no cache'
+    print(f'{name:>12}: {calls:6d} remote lookups  {elapsed:6.2f} s')
+
+
+if __name__ == '__main__':
+  main()
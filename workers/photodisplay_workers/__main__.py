@@ -0,0 +1,4 @@
+from .runtime import main
+
+if __name__ == '__main__':
+  main()
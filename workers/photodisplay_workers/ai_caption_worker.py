@@ -1,4 +1,14 @@
+import asyncio
+import hashlib
+import io
+from collections import OrderedDict
 from dataclasses import dataclass
+from typing import Optional, Union
+
+from PIL import Image
+
+CAPTION_IMAGE_SIZE = 1024
+CAPTION_PROMPT = 'Describe this photo in 240 characters or less.'
 
 
 @dataclass
@@ -6,12 +16,174 @@ class CaptionResult:
   caption: str
 
 
+class CaptionInputError(Exception):
+  """A batch call the model rejected over its inputs (e.g. an HTTP 400), as opposed to the service failing"""
+
+
+@dataclass
+class _Pending:
+  image: bytes
+  future: asyncio.Future
+
+
 class AiCaptionWorker:
-  def __init__(self, client) -> None:
+  """Captions images with a vision model client.
+
+  Images larger than image_size are downscaled before they are sent, results
+  are cached by image digest and language, and at most max_in_flight model
+  calls run at once.
+
+  When the client has generate_captions(prompt, images, language), captions
+  are micro-batched: requests wait until batch_size images of one language
+  are pending or batch_window seconds have passed, then go out as one call.
+  The client answers with a CaptionResult or an exception per image, so one
+  bad image fails only its own photo. A client that can only reject the whole
+  call raises CaptionInputError, and the batch is bisected until the images
+  behind it are isolated. Any other failure (rate limits, server errors,
+  timeouts) fails the whole batch, and the jobs' retries send it again later.
+  """
+
+  def __init__(
+    self,
+    client,
+    image_size: int = CAPTION_IMAGE_SIZE,
+    max_in_flight: int = 8,
+    cache_size: int = 10_000,
+    batch_size: int = 16,
+    batch_window: float = 0.2
+  ) -> None:
     self.client = client
+    self.image_size = image_size
+    self.cache_size = cache_size
+    self.batch_size = batch_size
+    self.batch_window = batch_window
+    self.batched = batch_size > 1 and hasattr(client, 'generate_captions')
+    self._calls = asyncio.Semaphore(max_in_flight)
+    self._cache: OrderedDict[tuple[str, str], CaptionResult] = OrderedDict()
+    self._pending: dict[str, list[_Pending]] = {}
+    self._timers: dict[str, asyncio.TimerHandle] = {}
+    self._sending: set[asyncio.Task] = set()
+
+  def fit(self, image_bytes: bytes) -> bytes:
+    """image_bytes, or a JPEG of it no larger than image_size on either side"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+      if max(image.size) <= self.image_size:
+        return image_bytes
+      image.draft('RGB', (self.image_size, self.image_size))
+      image = image.convert('RGB')
+      image.thumbnail((self.image_size, self.image_size))
+      buffer = io.BytesIO()
+      image.save(buffer, format='JPEG', quality=85)
+      return buffer.getvalue()
+
+  async def generate_caption(
+    self, image_bytes: bytes, language: str = 'en', digest: Optional[str] = None
+  ) -> CaptionResult:
+    key = (digest or hashlib.sha256(image_bytes).hexdigest(), language)
+    cached = self._cache.get(key)
+    if cached is not None:
+      self._cache.move_to_end(key)
+      return cached
+
+    image = await asyncio.to_thread(self.fit, image_bytes)
+    if self.batched:
+      response = await self._enqueue(image, language)
+    else:
+      async with self._calls:
+        response = await self.client.generate_caption(prompt=CAPTION_PROMPT, image=image, language=language)
+    result = CaptionResult(caption=response.caption[:240])
+    self._cache[key] = result
+    if len(self._cache) > self.cache_size:
+      self._cache.popitem(last=False)
+    return result
+
+  def _enqueue(self, image: bytes, language: str) -> asyncio.Future:
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    pending = self._pending.setdefault(language, [])
+    pending.append(_Pending(image, future))
+    if len(pending) >= self.batch_size:
+      self._flush(language)
+    elif language not in self._timers:
+      self._timers[language] = loop.call_later(self.batch_window, self._flush, language)
+    return future
+
+  def _flush(self, language: str) -> None:
+    timer = self._timers.pop(language, None)
+    if timer is not None:
+      timer.cancel()
+    batch = self._pending.pop(language, [])
+    if batch:
+      task = asyncio.ensure_future(self._send(batch, language))
+      self._sending.add(task)
+      task.add_done_callback(self._sending.discard)
+
+  async def _send(self, batch: list[_Pending], language: str) -> None:
+    try:
+      async with self._calls:
+        responses = await self.client.generate_captions(
+          prompt=CAPTION_PROMPT, images=[item.image for item in batch], language=language
+        )
+      if len(responses) != len(batch):
+        raise ValueError(f'{len(responses)} captions for {len(batch)} images')
+    except CaptionInputError as e:
+      if len(batch) == 1:
+        responses = [e]
+      else:
+        # Some image spoiled the call; halve the batch until it fails alone.
+        middle = len(batch) // 2
+        await asyncio.gather(self._send(batch[:middle], language), self._send(batch[middle:], language))
+        return
+    except Exception as e:
+      # Not the images' fault, so resending them one by one would only add load.
+      responses = [e] * len(batch)
+    for item, response in zip(batch, responses):
+      if item.future.done():
+        continue
+      if isinstance(response, BaseException):
+        item.future.set_exception(response)
+      else:
+        item.future.set_result(response)
+
+
+class FakeCaptionClient:
+  """Offline stand-in for a vision model: answers after an upload and inference delay.
+
+  Use it for benchmarks and local runs, e.g.
+  --caption-client photodisplay_workers.ai_caption_worker:FakeCaptionClient
+  """
+
+  def __init__(self, latency: float = 0.5, upload_mbps: float = 50.0) -> None:
+    self.latency = latency
+    self.upload_mbps = upload_mbps
+    self.calls = 0
+    self.bytes_sent = 0
+
+  async def generate_caption(self, prompt: str, image: bytes, language: str = 'en') -> CaptionResult:
+    self.calls += 1
+    self.bytes_sent += len(image)
+    await asyncio.sleep(self.latency + len(image) * 8 / (self.upload_mbps * 1e6))
+    with Image.open(io.BytesIO(image)) as opened:
+      width, height = opened.size
+    return CaptionResult(caption=f'A {width}x{height} photo ({language})')
+
+
+class FakeBatchCaptionClient(FakeCaptionClient):
+  """FakeCaptionClient that also answers batches: one delay per call, and images that fail to decode fail alone"""
 
-  async def generate_caption(self, image_bytes: bytes, language: str = 'en') -> CaptionResult:
-    prompt = 'Describe this photo in 240 characters or less.'
-    response = await self.client.generate_caption(prompt=prompt, image=image_bytes, language=language)
-    caption = response.caption[:240]
-    return CaptionResult(caption=caption)
+  async def generate_captions(
+    self, prompt: str, images: list[bytes], language: str = 'en'
+  ) -> list[Union[CaptionResult, Exception]]:
+    self.calls += 1
+    self.bytes_sent += sum(map(len, images))
+    await asyncio.sleep(self.latency + sum(map(len, images)) * 8 / (self.upload_mbps * 1e6))
+    results = []
+    for image in images:
+      try:
+        with Image.open(io.BytesIO(image)) as opened:
+          opened.load()
+          width, height = opened.size
+        results.append(CaptionResult(caption=f'A {width}x{height} photo ({language})'))
+      except Exception as e:
+        results.append(e)
+    return results
@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import mimetypes
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Protocol, Sequence
+
+from .derivative_worker import EXTENSIONS, DerivativeWorker, default_pool_size
+from .geocode_worker import GeocodeWorker
+from .pipeline import Fetch, FetchRange, PhotoContext, PhotoTask, PipelineRunner, photo_pipeline, photo_record
+from .runtime import limit_stages, load
+
+DEFAULT_SINK = 'app.queues.backfill:create_backfill_sink'
+
+
+class BackfillSink(Protocol):
+  """Where originals are read and stored and results are written; the API provides one"""
+  async def list_keys(self, prefix: str) -> list[tuple[str, int]]: ...
+  async def fetch(self, key: str) -> bytes: ...
+  async def fetch_range(self, key: str, length: int) -> bytes: ...
+  async def store(self, key: str, data: bytes, content_type: str) -> None: ...
+  async def fingerprint(self, filename: str, data: bytes) -> dict: ...
+  async def save(self, records: list[dict], user_id: Optional[str] = None) -> int: ...
+  async def close(self) -> None: ...
+
+
+@dataclass
+class Original:
+  key: str
+  size: int
+  # Set for local imports: the file to upload to key once it has been processed.
+  path: Optional[Path] = None
+
+
+def _is_image(name: str) -> bool:
+  content_type, _ = mimetypes.guess_type(name)
+  return bool(content_type and content_type.startswith('image/'))
+
+
+def stored_originals(listed: Iterable[tuple[str, int]]) -> list[Original]:
+  """The originals in a storage listing, leaving out their rendered variants.
+
+  Variants live at <original key without extension>/<size>.<ext> (Variant.key).
+  """
+  listed = sorted(listed)
+  stems = {key.rsplit('.', 1)[0] for key, _ in listed}
+
+  def is_variant(key: str) -> bool:
+    parent, _, name = key.rpartition('/')
+    size, _, extension = name.partition('.')
+    return parent in stems and size.isdigit() and extension in EXTENSIONS.values()
+
+  return [Original(key=key, size=size) for key, size in listed if _is_image(key) and not is_variant(key)]
+
+
+class LocalLibrary:
+  """A directory of originals imported for one user.
+
+  Each file is listed (and checkpointed) as key_prefix/user_id/<path>; it is
+  stored under the content-addressed key the sink's fingerprint() gives it.
+  """
+
+  def __init__(self, root: str | Path, user_id: str, key_prefix: str = 'imports') -> None:
+    self.root = Path(root)
+    self.prefix = f'{key_prefix}/{user_id}/'
+
+  def originals(self) -> Iterator[Original]:
+    # Sorted, so interrupted and resumed runs walk the same order.
+    for path in sorted(self.root.rglob('*')):
+      if path.is_file() and _is_image(path.name):
+        relative = path.relative_to(self.root).as_posix()
+        yield Original(key=self.prefix + relative, size=path.stat().st_size, path=path)
+
+  def _path(self, key: str) -> Path:
+    return self.root / key[len(self.prefix):]
+
+  async def fetch(self, key: str) -> bytes:
+    return await asyncio.to_thread(self._path(key).read_bytes)
+
+  async def fetch_range(self, key: str, length: int) -> bytes:
+    def read() -> bytes:
+      with self._path(key).open('rb') as file:
+        return file.read(length)
+    return await asyncio.to_thread(read)
+
+
+class Checkpoint:
+  """Append-only log of storage keys whose results are committed.
+
+  Keys are appended only after their batch is saved, so a run that is
+  interrupted redoes at most the batches in flight, and saving is idempotent.
+  """
+
+  def __init__(self, path: str | Path) -> None:
+    self.path = Path(path)
+
+  def load(self) -> set[str]:
+    if not self.path.exists():
+      return set()
+    return set(self.path.read_text().splitlines())
+
+  def mark(self, keys: Iterable[str]) -> None:
+    with self.path.open('a') as log:
+      log.writelines(f'{key}\n' for key in keys)
+      log.flush()
+      os.fsync(log.fileno())
+
+
+class Throughput:
+  def __init__(self) -> None:
+    self.started = time.perf_counter()
+    self.photos = 0
+    self.bytes = 0
+    self.failed = 0
+    self.skipped = 0
+
+  def add(self, size: int) -> None:
+    self.photos += 1
+    self.bytes += size
+
+  def report(self, label: str = 'progress') -> None:
+    elapsed = max(time.perf_counter() - self.started, 1e-9)
+    print(
+      f'{label}: {self.photos} photos, {self.failed} failed, {self.skipped} already done | '
+      f'{self.photos / elapsed:.1f} photos/s, {self.bytes / elapsed / 1e6:.1f} MB/s'
+    )
+
+
+class Backfill:
+  """Runs EXIF and derivatives over many originals, saving results in batches.
+
+  Up to max_in_flight photos are processed at once; the runner's stage limits
+  keep the process pool busy. A photo whose stages fail is reported and left
+  out of the checkpoint, so the next run tries it again. A batch that cannot
+  be saved aborts the run: its photos are counted as failed and are not
+  checkpointed.
+  """
+
+  def __init__(
+    self,
+    sink: BackfillSink,
+    runner: PipelineRunner,
+    checkpoint: Checkpoint,
+    fetch: Fetch,
+    fetch_range: Optional[FetchRange] = None,
+    stages: Sequence[str] = ('exif', 'derivative'),
+    sizes: Optional[list[int]] = None,
+    user_id: Optional[str] = None,
+    batch_size: int = 100,
+    max_in_flight: int = 16
+  ) -> None:
+    self.sink = sink
+    self.runner = runner
+    self.checkpoint = checkpoint
+    self.fetch = fetch
+    self.fetch_range = fetch_range
+    self.stages = stages
+    self.sizes = sizes
+    self.user_id = user_id
+    self.batch_size = batch_size
+    self.max_in_flight = max_in_flight
+    self.throughput = Throughput()
+    self._batch: list[dict] = []
+    self._saving = asyncio.Lock()
+
+  async def run(self, originals: Iterable[Original]) -> Throughput:
+    done = self.checkpoint.load()
+    pending: set[asyncio.Task] = set()
+    try:
+      for original in originals:
+        if original.key in done:
+          self.throughput.skipped += 1
+          continue
+        if len(pending) >= self.max_in_flight:
+          finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+          for task in finished:
+            # Re-raises a failed save.
+            task.result()
+        pending.add(asyncio.create_task(self.process(original)))
+      await asyncio.gather(*pending)
+      await self.flush()
+    except BaseException:
+      for task in pending:
+        task.cancel()
+      await asyncio.gather(*pending, return_exceptions=True)
+      # Processed but never saved: the next run redoes them.
+      self.throughput.photos -= len(self._batch)
+      self._batch = []
+      raise
+    return self.throughput
+
+  async def process(self, original: Original) -> None:
+    try:
+      imported = None
+      storage_key, fetch, fetch_range = original.key, self.fetch, self.fetch_range
+      if original.path is not None:
+        # Local files are stored content-addressed, under the key the sink picks.
+        payload = await self.fetch(original.key)
+        imported = await self.sink.fingerprint(original.path.name, payload)
+        storage_key, fetch_range = imported['storage_key'], None
+
+        async def fetch(_: str) -> bytes:
+          return payload
+
+      task = PhotoTask(photo_id=original.key, storage_key=storage_key, stages=self.stages, sizes=self.sizes)
+      context = PhotoContext(task=task, fetch=fetch, fetch_range=fetch_range)
+      result = await self.runner.run(context, only=self.stages)
+      if result.status != 'ready':
+        raise RuntimeError('; '.join(f'{name}: {error}' for name, error in result.errors.items()))
+      if imported is not None and not imported['stored']:
+        await self.sink.store(storage_key, payload, imported['import']['content_type'])
+    except Exception as e:
+      self.throughput.failed += 1
+      print(f'{original.key} failed: {e}')
+      return
+
+    record = {'storage_key': storage_key, **photo_record(result, storage_key)}
+    if imported is not None:
+      record['import'] = imported['import']
+    # Checkpoints name the original as listed, which for imports is not its storage key.
+    self._batch.append({'source': original.key, **record})
+    self.throughput.add(original.size)
+    if len(self._batch) >= self.batch_size:
+      await self.flush()
+
+  async def flush(self) -> None:
+    async with self._saving:
+      batch, self._batch = self._batch, []
+      if not batch:
+        return
+      try:
+        await self.sink.save(batch, self.user_id)
+      except BaseException:
+        self.throughput.photos -= len(batch)
+        self.throughput.failed += len(batch)
+        raise
+      self.checkpoint.mark(record['source'] for record in batch)
+
+
+async def report_every(throughput: Throughput, interval: float) -> None:
+  while True:
+    await asyncio.sleep(interval)
+    throughput.report()
+
+
+async def backfill(args: argparse.Namespace) -> None:
+  sink: BackfillSink = load(args.sink)()
+  stages = ('exif',) if args.exif_only else ('exif', 'derivative')
+  processes = args.processes or default_pool_size()
+
+  if args.dir:
+    library = LocalLibrary(args.dir, args.user, args.key_prefix)
+    originals: Iterable[Original] = library.originals()
+    fetch, fetch_range = library.fetch, library.fetch_range
+  else:
+    originals = stored_originals(await sink.list_keys(args.prefix))
+    fetch, fetch_range = sink.fetch, sink.fetch_range
+
+  with ProcessPoolExecutor(max_workers=processes) as pool:
+    runner = photo_pipeline(DerivativeWorker(), GeocodeWorker(), None, sink.store, executor=pool)
+    job = Backfill(
+      sink,
+      limit_stages(runner, {'exif': processes, 'derivative': processes}),
+      Checkpoint(args.checkpoint),
+      fetch,
+      fetch_range,
+      stages=stages,
+      sizes=args.sizes,
+      user_id=args.user,
+      batch_size=args.batch_size,
+      max_in_flight=args.max_in_flight or processes * 2
+    )
+    reporter = asyncio.create_task(report_every(job.throughput, args.report_interval))
+    try:
+      throughput = await job.run(originals)
+    except Exception:
+      job.throughput.report('aborted')
+      raise
+    finally:
+      reporter.cancel()
+      await sink.close()
+  throughput.report('done')
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+  parser = argparse.ArgumentParser(
+    prog='photodisplay-backfill',
+    description='Extract EXIF and render derivatives for many originals, saving results in batches'
+  )
+  source = parser.add_mutually_exclusive_group(required=True)
+  source.add_argument('--dir', help='import the images under this local directory for --user')
+  source.add_argument('--prefix', help='reprocess the originals under this storage prefix')
+  parser.add_argument('--user', help='owner of imported photos; required with --dir. With --prefix, '
+                                     'keys without a photo are imported for this user')
+  parser.add_argument('--key-prefix', default='imports', help='prefix naming --dir originals in the checkpoint')
+  parser.add_argument('--sink', default=os.environ.get('PHOTODISPLAY_BACKFILL_SINK', DEFAULT_SINK),
+                      help='module:factory returning the BackfillSink')
+  parser.add_argument('--checkpoint', default='backfill.checkpoint',
+                      help='file of finished keys; rerun with the same file to resume')
+  parser.add_argument('--exif-only', action='store_true', help='skip derivatives (JPEGs then need only a ranged read)')
+  parser.add_argument('--sizes', type=int, nargs='+', help='derivative sizes (default: the worker defaults)')
+  parser.add_argument('--processes', type=int, default=0, help='process pool size (default: usable cores)')
+  parser.add_argument('--max-in-flight', type=int, default=0, help='photos processed at once (default: 2 per process)')
+  parser.add_argument('--batch-size', type=int, default=100, help='results per database write')
+  parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between throughput reports')
+  args = parser.parse_args(argv)
+  if args.dir and not args.user:
+    parser.error('--dir needs --user')
+  asyncio.run(backfill(args))
+
+
+if __name__ == '__main__':
+  main()
@@ -1,27 +1,203 @@
+import base64
 import io
-from dataclasses import dataclass
-from typing import Iterable
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Hashable, Iterable, Iterator, Optional, Sequence
 from PIL import Image
 
 
+# Encoder settings per output format; quality values are tuned to look alike.
+ENCODERS: dict[str, dict] = {
+  'JPEG': {'quality': 85},
+  'WEBP': {'quality': 80, 'method': 4},
+  'AVIF': {'quality': 60},
+}
+
+CONTENT_TYPES = {
+  'JPEG': 'image/jpeg',
+  'WEBP': 'image/webp',
+  'AVIF': 'image/avif',
+}
+
+EXTENSIONS = {
+  'JPEG': 'jpg',
+  'WEBP': 'webp',
+  'AVIF': 'avif',
+}
+
+
+def supported_formats() -> list[str]:
+  """Output formats the installed Pillow can encode (AVIF needs Pillow >= 11.2 or the plugin)"""
+  Image.init()
+  return [fmt for fmt in ENCODERS if fmt in Image.SAVE]
+
+
 @dataclass
 class Variant:
   size: int
   data: bytes
+  format: str = 'JPEG'
+  width: int = 0
+  height: int = 0
+
+  @property
+  def content_type(self) -> str:
+    return CONTENT_TYPES[self.format]
+
+  def key(self, storage_key: str) -> str:
+    stem = storage_key.rsplit('.', 1)[0]
+    return f'{stem}/{self.size}.{EXTENSIONS[self.format]}'
+
+  def describe(self, storage_key: str) -> dict:
+    """Metadata stored in the photo's variants column"""
+    return {
+      'size': self.size,
+      'format': self.format.lower(),
+      'width': self.width,
+      'height': self.height,
+      'bytes': len(self.data),
+      'key': self.key(storage_key)
+    }
+
+
+@dataclass
+class DerivativeResult:
+  key: Hashable
+  variants: list[Variant] = field(default_factory=list)
+  placeholder: Optional[str] = None
+  error: Optional[BaseException] = None
+
+
+def default_pool_size() -> int:
+  # Respect CPU affinity/cgroup pinning where the platform exposes it.
+  if hasattr(os, 'sched_getaffinity'):
+    return max(1, len(os.sched_getaffinity(0)))
+  return max(1, os.cpu_count() or 1)
+
+
+def _fit(width: int, height: int, size: int) -> tuple[int, int]:
+  # Same bounding-box maths as Image.thumbnail, used to size the JPEG draft.
+  scale = min(size / width, size / height, 1.0)
+  return max(1, round(width * scale)), max(1, round(height * scale))
 
 
 class DerivativeWorker:
-  def __init__(self, sizes: Iterable[int] | None = None) -> None:
+  def __init__(
+    self,
+    sizes: Iterable[int] | None = None,
+    formats: Iterable[str] | None = None,
+    max_workers: int | None = None,
+    memory_budget_mb: int = 1024
+  ) -> None:
     self.sizes = list(sizes or [256, 1024, 2048])
+    available = supported_formats()
+    # JPEG is always there, so asking only for missing encoders still renders.
+    self.formats = [fmt.upper() for fmt in (formats or available) if fmt.upper() in available] or ['JPEG']
+    self.max_workers = max_workers or default_pool_size()
+    self.memory_budget = memory_budget_mb * 1024 * 1024
 
-  def generate(self, payload: bytes) -> list[Variant]:
+  def estimate_memory(self, payload: bytes) -> int:
+    """Bytes held while decoding payload: the source, the draft frame and its RGB copy"""
+    try:
+      with Image.open(io.BytesIO(payload)) as image:
+        # draft() only rewrites the header's scale, nothing is decoded here.
+        image.draft('RGB', _fit(image.width, image.height, max(self.sizes)))
+        return len(payload) + image.width * image.height * 3 * 2
+    except Exception:
+      return len(payload)
+
+  def decode(self, payload: bytes) -> Image.Image:
+    """Decode just enough of the original to render the largest variant"""
+    largest = max(self.sizes)
     with Image.open(io.BytesIO(payload)) as image:
-      image = image.convert('RGB')
-      variants: list[Variant] = []
-      for size in self.sizes:
-        copy = image.copy()
-        copy.thumbnail((size, size))
-        buffer = io.BytesIO()
-        copy.save(buffer, format='JPEG', quality=85)
-        variants.append(Variant(size=size, data=buffer.getvalue()))
-      return variants
+      # JPEG can decode at 1/2, 1/4 or 1/8 scale straight from the DCT
+      # coefficients; other formats ignore the draft request.
+      image.draft('RGB', _fit(image.width, image.height, largest))
+      return image.convert('RGB')
+
+  def render(self, frame: Image.Image) -> list[Variant]:
+    """Encode every size and format, resampling each size from the previous larger one"""
+    rendered: dict[int, list[Variant]] = {}
+    for size in sorted(set(self.sizes), reverse=True):
+      frame.thumbnail((size, size))
+      rendered[size] = [self.encode(frame, size, fmt) for fmt in self.formats]
+    return [variant for size in self.sizes for variant in rendered[size]]
+
+  def encode(self, frame: Image.Image, size: int, fmt: str = 'JPEG') -> Variant:
+    buffer = io.BytesIO()
+    frame.save(buffer, format=fmt, **ENCODERS[fmt])
+    return Variant(size=size, data=buffer.getvalue(), format=fmt, width=frame.width, height=frame.height)
+
+  def placeholder(self, frame: Image.Image, size: int = 32) -> str:
+    """Low-quality image placeholder as a data URI (~100-300 bytes), inlined in list payloads"""
+    tiny = frame.copy()
+    tiny.thumbnail((size, size))
+    fmt = 'WEBP' if 'WEBP' in supported_formats() else 'JPEG'
+    buffer = io.BytesIO()
+    tiny.save(buffer, format=fmt, quality=30)
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'data:{CONTENT_TYPES[fmt]};base64,{encoded}'
+
+  def generate(self, payload: bytes) -> list[Variant]:
+    return self.render(self.decode(payload))
+
+  def generate_with_placeholder(self, payload: bytes) -> tuple[list[Variant], str]:
+    frame = self.decode(payload)
+    variants = self.render(frame)
+    # render() leaves the frame at the smallest size, a cheap LQIP source.
+    return variants, self.placeholder(frame)
+
+  def generate_many(self, payloads: Sequence[bytes]) -> list[list[Variant]]:
+    """Render a batch on the process pool, returning variants in input order"""
+    results: list[list[Variant]] = [[] for _ in payloads]
+    for result in self.generate_stream(enumerate(payloads)):
+      if result.error is not None:
+        raise result.error
+      results[result.key] = result.variants
+    return results
+
+  def generate_stream(self, payloads: Iterable[tuple[Hashable, bytes]]) -> Iterator[DerivativeResult]:
+    """Render (key, payload) pairs on the process pool, yielding in completion order.
+
+    payloads is consumed lazily: a new original is only pulled and submitted
+    while the estimated decode memory of in-flight jobs fits memory_budget_mb
+    (one job is always admitted so oversized originals still make progress).
+    Per-photo failures are reported on the result instead of aborting the batch.
+    """
+    source = iter(payloads)
+    pending: dict[Future, tuple[Hashable, int]] = {}
+    in_flight = 0
+    backlog: Optional[tuple[Hashable, bytes, int]] = None
+    exhausted = False
+
+    with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+      while True:
+        while not exhausted and len(pending) < self.max_workers * 2:
+          if backlog is None:
+            try:
+              key, payload = next(source)
+            except StopIteration:
+              exhausted = True
+              break
+            backlog = (key, payload, self.estimate_memory(payload))
+          key, payload, cost = backlog
+          if pending and in_flight + cost > self.memory_budget:
+            break
+          pending[executor.submit(self.generate_with_placeholder, payload)] = (key, cost)
+          in_flight += cost
+          backlog = None
+
+        if not pending:
+          return
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          key, cost = pending.pop(future)
+          in_flight -= cost
+          error = future.exception()
+          if error is not None:
+            yield DerivativeResult(key=key, error=error)
+          else:
+            variants, placeholder = future.result()
+            yield DerivativeResult(key=key, variants=variants, placeholder=placeholder)
@@ -1,8 +1,23 @@
 import io
 from dataclasses import dataclass
-from typing import Optional
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
 
 import exifread
+from PIL import Image
+
+# Enough for the APP1 segment (capped at 64 KB by the format) and, usually, the
+# frame header behind it; a big ICC profile or XMP packet costs one more read.
+EXIF_HEADER_BYTES = 64 * 1024
+EXIF_MAX_HEADER_BYTES = 1024 * 1024
+
+# Start-of-frame markers (baseline, progressive, lossless, arithmetic...)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_START_OF_SCAN = 0xDA
+# Markers without a length field
+_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+
+ReadPrefix = Callable[[int], Awaitable[bytes]]
 
 
 @dataclass
@@ -10,6 +25,92 @@ class ExifResult:
   has_gps: bool
   lat: Optional[float] = None
   lon: Optional[float] = None
+  captured_at: Optional[str] = None
+  orientation: Optional[int] = None
+  camera_make: Optional[str] = None
+  camera_model: Optional[str] = None
+  width: Optional[int] = None
+  height: Optional[int] = None
+
+  def describe(self) -> dict:
+    """The shape the API stores as a photo's exif"""
+    record = {'hasGps': self.has_gps}
+    if self.has_gps:
+      record.update(lat=self.lat, lon=self.lon)
+    optional = {
+      'capturedAt': self.captured_at,
+      'orientation': self.orientation,
+      'cameraMake': self.camera_make,
+      'cameraModel': self.camera_model,
+      'width': self.width,
+      'height': self.height
+    }
+    record.update((key, value) for key, value in optional.items() if value is not None)
+    return record
+
+  @classmethod
+  def from_record(cls, record: dict) -> 'ExifResult':
+    return cls(
+      has_gps=record.get('hasGps', False),
+      lat=record.get('lat'),
+      lon=record.get('lon'),
+      captured_at=record.get('capturedAt'),
+      orientation=record.get('orientation'),
+      camera_make=record.get('cameraMake'),
+      camera_model=record.get('cameraModel'),
+      width=record.get('width'),
+      height=record.get('height')
+    )
+
+
+def _walk_jpeg(data: bytes) -> tuple[Optional[int], Optional[int]]:
+  """(bytes needed to reach past the frame header, offset of the frame header).
+
+  Only segment lengths are read, so a prefix that stops mid-segment still
+  says how much more is needed. The first value is None if data isn't a JPEG.
+  """
+  if not data.startswith(b'\xff\xd8'):
+    return None, None
+  offset = 2
+  while True:
+    # Markers may be padded with any number of 0xFF fill bytes.
+    while data[offset:offset + 2] == b'\xff\xff':
+      offset += 1
+    if offset + 4 > len(data):
+      return offset + 4, None
+    if data[offset] != 0xFF:
+      return offset, None
+    marker = data[offset + 1]
+    if marker in _STANDALONE_MARKERS:
+      offset += 2
+      continue
+    end = offset + 2 + int.from_bytes(data[offset + 2:offset + 4], 'big')
+    if marker in _SOF_MARKERS:
+      return end, offset
+    if marker == _START_OF_SCAN:
+      return offset, None
+    offset = end
+
+
+async def read_exif_header(read: ReadPrefix) -> Optional[bytes]:
+  """A JPEG's leading metadata segments, via ranged reads of its first bytes.
+
+  One read of EXIF_HEADER_BYTES normally covers APP1 and the frame header.
+  Returns None for other formats, whose metadata may sit anywhere in the file.
+  """
+  header = await read(EXIF_HEADER_BYTES)
+  while True:
+    needed, _ = _walk_jpeg(header)
+    if needed is None:
+      return None
+    if needed <= len(header) or len(header) >= EXIF_MAX_HEADER_BYTES:
+      return header
+    # Grow geometrically: ICC profiles come in 64 KB chunks, one segment each.
+    longer = await read(min(max(needed + EXIF_HEADER_BYTES, 4 * len(header)), EXIF_MAX_HEADER_BYTES))
+    if len(longer) <= len(header):
+      # The object is shorter than its segments claim.
+      return header
+    header = longer
 
 
 def _convert_to_degrees(value):
@@ -19,15 +120,77 @@ def _convert_to_degrees(value):
   return d + (m / 60.0) + (s / 3600.0)
 
 
-def extract_gps(payload: bytes) -> ExifResult:
-  tags = exifread.process_file(io.BytesIO(payload), details=False)
+def _text(tags: dict, name: str) -> Optional[str]:
+  tag = tags.get(name)
+  value = str(tag).strip('\x00 ') if tag is not None else ''
+  return value or None
+
+
+def _number(tags: dict, name: str) -> Optional[int]:
+  tag = tags.get(name)
+  try:
+    return int(tag.values[0]) if tag is not None else None
+  except (TypeError, ValueError, IndexError):
+    return None
+
+
+def _captured_at(tags: dict) -> Optional[str]:
+  value = _text(tags, 'EXIF DateTimeOriginal') or _text(tags, 'Image DateTime')
+  try:
+    taken = datetime.strptime(value or '', '%Y:%m:%d %H:%M:%S')
+  except ValueError:
+    # Unset clocks are written as '0000:00:00 00:00:00'
+    return None
+  offset = _text(tags, 'EXIF OffsetTimeOriginal')
+  if offset:
+    try:
+      taken = taken.replace(tzinfo=datetime.strptime(offset, '%z').tzinfo)
+    except ValueError:
+      pass
+  return taken.isoformat()
+
+
+def _dimensions(data: bytes, tags: dict) -> tuple[Optional[int], Optional[int]]:
+  needed, frame = _walk_jpeg(data)
+  if frame is not None and frame + 9 <= len(data):
+    return int.from_bytes(data[frame + 7:frame + 9], 'big'), int.from_bytes(data[frame + 5:frame + 7], 'big')
+  if needed is None:
+    try:
+      with Image.open(io.BytesIO(data)) as image:
+        return image.size
+    except Exception:
+      pass
+  return _number(tags, 'EXIF ExifImageWidth'), _number(tags, 'EXIF ExifImageLength')
+
+
+def extract_exif(payload: bytes) -> ExifResult:
+  """Location, capture time, orientation, camera and size in one pass.
+
+  payload is either the whole original or just its header from
+  read_exif_header().
+  """
+  try:
+    tags = exifread.process_file(io.BytesIO(payload), details=False)
+  except Exception:
+    # exifread indexes past the end of truncated objects; they have no usable tags.
+    tags = {}
+  width, height = _dimensions(payload, tags)
+  result = ExifResult(
+    has_gps=False,
+    captured_at=_captured_at(tags),
+    orientation=_number(tags, 'Image Orientation'),
+    camera_make=_text(tags, 'Image Make'),
+    camera_model=_text(tags, 'Image Model'),
+    width=width,
+    height=height
+  )
+
   gps_lat = tags.get('GPS GPSLatitude')
   gps_lat_ref = tags.get('GPS GPSLatitudeRef')
   gps_lon = tags.get('GPS GPSLongitude')
   gps_lon_ref = tags.get('GPS GPSLongitudeRef')
-
   if not all([gps_lat, gps_lat_ref, gps_lon, gps_lon_ref]):
-    return ExifResult(has_gps=False)
+    return result
 
   lat = _convert_to_degrees(gps_lat)
   if gps_lat_ref.values[0] != 'N':
@@ -36,4 +199,11 @@ def extract_gps(payload: bytes) -> ExifResult:
   if gps_lon_ref.values[0] != 'E':
     lon *= -1
 
-  return ExifResult(has_gps=True, lat=lat, lon=lon)
+  result.has_gps, result.lat, result.lon = True, lat, lon
+  return result
+
+
+def extract_gps(payload: bytes) -> ExifResult:
+  """Location only, as before extract_exif; kept for existing callers"""
+  result = extract_exif(payload)
+  return ExifResult(has_gps=result.has_gps, lat=result.lat, lon=result.lon)
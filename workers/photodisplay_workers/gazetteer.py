@@ -0,0 +1,224 @@
+import csv
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .geocode_worker import Place
+
+EARTH_RADIUS_KM = 6371.0
+
+# GeoNames dump columns (https://download.geonames.org/export/dump/readme.txt)
+_NAME, _LAT, _LON, _COUNTRY, _ADMIN1, _POPULATION = 1, 4, 5, 8, 10, 14
+
+
+def to_unit_vectors(lats, lons) -> np.ndarray:
+  """Points on the unit sphere, where straight-line (chord) order is great-circle order"""
+  lat = np.radians(np.asarray(lats, dtype=np.float64))
+  lon = np.radians(np.asarray(lons, dtype=np.float64))
+  return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord) -> np.ndarray:
+  return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+class KDTree:
+  """A balanced k-d tree over points, stored as flat arrays and queried in batches.
+
+  The tree is complete: node i has children 2i+1 and 2i+2 and every leaf is
+  at the same depth, so a batch of queries descends level by level with
+  array operations instead of per-query recursion. Each leaf holds up to
+  leaf_size points, padded with +inf so leaves stack into one array. Batches
+  smaller than SEARCH_BATCH use a plain depth-first search instead, as the
+  fixed cost of the array passes dominates there.
+  """
+
+  SEARCH_BATCH = 32
+
+  def __init__(self, points: np.ndarray, leaf_size: int = 32) -> None:
+    points = np.asarray(points, dtype=np.float64)
+    count, dims = points.shape
+    self.depth = max(0, int(np.ceil(np.log2(max(count, 1) / leaf_size))))
+    internal = 2 ** self.depth - 1
+    leaves = 2 ** self.depth
+
+    self.split_dim = np.zeros(internal, dtype=np.intp)
+    self.split_value = np.zeros(internal)
+    self.lower = np.zeros((internal + leaves, dims))
+    self.upper = np.zeros((internal + leaves, dims))
+    order = np.arange(count)
+    bounds = np.zeros(leaves + 1, dtype=np.intp)
+
+    # Split each node's slice of `order` at the median of its widest dimension.
+    ranges = [(0, count)]
+    for node in range(internal + leaves):
+      start, end = ranges[node]
+      subset = points[order[start:end]]
+      if end > start:
+        self.lower[node], self.upper[node] = subset.min(axis=0), subset.max(axis=0)
+      else:
+        self.lower[node], self.upper[node] = np.inf, -np.inf
+      if node >= internal:
+        bounds[node - internal + 1] = end
+        continue
+      middle = (start + end) // 2
+      dim = int(np.argmax(self.upper[node] - self.lower[node])) if end > start else 0
+      if end > start:
+        part = np.argpartition(subset[:, dim], middle - start)
+        order[start:end] = order[start:end][part]
+        self.split_value[node] = points[order[middle], dim]
+      self.split_dim[node] = dim
+      ranges.extend([(start, middle), (middle, end)])
+
+    self._split_dim, self._split_value = self.split_dim.tolist(), self.split_value.tolist()
+    self.leaf_size = int(max(np.diff(bounds).max(initial=0), 1))
+    self.leaf_points = np.full((leaves, self.leaf_size, dims), np.inf)
+    self.leaf_index = np.full((leaves, self.leaf_size), -1, dtype=np.intp)
+    for leaf in range(leaves):
+      members = order[bounds[leaf]:bounds[leaf + 1]]
+      self.leaf_points[leaf, :len(members)] = points[members]
+      self.leaf_index[leaf, :len(members)] = members
+
+  def _scan(self, queries: np.ndarray, leaves: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Nearest point within one leaf for each (query, leaf) pair"""
+    delta = self.leaf_points[leaves] - queries[:, None, :]
+    distances = np.einsum('ijk,ijk->ij', delta, delta)
+    best = distances.argmin(axis=1)
+    rows = np.arange(len(leaves))
+    return distances[rows, best], self.leaf_index[leaves, best]
+
+  def _search(self, query: np.ndarray) -> tuple[float, int]:
+    """Depth-first search for one query, nearer child first"""
+    point = query.tolist()
+    internal = 2 ** self.depth - 1
+    best, index = np.inf, -1
+    # (node, squared distance from the query to the node's cell, at least)
+    stack = [(0, 0.0)]
+    while stack:
+      node, bound = stack.pop()
+      if bound >= best:
+        continue
+      if node >= internal:
+        delta = self.leaf_points[node - internal] - query
+        distances = np.einsum('ij,ij->i', delta, delta)
+        nearest = int(distances.argmin())
+        if distances[nearest] < best:
+          best, index = float(distances[nearest]), int(self.leaf_index[node - internal, nearest])
+        continue
+      offset = point[self._split_dim[node]] - self._split_value[node]
+      near, far = (2 * node + 2, 2 * node + 1) if offset > 0 else (2 * node + 1, 2 * node + 2)
+      stack.append((far, max(bound, offset * offset)))
+      stack.append((near, bound))
+    return best, index
+
+  def query(self, queries: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Exact nearest neighbour of every query: (euclidean distances, point indices)"""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float64))
+    if len(queries) < self.SEARCH_BATCH:
+      found = [self._search(query) for query in queries]
+      return np.sqrt([best for best, _ in found]), np.array([index for _, index in found], dtype=np.intp)
+    internal = 2 ** self.depth - 1
+    everyone = np.arange(len(queries))
+
+    # Descend to each query's own leaf for a first answer, noting how far the
+    # query is from the nearest splitting plane on the way.
+    nodes = np.zeros(len(queries), dtype=np.intp)
+    margin = np.full(len(queries), np.inf)
+    for _ in range(self.depth):
+      offset = queries[everyone, self.split_dim[nodes]] - self.split_value[nodes]
+      margin = np.minimum(margin, offset * offset)
+      nodes = 2 * nodes + 1 + (offset > 0)
+    home = nodes - internal
+    best, index = self._scan(queries, home)
+
+    # The answer is final when that distance is inside the leaf's cell.
+    # Otherwise visit, level by level, only the nodes whose bounding box is
+    # closer than the best distance so far.
+    owners = everyone[best >= margin]
+    nodes = np.zeros(len(owners), dtype=np.intp)
+    for _ in range(self.depth):
+      owners = np.repeat(owners, 2)
+      nodes = (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+      gap = np.maximum(self.lower[nodes] - queries[owners], 0) + np.maximum(queries[owners] - self.upper[nodes], 0)
+      near = np.einsum('ij,ij->i', gap, gap) < best[owners]
+      owners, nodes = owners[near], nodes[near]
+    leaves = nodes - internal
+    other = leaves != home[owners]
+    owners, leaves = owners[other], leaves[other]
+    if len(owners):
+      distances, found = self._scan(queries[owners], leaves)
+      # Keep the closest candidate per query.
+      order = np.lexsort((distances, owners))
+      owners, distances, found = owners[order], distances[order], found[order]
+      first = np.r_[True, owners[1:] != owners[:-1]]
+      owners, distances, found = owners[first], distances[first], found[first]
+      closer = distances < best[owners]
+      best[owners[closer]] = distances[closer]
+      index[owners[closer]] = found[closer]
+    return np.sqrt(best), index
+
+
+class Gazetteer:
+  """Populated places from a GeoNames dump, indexed for offline reverse geocoding.
+
+  Load cities500.txt, cities15000.txt or allCountries.txt; countryInfo.txt and
+  admin1CodesASCII.txt next to it are used for country and region names when
+  present, otherwise labels fall back to the codes.
+  """
+
+  def __init__(self, lats: Sequence[float], lons: Sequence[float], labels: list[str], countries: list[str]) -> None:
+    self.labels = labels
+    self.countries = countries
+    self.tree = KDTree(to_unit_vectors(lats, lons))
+
+  @classmethod
+  def load(cls, path: str | Path, min_population: int = 0) -> 'Gazetteer':
+    path = Path(path)
+    country_names = _read_names(path.with_name('countryInfo.txt'), key=0, value=4)
+    region_names = _read_names(path.with_name('admin1CodesASCII.txt'), key=0, value=1)
+    lats, lons, labels, countries = [], [], [], []
+    with path.open(encoding='utf-8', newline='') as dump:
+      for row in csv.reader(dump, delimiter='\t', quoting=csv.QUOTE_NONE):
+        if len(row) <= _POPULATION or int(row[_POPULATION] or 0) < min_population:
+          continue
+        country = country_names.get(row[_COUNTRY], row[_COUNTRY])
+        region = region_names.get(f'{row[_COUNTRY]}.{row[_ADMIN1]}')
+        parts = [row[_NAME], region, country]
+        labels.append(', '.join(part for i, part in enumerate(parts) if part and part not in parts[:i]))
+        countries.append(country or None)
+        lats.append(float(row[_LAT]))
+        lons.append(float(row[_LON]))
+    return cls(lats, lons, labels, countries)
+
+  def nearest(self, lats, lons) -> tuple[np.ndarray, np.ndarray]:
+    """(distance in km, place index) of the nearest place to each coordinate"""
+    chords, indices = self.tree.query(to_unit_vectors(lats, lons))
+    return chord_to_km(chords), indices
+
+  def lookup_many(self, coordinates: Sequence[tuple[float, float]], max_distance_km: float) -> list[Optional[Place]]:
+    if not coordinates:
+      return []
+    lats, lons = zip(*coordinates)
+    distances, indices = self.nearest(lats, lons)
+    # An empty gazetteer answers every query with index -1.
+    return [
+      Place(label=self.labels[index], country=self.countries[index])
+      if index >= 0 and distance <= max_distance_km else None
+      for distance, index in zip(distances.tolist(), indices.tolist())
+    ]
+
+  def lookup(self, lat: float, lon: float, max_distance_km: float) -> Optional[Place]:
+    [place] = self.lookup_many([(lat, lon)], max_distance_km)
+    return place
+
+
+def _read_names(path: Path, key: int, value: int) -> dict[str, str]:
+  if not path.exists():
+    return {}
+  names = {}
+  with path.open(encoding='utf-8', newline='') as table:
+    for row in csv.reader(table, delimiter='\t', quoting=csv.QUOTE_NONE):
+      if row and not row[0].startswith('#') and len(row) > max(key, value):
+        names[row[key]] = row[value]
+  return names
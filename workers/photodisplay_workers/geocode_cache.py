@@ -0,0 +1,159 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Protocol
+
+from .geocode_worker import Place
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_MISSING = object()
+
+Lookup = Callable[[float, float], Awaitable[Optional[Place]]]
+
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+  """The geohash cell containing (lat, lon); precision 7 cells are about 150 m across"""
+  lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+  cell, bits, value, even = [], 0, 0, True
+  while len(cell) < precision:
+    # Bits alternate between longitude and latitude, longitude first.
+    bounds, coordinate = (lon_range, lon) if even else (lat_range, lat)
+    middle = (bounds[0] + bounds[1]) / 2
+    value <<= 1
+    if coordinate >= middle:
+      value |= 1
+      bounds[0] = middle
+    else:
+      bounds[1] = middle
+    even = not even
+    bits += 1
+    if bits == 5:
+      cell.append(_BASE32[value])
+      bits, value = 0, 0
+  return ''.join(cell)
+
+
+def geohash_center(cell: str) -> tuple[float, float]:
+  lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+  even = True
+  for char in cell:
+    value = _BASE32.index(char)
+    for shift in range(4, -1, -1):
+      bounds = lon_range if even else lat_range
+      middle = (bounds[0] + bounds[1]) / 2
+      bounds[0 if value >> shift & 1 else 1] = middle
+      even = not even
+  return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+class PlaceStore(Protocol):
+  """Persistent tier of the cache, by backend and cell.
+
+  A stored label of None records that a cell has no place. get() also
+  returns checked_at, in Unix seconds, so those records can expire; put()
+  replaces what was stored.
+  """
+  async def get(self, key: str) -> Optional[dict]: ...
+  async def put(self, key: str, place: dict) -> None: ...
+
+
+class SqlitePlaceStore:
+  """A cache table in a local SQLite file, for a single worker host"""
+
+  def __init__(self, path: str) -> None:
+    self._connection = sqlite3.connect(path, check_same_thread=False)
+    self._connection.execute(
+      'CREATE TABLE IF NOT EXISTS geocode_cache (key TEXT PRIMARY KEY, label TEXT, country TEXT, checked_at REAL)'
+    )
+    self._connection.commit()
+    self._lock = threading.Lock()
+
+  def _get(self, key: str) -> Optional[dict]:
+    with self._lock:
+      row = self._connection.execute(
+        'SELECT label, country, checked_at FROM geocode_cache WHERE key = ?', (key,)
+      ).fetchone()
+    return None if row is None else {'label': row[0], 'country': row[1], 'checked_at': row[2]}
+
+  def _put(self, key: str, place: dict) -> None:
+    with self._lock:
+      self._connection.execute(
+        'INSERT OR REPLACE INTO geocode_cache (key, label, country, checked_at) VALUES (?, ?, ?, ?)',
+        (key, place['label'], place['country'], time.time())
+      )
+      self._connection.commit()
+
+  async def get(self, key: str) -> Optional[dict]:
+    return await asyncio.to_thread(self._get, key)
+
+  async def put(self, key: str, place: dict) -> None:
+    await asyncio.to_thread(self._put, key, place)
+
+
+class GeocodeCache:
+  """Places by geohash cell: an in-memory LRU in front of an optional persistent store.
+
+  A miss geocodes the cell's center, so every photo in a cell gets the same
+  answer whichever arrived first, and concurrent misses for one cell share a
+  single lookup. Answers are kept apart per backend, since a gazetteer
+  without fallback finds nothing where Nominatim would. "No place" expires
+  after negative_ttl seconds; places are kept for good. Failed lookups are
+  not cached.
+  """
+
+  def __init__(
+    self,
+    store: Optional[PlaceStore] = None,
+    precision: int = 7,
+    max_entries: int = 10_000,
+    negative_ttl: float = 7 * 24 * 3600
+  ) -> None:
+    self.store = store
+    self.precision = precision
+    self.max_entries = max_entries
+    self.negative_ttl = negative_ttl
+    self.hits = 0
+    self.lookups = 0
+    self._memory: OrderedDict[str, tuple[Optional[Place], float]] = OrderedDict()
+    self._in_flight: dict[str, asyncio.Future] = {}
+
+  def _expired(self, place: Optional[Place], checked_at: Optional[float]) -> bool:
+    return place is None and time.time() - (checked_at or 0) > self.negative_ttl
+
+  async def get(self, lat: float, lon: float, lookup: Lookup, backend: str = '') -> Optional[Place]:
+    key = f'{backend}:{geohash(lat, lon, self.precision)}'
+    place, checked_at = self._memory.get(key, (_MISSING, None))
+    if place is not _MISSING and not self._expired(place, checked_at):
+      self._memory.move_to_end(key)
+      self.hits += 1
+      return place
+
+    flight = self._in_flight.get(key)
+    if flight is None:
+      flight = asyncio.ensure_future(self._load(key, lookup))
+      self._in_flight[key] = flight
+      flight.add_done_callback(lambda _: self._in_flight.pop(key, None))
+    else:
+      self.hits += 1
+    # One caller giving up must not cancel the lookup the others wait on.
+    return await asyncio.shield(flight)
+
+  async def _load(self, key: str, lookup: Lookup) -> Optional[Place]:
+    stored = await self.store.get(key) if self.store is not None else None
+    place = Place(stored['label'], stored['country']) if stored and stored['label'] else None
+    if stored is not None and not self._expired(place, stored['checked_at']):
+      self.hits += 1
+      checked_at = stored['checked_at']
+    else:
+      self.lookups += 1
+      place = await lookup(*geohash_center(key.rpartition(':')[2]))
+      checked_at = time.time()
+      if self.store is not None:
+        await self.store.put(key, {'label': place.label if place else None, 'country': place.country if place else None})
+    self._memory.pop(key, None)
+    self._memory[key] = (place, checked_at)
+    if len(self._memory) > self.max_entries:
+      self._memory.popitem(last=False)
+    return place
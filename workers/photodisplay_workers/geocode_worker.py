@@ -1,8 +1,15 @@
+import asyncio
 from dataclasses import dataclass
-from typing import Optional
+from typing import TYPE_CHECKING, Optional, Sequence
 
 import httpx
 
+if TYPE_CHECKING:
+  from .gazetteer import Gazetteer
+  from .geocode_cache import GeocodeCache
+
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/reverse'
+
 
 @dataclass
 class Place:
@@ -11,24 +18,97 @@ class Place:
 
 
 class GeocodeWorker:
-  def __init__(self, api_key: str | None = None) -> None:
+  """Reverse geocodes with an offline gazetteer when one is loaded, Nominatim otherwise.
+
+  With a gazetteer, Nominatim is asked only about coordinates with no place
+  within max_distance_km, and only if fallback is on. Nominatim requests go
+  through one pooled client, at most one per min_interval seconds (its usage
+  policy allows one a second). With a cache, photos in the same cell share
+  one lookup. Call aclose() when done.
+  """
+
+  def __init__(
+    self,
+    api_key: str | None = None,
+    gazetteer: Optional['Gazetteer'] = None,
+    max_distance_km: float = 50.0,
+    fallback: bool = True,
+    cache: Optional['GeocodeCache'] = None,
+    min_interval: float = 1.0
+  ) -> None:
     self.api_key = api_key
+    self.gazetteer = gazetteer
+    self.max_distance_km = max_distance_km
+    self.fallback = fallback
+    self.cache = cache
+    self.min_interval = min_interval
+    self._client: Optional[httpx.AsyncClient] = None
+    self._throttle = asyncio.Lock()
+    self._next_request = 0.0
+
+  @property
+  def backend(self) -> str:
+    """What answers lookups; the cache keeps each backend's answers apart"""
+    if self.gazetteer is None:
+      return 'nominatim'
+    return 'gazetteer+nominatim' if self.fallback else 'gazetteer'
 
   async def reverse_geocode(self, lat: float, lon: float) -> Optional[Place]:
+    if self.cache is None:
+      return await self.lookup(lat, lon)
+    return await self.cache.get(lat, lon, self.lookup, self.backend)
+
+  async def lookup(self, lat: float, lon: float) -> Optional[Place]:
+    [place] = await self.reverse_geocode_many([(lat, lon)])
+    return place
+
+  async def reverse_geocode_many(self, coordinates: Sequence[tuple[float, float]]) -> list[Optional[Place]]:
+    """Look up a batch of (lat, lon) in one vectorized gazetteer query"""
+    if self.gazetteer is None:
+      return [await self.nominatim(lat, lon) for lat, lon in coordinates]
+    places = self.gazetteer.lookup_many(coordinates, self.max_distance_km)
+    if self.fallback:
+      for i, (lat, lon) in enumerate(coordinates):
+        if places[i] is None:
+          places[i] = await self.nominatim(lat, lon)
+    return places
+
+  async def _wait_turn(self) -> None:
+    async with self._throttle:
+      loop = asyncio.get_running_loop()
+      delay = self._next_request - loop.time()
+      if delay > 0:
+        await asyncio.sleep(delay)
+      self._next_request = loop.time() + self.min_interval
+
+  async def nominatim(self, lat: float, lon: float) -> Optional[Place]:
+    if self._client is None:
+      self._client = httpx.AsyncClient(
+        headers={'User-Agent': 'PhotoDisplay/1.0'},
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=4)
+      )
     params = {
       'format': 'jsonv2',
       'lat': lat,
       'lon': lon
     }
-    async with httpx.AsyncClient() as client:
-      headers = {'User-Agent': 'PhotoDisplay/1.0'}
-      response = await client.get('https://nominatim.openstreetmap.org/reverse', params=params, headers=headers, timeout=10.0)
-      if response.status_code != 200:
-        return None
-      data = response.json()
-      address = data.get('address', {})
-      label = data.get('display_name')
-      country = address.get('country')
-      if not label:
-        return None
-      return Place(label=label, country=country)
+    await self._wait_turn()
+    response = await self._client.get(NOMINATIM_URL, params=params)
+    if response.status_code == 429 or response.status_code >= 500:
+      # Transient: fail the stage so it is retried, rather than cache "no place".
+      response.raise_for_status()
+    if response.status_code != 200:
+      return None
+    data = response.json()
+    address = data.get('address', {})
+    label = data.get('display_name')
+    country = address.get('country')
+    if not label:
+      return None
+    return Place(label=label, country=country)
+
+  async def aclose(self) -> None:
+    if self._client is not None:
+      await self._client.aclose()
+      self._client = None
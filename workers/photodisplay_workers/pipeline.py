@@ -0,0 +1,273 @@
+import asyncio
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, Optional, Sequence
+
+from PIL import Image
+
+from .ai_caption_worker import AiCaptionWorker
+from .derivative_worker import DerivativeWorker, Variant
+from .exif_worker import ExifResult, extract_exif, read_exif_header
+from .geocode_worker import GeocodeWorker
+
+PHOTO_STAGES = ('exif', 'geocode', 'derivative', 'caption')
+
+Store = Callable[[str, bytes, str], Awaitable[None]]
+Fetch = Callable[[str], Awaitable[bytes]]
+FetchRange = Callable[[str, int], Awaitable[bytes]]
+
+
+@dataclass
+class PhotoTask:
+  photo_id: str
+  storage_key: str
+  stages: Sequence[str] = PHOTO_STAGES
+  sizes: Optional[list[int]] = None
+  language: str = 'en'
+  # sha256 of the original, when the API knows it; keys the caption cache.
+  digest: Optional[str] = None
+  # Results already known for these bytes (e.g. from the blob), keyed by stage.
+  known: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class PhotoContext:
+  """Everything the stages of one photo share: the original is fetched and decoded at most once"""
+  task: PhotoTask
+  fetch: Fetch
+  fetch_range: Optional[FetchRange] = None
+  results: dict[str, Any] = field(default_factory=dict)
+  _payload: Optional[bytes] = None
+  _fetching: asyncio.Lock = field(default_factory=asyncio.Lock)
+  _frame: Optional[Image.Image] = None
+  _decoding: asyncio.Lock = field(default_factory=asyncio.Lock)
+  # A caption-sized JPEG rendered alongside the variants in the process pool
+  caption_image: Optional[bytes] = None
+
+  async def payload(self) -> bytes:
+    async with self._fetching:
+      if self._payload is None:
+        self._payload = await self.fetch(self.task.storage_key)
+      return self._payload
+
+  async def prefix(self, length: int) -> bytes:
+    """The original's first length bytes, with a ranged read unless it is already here"""
+    if self._payload is not None or self.fetch_range is None:
+      return (await self.payload())[:length]
+    return await self.fetch_range(self.task.storage_key, length)
+
+  async def frame(self, decode: Callable[[bytes], Image.Image]) -> Image.Image:
+    payload = await self.payload()
+    async with self._decoding:
+      if self._frame is None:
+        self._frame = await asyncio.to_thread(decode, payload)
+      return self._frame
+
+
+@dataclass
+class Stage:
+  name: str
+  run: Callable[[PhotoContext], Awaitable[Any]]
+  after: tuple[str, ...] = ()
+
+
+@dataclass
+class PipelineResult:
+  photo_id: str
+  results: dict[str, Any]
+  errors: dict[str, str]
+  skipped: list[str]
+  timings: dict[str, float]
+
+  @property
+  def status(self) -> str:
+    return 'error' if self.errors or self.skipped else 'ready'
+
+
+class PipelineRunner:
+  """Runs a DAG of stages for one photo, each as soon as its dependencies finish.
+
+  A stage that fails marks every stage downstream of it as skipped; stages on
+  other branches still run. Dependencies outside the requested stages do not
+  hold a stage back, it reads whatever was seeded into the context instead.
+  """
+
+  def __init__(self, stages: Iterable[Stage]) -> None:
+    self.stages: dict[str, Stage] = {}
+    for stage in stages:
+      missing = [name for name in stage.after if name not in self.stages]
+      if missing:
+        raise ValueError(f'Stage {stage.name} must come after {missing}')
+      self.stages[stage.name] = stage
+
+  async def run(self, context: PhotoContext, only: Optional[Iterable[str]] = None) -> PipelineResult:
+    selected = set(self.stages if only is None else only)
+    errors: dict[str, str] = {}
+    skipped: list[str] = []
+    timings: dict[str, float] = {}
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def execute(stage: Stage) -> bool:
+      for name in stage.after:
+        if name in tasks and not await tasks[name]:
+          skipped.append(stage.name)
+          return False
+      start = time.perf_counter()
+      try:
+        context.results[stage.name] = await stage.run(context)
+        return True
+      except Exception as e:
+        errors[stage.name] = f'{type(e).__name__}: {e}'
+        return False
+      finally:
+        timings[stage.name] = time.perf_counter() - start
+
+    # Stages are declared after their dependencies, so each task can await them.
+    for name, stage in self.stages.items():
+      if name in selected:
+        tasks[name] = asyncio.create_task(execute(stage))
+    await asyncio.gather(*tasks.values())
+    return PipelineResult(context.task.photo_id, context.results, errors, skipped, timings)
+
+
+def caption_jpeg(worker: DerivativeWorker, frame: Image.Image, size: int) -> bytes:
+  frame = frame.copy()
+  frame.thumbnail((size, size))
+  return worker.encode(frame, size).data
+
+
+def render_in_pool(
+  worker: DerivativeWorker, payload: bytes, caption_size: Optional[int] = None
+) -> tuple[list[Variant], str, Optional[bytes]]:
+  """Variants, placeholder and, with caption_size, the caption's JPEG from one decode.
+
+  Runs in the process pool, so the frame never comes back to be decoded again.
+  """
+  sizes = [*worker.sizes, caption_size] if caption_size else worker.sizes
+  frame = DerivativeWorker(sizes=sizes).decode(payload)
+  image = caption_jpeg(worker, frame, caption_size) if caption_size else None
+  variants = worker.render(frame)
+  # render() leaves the frame at the smallest size, a cheap LQIP source.
+  return variants, worker.placeholder(frame), image
+
+
+def photo_pipeline(
+  derivatives: DerivativeWorker,
+  geocoder: GeocodeWorker,
+  captioner: Optional[AiCaptionWorker],
+  store: Store,
+  executor: Optional[Executor] = None
+) -> PipelineRunner:
+  """EXIF -> GEOCODE and DERIVATIVE -> CAPTION over one shared original.
+
+  EXIF reads only the leading metadata of a JPEG, so it and geocoding don't
+  wait for the full original. With an executor (a process pool), EXIF
+  parsing and rendering run there instead of on threads over the shared
+  decoded frame. Without a captioner the caption stage is left out.
+  """
+
+  async def offload(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+  def decoder(context: PhotoContext) -> Callable[[bytes], Image.Image]:
+    """Decodes the shared frame large enough for every stage of this run that reads it"""
+    sizes = list(context.task.sizes or derivatives.sizes)
+    if captioner is not None and 'caption' in context.task.stages:
+      sizes.append(captioner.image_size)
+    return DerivativeWorker(sizes=sizes).decode
+
+  async def exif(context: PhotoContext) -> ExifResult:
+    header = await read_exif_header(context.prefix)
+    return await offload(extract_exif, header if header is not None else await context.payload())
+
+  async def geocode(context: PhotoContext):
+    gps = context.results['exif']
+    if not gps.has_gps:
+      return None
+    return await geocoder.reverse_geocode(gps.lat, gps.lon)
+
+  def needs_caption_image(context: PhotoContext, worker: DerivativeWorker) -> bool:
+    """Whether the caption stage will run without a JPEG variant covering its size"""
+    if captioner is None or 'caption' not in context.task.stages:
+      return False
+    return 'JPEG' not in worker.formats or max(worker.sizes) < captioner.image_size
+
+  async def derivative(context: PhotoContext) -> tuple[list[Variant], str]:
+    worker = DerivativeWorker(sizes=context.task.sizes or derivatives.sizes, formats=derivatives.formats)
+    if executor is not None:
+      caption_size = captioner.image_size if needs_caption_image(context, worker) else None
+      variants, placeholder, context.caption_image = await offload(
+        render_in_pool, worker, await context.payload(), caption_size
+      )
+    else:
+      frame = await context.frame(decoder(context))
+      # render() resizes the frame in place, so work on a copy of the shared one.
+      frame = frame.copy()
+      variants = await asyncio.to_thread(worker.render, frame)
+      placeholder = await asyncio.to_thread(worker.placeholder, frame)
+    key = context.task.storage_key
+    await asyncio.gather(*(store(variant.key(key), variant.data, variant.content_type) for variant in variants))
+    return variants, placeholder
+
+  async def caption(context: PhotoContext):
+    size = captioner.image_size
+    variants, _ = context.results.get('derivative', ([], None))
+    # The smallest JPEG variant that still covers the caption size; the
+    # captioner downscales it further if needed.
+    covering = sorted(
+      (variant for variant in variants if variant.format == 'JPEG' and variant.size >= size),
+      key=lambda variant: variant.size
+    )
+    if covering:
+      image = covering[0].data
+    elif context.caption_image is not None:
+      image = context.caption_image
+    else:
+      # Uploads render only small variants, or none were rendered by this run;
+      # caption from the shared frame rather than an undersized thumbnail.
+      image = await asyncio.to_thread(caption_jpeg, derivatives, await context.frame(decoder(context)), size)
+    return await captioner.generate_caption(image, language=context.task.language, digest=context.task.digest)
+
+  stages = [
+    Stage('exif', exif),
+    Stage('geocode', geocode, after=('exif',)),
+    Stage('derivative', derivative),
+  ]
+  if captioner is not None:
+    stages.append(Stage('caption', caption, after=('derivative',)))
+  return PipelineRunner(stages)
+
+
+async def process_photo(
+  runner: PipelineRunner, task: PhotoTask, fetch: Fetch, fetch_range: Optional[FetchRange] = None
+) -> PipelineResult:
+  """Run the requested stages, fetching the original at most once and only if a stage needs it"""
+  context = PhotoContext(task=task, fetch=fetch, fetch_range=fetch_range)
+  if 'exif' in task.known:
+    context.results['exif'] = ExifResult.from_record(task.known['exif'])
+  result = await runner.run(context, only=task.stages)
+  timings = ' '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in result.timings.items())
+  print(f"Photo {task.photo_id} {result.status}: {timings}")
+  return result
+
+
+def photo_record(result: PipelineResult, storage_key: str) -> dict:
+  """The pipeline's results in the shape the API stores on the photo"""
+  record: dict[str, Any] = {
+    'status': result.status,
+    'errors': result.errors,
+    'timings': result.timings
+  }
+  if 'exif' in result.results:
+    record['exif'] = result.results['exif'].describe()
+  if result.results.get('geocode') is not None:
+    place = result.results['geocode']
+    record['place'] = {'label': place.label, 'country': place.country}
+  if 'derivative' in result.results:
+    variants, placeholder = result.results['derivative']
+    record['variants'] = [variant.describe(storage_key) for variant in variants]
+    record['placeholder'] = placeholder
+  if 'caption' in result.results:
+    record['caption'] = result.results['caption'].caption
+  return record
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional, Protocol, Sequence
+
+from .ai_caption_worker import CAPTION_IMAGE_SIZE, AiCaptionWorker
+from .derivative_worker import DerivativeWorker, default_pool_size
+from .geocode_cache import GeocodeCache, SqlitePlaceStore
+from .geocode_worker import GeocodeWorker
+from .pipeline import PhotoTask, PipelineRunner, Stage, photo_pipeline, photo_record, process_photo
+
+DEFAULT_SOURCE = 'app.queues.source:create_job_source'
+
+
+class JobSource(Protocol):
+  """Where jobs come from and results go; the API provides one backed by its jobs table"""
+  async def start(self) -> None: ...
+  async def claim(self, limit: int) -> Sequence[Any]: ...
+  async def wait(self) -> None: ...
+  async def task(self, job: Any) -> Optional[dict]: ...
+  async def fetch(self, key: str) -> bytes: ...
+  async def fetch_range(self, key: str, length: int) -> bytes: ...
+  async def store(self, key: str, data: bytes, content_type: str) -> None: ...
+  async def complete(self, job: Any) -> bool: ...
+  async def save(self, job: Any, record: dict) -> bool: ...
+  async def retry(
+    self, job: Any, delay_seconds: float, error: str,
+    record: Optional[dict] = None, stages: Optional[list[str]] = None
+  ) -> bool: ...
+  async def dead_letter(self, job: Any, error: str, record: Optional[dict] = None) -> bool: ...
+  async def close(self) -> None: ...
+
+
+def limit_stages(runner: PipelineRunner, limits: dict[str, int]) -> PipelineRunner:
+  """Cap how many of each stage run at once across all in-flight photos"""
+  def limited(stage: Stage) -> Stage:
+    if stage.name not in limits:
+      return stage
+    semaphore = asyncio.Semaphore(limits[stage.name])
+
+    async def run(context):
+      async with semaphore:
+        return await stage.run(context)
+    return Stage(stage.name, run, stage.after)
+
+  return PipelineRunner(limited(stage) for stage in runner.stages.values())
+
+
+def backoff_delay(attempts: int, base: float, cap: float) -> float:
+  """Exponential backoff with full jitter, so failed jobs don't retry in lockstep"""
+  return random.uniform(0, min(cap, base * 2 ** max(attempts - 1, 0)))
+
+
+class WorkerRuntime:
+  """Claims jobs from a source and runs them until stopped.
+
+  Up to max_in_flight jobs are processed concurrently on the event loop; a
+  failed job is retried with backoff and parked in the dead-letter table once
+  it has been attempted max_attempts times. A retry keeps the stages that
+  succeeded and runs again only the ones that failed or were skipped. stop() lets in-flight jobs finish
+  for up to shutdown_timeout seconds and releases the rest for other workers.
+  """
+
+  def __init__(
+    self,
+    source: JobSource,
+    runner: PipelineRunner,
+    max_in_flight: int = 32,
+    max_attempts: int = 5,
+    backoff_base: float = 2.0,
+    backoff_max: float = 300.0,
+    shutdown_timeout: float = 30.0
+  ) -> None:
+    self.source = source
+    self.runner = runner
+    self.max_in_flight = max_in_flight
+    self.max_attempts = max_attempts
+    self.backoff_base = backoff_base
+    self.backoff_max = backoff_max
+    self.shutdown_timeout = shutdown_timeout
+    self.handlers = {'process': self.process}
+    self._stopping = asyncio.Event()
+    self._in_flight: set[asyncio.Task] = set()
+
+  def stop(self) -> None:
+    self._stopping.set()
+
+  async def run(self) -> None:
+    stopping = asyncio.ensure_future(self._stopping.wait())
+    try:
+      while not self._stopping.is_set():
+        capacity = self.max_in_flight - len(self._in_flight)
+        jobs = await self.source.claim(capacity) if capacity > 0 else []
+        for job in jobs:
+          task = asyncio.create_task(self.handle(job))
+          self._in_flight.add(task)
+          task.add_done_callback(self._in_flight.discard)
+        if jobs:
+          continue
+        # Full: wait for a slot. Idle: wait for new jobs. Either way, or a stop.
+        waiter = asyncio.ensure_future(self.source.wait()) if capacity > 0 else None
+        await asyncio.wait(
+          {stopping, *([waiter] if waiter else self._in_flight)},
+          return_when=asyncio.FIRST_COMPLETED
+        )
+        if waiter is not None and not waiter.done():
+          waiter.cancel()
+    finally:
+      stopping.cancel()
+      await self.drain()
+
+  async def drain(self) -> None:
+    if not self._in_flight:
+      return
+    _, pending = await asyncio.wait(set(self._in_flight), timeout=self.shutdown_timeout)
+    for task in pending:
+      task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+  async def handle(self, job: Any) -> None:
+    try:
+      if job.attempts > self.max_attempts:
+        # Claimed again after its worker died mid-job, every time
+        await self.source.dead_letter(job, job.last_error or 'Worker lost the job repeatedly')
+        return
+      handler = self.handlers.get(job.type)
+      if handler is None:
+        await self.source.dead_letter(job, f'Unknown job type {job.type}')
+        return
+      await handler(job)
+    except asyncio.CancelledError:
+      await asyncio.shield(self.source.retry(job, 0, 'Worker shut down'))
+      raise
+    except Exception as e:
+      await self.fail(job, f'{type(e).__name__}: {e}')
+
+  async def fail(
+    self, job: Any, error: str, record: Optional[dict] = None, stages: Optional[list[str]] = None
+  ) -> None:
+    if job.attempts >= self.max_attempts:
+      print(f"Job {job.id} dead-lettered after {job.attempts} attempts: {error}")
+      await self.source.dead_letter(job, error, record)
+      return
+    delay = backoff_delay(job.attempts, self.backoff_base, self.backoff_max)
+    await self.source.retry(job, delay, error, record, stages)
+
+  async def process(self, job: Any) -> None:
+    fields = await self.source.task(job)
+    if fields is None:
+      # The photo was deleted while the job waited
+      await self.source.complete(job)
+      return
+    task = PhotoTask(**fields)
+    result = await process_photo(self.runner, task, self.source.fetch, self.source.fetch_range)
+    record = photo_record(result, task.storage_key)
+    if result.status == 'ready':
+      await self.source.save(job, record)
+    else:
+      error = '; '.join(f'{name}: {error}' for name, error in result.errors.items())
+      # What failed, and what it held back; the rest is saved with the record.
+      remaining = [name for name in task.stages if name in result.errors or name in result.skipped]
+      await self.fail(job, error, record, remaining)
+
+
+def load(target: str) -> Any:
+  """Resolve a 'module:attribute' import string"""
+  module, _, attribute = target.partition(':')
+  return getattr(importlib.import_module(module), attribute)
+
+
+def parse_limits(values: Sequence[str]) -> dict[str, int]:
+  limits = {}
+  for value in values:
+    name, _, count = value.partition('=')
+    limits[name] = int(count)
+  return limits
+
+
+async def serve(args: argparse.Namespace) -> None:
+  source: JobSource = load(args.source)()
+  processes = args.processes or default_pool_size()
+  # CPU-bound stages default to one at a time per pool process; the I/O-bound
+  # ones multiplex on the event loop, bounded by what the remote services take.
+  # Geocoding needs no limit: the geocoder paces its own Nominatim requests.
+  # The caption limit caps model calls inside the captioner, so cache hits
+  # don't wait behind them.
+  limits = {'exif': processes, 'derivative': processes}
+  limits.update(parse_limits(args.concurrency))
+  caption_calls = limits.pop('caption', 8)
+  gazetteer = None
+  if args.gazetteer:
+    from .gazetteer import Gazetteer
+    gazetteer = Gazetteer.load(args.gazetteer)
+    print(f"Loaded {len(gazetteer.labels)} places from {args.gazetteer}")
+  if args.geocode_store:
+    store = load(args.geocode_store)()
+  elif args.geocode_cache:
+    store = SqlitePlaceStore(args.geocode_cache)
+  else:
+    store = None
+  cache = GeocodeCache(store, precision=args.geocode_precision)
+
+  with ProcessPoolExecutor(max_workers=processes) as pool:
+    captioner = None
+    if args.caption_client:
+      captioner = AiCaptionWorker(
+        load(args.caption_client)(),
+        image_size=args.caption_size,
+        max_in_flight=caption_calls,
+        batch_size=args.caption_batch_size,
+        batch_window=args.caption_batch_window_ms / 1000
+      )
+    geocoder = GeocodeWorker(gazetteer=gazetteer, fallback=args.geocode_fallback, cache=cache)
+    runner = photo_pipeline(DerivativeWorker(), geocoder, captioner, source.store, executor=pool)
+    runtime = WorkerRuntime(
+      source,
+      limit_stages(runner, limits),
+      max_in_flight=args.max_in_flight,
+      max_attempts=args.max_attempts,
+      shutdown_timeout=args.shutdown_timeout
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+      loop.add_signal_handler(sig, runtime.stop)
+
+    await source.start()
+    print(f"Worker {os.getpid()} running with {processes} processes, limits {limits}, {caption_calls} caption calls")
+    try:
+      await runtime.run()
+    finally:
+      await geocoder.aclose()
+      await source.close()
+  print(f"Worker {os.getpid()} stopped")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+  parser = argparse.ArgumentParser(prog='photodisplay-worker')
+  parser.add_argument('--source', default=os.environ.get('PHOTODISPLAY_JOB_SOURCE', DEFAULT_SOURCE),
+                      help='module:factory returning the JobSource')
+  parser.add_argument('--caption-client', default=os.environ.get('PHOTODISPLAY_CAPTION_CLIENT'),
+                      help='module:factory returning the vision model client; captions are skipped without one')
+  parser.add_argument('--caption-size', type=int, default=CAPTION_IMAGE_SIZE,
+                      help='longest side of the image sent to the vision model')
+  parser.add_argument('--caption-batch-size', type=int, default=16,
+                      help='images per batched model call, for clients with generate_captions; 1 disables batching')
+  parser.add_argument('--caption-batch-window-ms', type=float, default=200,
+                      help='longest a caption waits for its batch to fill')
+  parser.add_argument('--gazetteer', default=os.environ.get('PHOTODISPLAY_GAZETTEER'),
+                      help='GeoNames dump (e.g. cities500.txt) for offline reverse geocoding')
+  parser.add_argument('--no-geocode-fallback', dest='geocode_fallback', action='store_false',
+                      help='with --gazetteer, never ask Nominatim about places it does not know')
+  parser.add_argument('--geocode-precision', type=int, default=7,
+                      help='geohash length of a geocode cache cell; 7 is about 150 m, 6 about 1 km')
+  store = parser.add_mutually_exclusive_group()
+  store.add_argument('--geocode-cache', default=os.environ.get('PHOTODISPLAY_GEOCODE_CACHE'),
+                     help='SQLite file that keeps geocoded cells across restarts')
+  store.add_argument('--geocode-store', default=os.environ.get('PHOTODISPLAY_GEOCODE_STORE'),
+                     help='module:factory returning a shared PlaceStore, e.g. app.queues.geocode_cache:create_geocode_store')
+  parser.add_argument('--processes', type=int, default=0, help='process pool size for CPU-bound stages')
+  parser.add_argument('--concurrency', action='append', default=[], metavar='STAGE=N',
+                      help='in-flight limit for a stage, e.g. caption=16')
+  parser.add_argument('--max-in-flight', type=int, default=32)
+  parser.add_argument('--max-attempts', type=int, default=5)
+  parser.add_argument('--shutdown-timeout', type=float, default=30.0)
+  asyncio.run(serve(parser.parse_args(argv)))
@@ -0,0 +1,107 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from photodisplay_workers.ai_caption_worker import (
+    AiCaptionWorker, CaptionInputError, CaptionResult, FakeBatchCaptionClient
+)
+
+
+def _jpeg(width, height=None):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height or width), 'olive').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class RecordingClient(FakeBatchCaptionClient):
+    """Records the size of every batch call"""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.batches = []
+
+    async def generate_captions(self, prompt, images, language='en'):
+        self.batches.append(len(images))
+        return await super().generate_captions(prompt, images, language)
+
+
+class StrictClient(RecordingClient):
+    """Rejects a whole call when any image in it is bad, like an API answering 400"""
+
+    async def generate_captions(self, prompt, images, language='en'):
+        results = await super().generate_captions(prompt, images, language)
+        if any(isinstance(result, Exception) for result in results):
+            raise CaptionInputError('invalid image in request')
+        return results
+
+
+class UnavailableClient(RecordingClient):
+    async def generate_captions(self, prompt, images, language='en'):
+        self.batches.append(len(images))
+        raise TimeoutError('model timed out')
+
+
+def _caption_all(worker, images, language='en'):
+    async def scenario():
+        return await asyncio.gather(
+            *(worker.generate_caption(image, language=language) for image in images), return_exceptions=True
+        )
+
+    return asyncio.run(scenario())
+
+
+def test_full_batches_go_out_without_waiting_for_the_window():
+    client = RecordingClient()
+    worker = AiCaptionWorker(client, batch_size=4, batch_window=60)
+    results = _caption_all(worker, [_jpeg(100 + index) for index in range(8)])
+    assert client.batches == [4, 4]
+    assert results[5] == CaptionResult('A 105x105 photo (en)')
+
+
+def test_partial_batch_is_sent_after_the_window():
+    client = RecordingClient()
+    worker = AiCaptionWorker(client, batch_size=16, batch_window=0.01)
+    results = _caption_all(worker, [_jpeg(100), _jpeg(200)], language='fr')
+    assert client.batches == [2]
+    assert [result.caption for result in results] == ['A 100x100 photo (fr)', 'A 200x200 photo (fr)']
+
+
+def test_bad_image_fails_alone():
+    client = RecordingClient()
+    worker = AiCaptionWorker(client, batch_size=4, batch_window=1)
+    results = _caption_all(worker, [_jpeg(100), _jpeg(101), _jpeg(102)[:-100], _jpeg(103)])
+    assert client.batches == [4]
+    assert isinstance(results[2], OSError)
+    assert [result.caption for result in results[:2] + results[3:]] == [
+        'A 100x100 photo (en)', 'A 101x101 photo (en)', 'A 103x103 photo (en)'
+    ]
+
+
+def test_rejected_batch_is_bisected_to_the_bad_image():
+    client = StrictClient()
+    worker = AiCaptionWorker(client, batch_size=8, batch_window=1)
+    images = [_jpeg(100 + index) for index in range(8)]
+    images[5] = images[5][:-100]
+    results = _caption_all(worker, images)
+
+    assert isinstance(results[5], CaptionInputError)
+    assert all(isinstance(result, CaptionResult) for index, result in enumerate(results) if index != 5)
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1, not one call per image.
+    assert client.batches == [8, 4, 4, 2, 2, 1, 1]
+
+
+def test_unavailable_model_fails_the_batch_without_fanning_out():
+    client = UnavailableClient()
+    worker = AiCaptionWorker(client, batch_size=4, batch_window=0.01)
+    images = [_jpeg(100 + index) for index in range(4)]
+
+    async def scenario():
+        first = await asyncio.gather(*(worker.generate_caption(image) for image in images), return_exceptions=True)
+        # Nothing failed is cached; a retry asks the model again.
+        again = await asyncio.gather(worker.generate_caption(images[0]), return_exceptions=True)
+        return first + again
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert client.batches == [4, 1]
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from photodisplay_workers.backfill import Backfill, Checkpoint, Original
+from photodisplay_workers.pipeline import PipelineRunner, Stage
+
+
+class MemorySink:
+    def __init__(self, fail_on=None):
+        self.saved = []
+        self.fail_on = fail_on
+
+    async def save(self, records, user_id=None):
+        if self.fail_on is not None and len(self.saved) == self.fail_on:
+            raise ConnectionError('database went away')
+        self.saved.append([record['storage_key'] for record in records])
+        return len(records)
+
+
+def _backfill(sink, tmp_path):
+    async def noop(context):
+        await asyncio.sleep(0)
+
+    async def fetch(key):
+        return b''
+
+    return Backfill(
+        sink,
+        PipelineRunner([Stage('noop', noop)]),
+        Checkpoint(tmp_path / 'checkpoint'),
+        fetch,
+        stages=('noop',),
+        batch_size=3,
+        max_in_flight=2
+    )
+
+
+def _originals(count):
+    return [Original(key=f'photos/{index}.jpg', size=10) for index in range(count)]
+
+
+def test_checkpoints_saved_batches(tmp_path):
+    sink = MemorySink()
+    throughput = asyncio.run(_backfill(sink, tmp_path).run(_originals(7)))
+
+    assert [len(batch) for batch in sink.saved] == [3, 3, 1]
+    assert Checkpoint(tmp_path / 'checkpoint').load() == {original.key for original in _originals(7)}
+    assert (throughput.photos, throughput.failed) == (7, 0)
+
+
+def test_failed_save_aborts_the_run(tmp_path):
+    sink = MemorySink(fail_on=1)
+    job = _backfill(sink, tmp_path)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(job.run(_originals(10)))
+
+    # Only the batch that was saved is checkpointed; the failed one is counted.
+    assert Checkpoint(tmp_path / 'checkpoint').load() == set(sink.saved[0])
+    assert job.throughput.failed == 3
+    assert job.throughput.photos == len(sink.saved[0])
@@ -0,0 +1,147 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from photodisplay_workers.derivative_worker import EXTENSIONS, DerivativeWorker, supported_formats
+
+
+def _png(width, height):
+    # PNG has no draft mode, so a big one is slow to decode in full.
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 60).convert('RGB').save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def _pulled(payloads, pulls):
+    for key, payload in payloads:
+        pulls.append(key)
+        yield key, payload
+
+
+def test_memory_budget_serializes_large_originals():
+    payloads = [(key, _png(1200, 900)) for key in range(4)]
+    worker = DerivativeWorker(sizes=[64], formats=['JPEG'], max_workers=4, memory_budget_mb=10)
+    # Each decode is estimated at about 6.5 MB, so two never fit together.
+    assert 5 * 2**20 < worker.estimate_memory(payloads[0][1]) < worker.memory_budget < 2 * 6 * 2**20
+
+    pulls, seen = [], []
+    for result in worker.generate_stream(_pulled(payloads, pulls)):
+        # At most the finished job and the next one waiting for room were pulled.
+        seen.append((result.key, len(pulls)))
+
+    assert [key for key, _ in seen] == [0, 1, 2, 3]
+    assert all(pulled <= key + 2 for key, pulled in seen)
+
+
+def test_unbounded_budget_reads_ahead():
+    payloads = [(key, _png(64, 48)) for key in range(6)]
+    worker = DerivativeWorker(sizes=[32], formats=['JPEG'], max_workers=2)
+    pulls = []
+    first = next(worker.generate_stream(_pulled(payloads, pulls)))
+
+    assert first.error is None
+    assert len(pulls) == 4  # max_workers * 2 submitted before the first wait
+
+
+def test_corrupt_original_fails_only_its_own_result():
+    good = _png(320, 240)
+    payloads = [('a', good), ('broken', good[:len(good) // 3]), ('b', good)]
+    worker = DerivativeWorker(sizes=[128], formats=['JPEG'], max_workers=2)
+
+    results = {result.key: result for result in worker.generate_stream(payloads)}
+
+    assert isinstance(results['broken'].error, OSError) and results['broken'].variants == []
+    for key in ('a', 'b'):
+        assert results[key].error is None
+        assert [(variant.width, variant.height) for variant in results[key].variants] == [(128, 96)]
+    with pytest.raises(OSError):
+        worker.generate_many([good, good[:len(good) // 3]])
+
+
+def test_results_are_keyed_when_they_complete_out_of_order():
+    payloads = [('large', _png(4000, 3000)), ('small', _png(40, 30)), ('tall', _png(30, 60))]
+    worker = DerivativeWorker(sizes=[256], formats=['JPEG'], max_workers=3)
+
+    order = []
+    sizes = {}
+    for result in worker.generate_stream(payloads):
+        order.append(result.key)
+        [variant] = result.variants
+        sizes[result.key] = (variant.width, variant.height)
+
+    # The large original finishes last, yet each result carries its own key.
+    assert order[-1] == 'large'
+    assert sizes == {'large': (256, 192), 'small': (40, 30), 'tall': (30, 60)}
+
+    # generate_many puts them back in input order.
+    batch = worker.generate_many([payload for _, payload in payloads])
+    assert [(variants[0].width, variants[0].height) for variants in batch] == [(256, 192), (40, 30), (30, 60)]
+
+
+def test_variants_cover_every_size_and_available_format():
+    worker = DerivativeWorker(sizes=[512, 128], formats=['jpeg', 'webp', 'avif'])
+    assert worker.formats == [fmt for fmt in ('JPEG', 'WEBP', 'AVIF') if fmt in supported_formats()]
+
+    variants = worker.generate(_png(1600, 1200))
+
+    assert [(variant.size, variant.format) for variant in variants] == [
+        (size, fmt) for size in (512, 128) for fmt in worker.formats
+    ]
+    for variant in variants:
+        with Image.open(io.BytesIO(variant.data)) as image:
+            assert image.format == variant.format
+            assert image.size == (variant.width, variant.height) == (variant.size, variant.size * 3 // 4)
+        assert variant.content_type == f'image/{variant.format.lower()}'
+        assert variant.describe('user-1/abc.jpg') == {
+            'size': variant.size,
+            'format': variant.format.lower(),
+            'width': variant.width,
+            'height': variant.height,
+            'bytes': len(variant.data),
+            'key': f'user-1/abc/{variant.size}.{EXTENSIONS[variant.format]}'
+        }
+
+
+def test_missing_encoders_fall_back_to_jpeg(monkeypatch):
+    for fmt in ('WEBP', 'AVIF'):
+        monkeypatch.delitem(Image.SAVE, fmt, raising=False)
+    # Image.init() would register the plugins again.
+    monkeypatch.setattr(Image, 'init', lambda: None)
+
+    worker = DerivativeWorker(sizes=[64], formats=['avif', 'webp', 'jpeg'])
+    assert worker.formats == ['JPEG']
+    [variant] = worker.generate(_png(320, 240))
+    assert variant.content_type == 'image/jpeg' and variant.data.startswith(b'\xff\xd8')
+    assert DerivativeWorker(formats=['webp']).formats == ['JPEG']
+
+
+def _data_uri_image(uri):
+    header, encoded = uri.split(',', 1)
+    with Image.open(io.BytesIO(base64.b64decode(encoded))) as image:
+        return header, image.format, image.size
+
+
+@pytest.mark.parametrize('size, expected', [((4000, 3000), (32, 24)), ((300, 1200), (8, 32)), ((20, 10), (20, 10))])
+def test_placeholder_is_a_small_data_uri_with_the_same_aspect(size, expected):
+    frame = Image.effect_noise(size, 90).convert('RGB')
+    uri = DerivativeWorker().placeholder(frame)
+
+    header, fmt, dimensions = _data_uri_image(uri)
+    expected_format = 'WEBP' if 'WEBP' in supported_formats() else 'JPEG'
+    assert (header, fmt) == (f'data:image/{expected_format.lower()};base64', expected_format)
+    assert dimensions == expected
+    # Small enough to inline in every list row.
+    assert len(uri) < 512
+    assert frame.size == size
+
+
+def test_placeholder_comes_with_the_variants_and_falls_back_to_jpeg(monkeypatch):
+    variants, uri = DerivativeWorker(sizes=[256]).generate_with_placeholder(_png(1600, 1200))
+    assert variants and _data_uri_image(uri)[2] == (32, 24)
+
+    monkeypatch.delitem(Image.SAVE, 'WEBP', raising=False)
+    monkeypatch.setattr(Image, 'init', lambda: None)
+    header, fmt, dimensions = _data_uri_image(DerivativeWorker().placeholder(Image.new('RGB', (400, 300), 'teal')))
+    assert (header, fmt, dimensions) == ('data:image/jpeg;base64', 'JPEG', (32, 24))
@@ -0,0 +1,105 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from photodisplay_workers.exif_worker import EXIF_HEADER_BYTES, ExifResult, extract_exif, extract_gps, read_exif_header
+
+
+def _exif(taken='2024:05:01 12:30:00'):
+    exif = Image.Exif()
+    exif[0x010F] = 'Canon'
+    exif[0x0110] = 'EOS R5'
+    exif[0x0112] = 6
+    exif[0x8769] = {0x9003: taken, 0x9011: '+01:00'}
+    exif[0x8825] = {1: 'N', 2: (38.0, 43.0, 20.28), 3: 'W', 4: (9.0, 8.0, 21.48)}
+    return exif
+
+
+def _photo(size=(1600, 1200), fmt='JPEG', **options):
+    # Noise keeps the file well past the first ranged read.
+    image = Image.effect_noise(size, 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def _ranged(data):
+    reads = []
+
+    async def read(length):
+        reads.append(length)
+        return data[:length]
+
+    return read, reads
+
+
+def _header(data):
+    read, reads = _ranged(data)
+    return asyncio.run(read_exif_header(read)), reads
+
+
+def test_ranged_header_parses_like_the_whole_file():
+    original = _photo(exif=_exif())
+    header, reads = _header(original)
+
+    assert reads == [EXIF_HEADER_BYTES] and len(header) < len(original)
+    result = extract_exif(header)
+    assert result == extract_exif(original)
+    assert result.describe() == {
+        'hasGps': True,
+        'lat': result.lat,
+        'lon': result.lon,
+        'capturedAt': '2024-05-01T12:30:00+01:00',
+        'orientation': 6,
+        'cameraMake': 'Canon',
+        'cameraModel': 'EOS R5',
+        'width': 1600,
+        'height': 1200
+    }
+    assert round(result.lat, 4) == 38.7223 and round(result.lon, 4) == -9.1393
+
+
+def test_large_icc_profile_costs_one_more_read():
+    original = _photo((3000, 2000), exif=_exif(), icc_profile=b'\x00' * 150_000)
+    header, reads = _header(original)
+
+    assert len(reads) == 2 and len(header) < len(original)
+    assert extract_exif(header) == extract_exif(original)
+    assert (extract_exif(header).width, extract_exif(header).height) == (3000, 2000)
+
+
+def test_other_formats_fall_back_to_the_whole_file():
+    original = _photo((320, 240), fmt='PNG')
+    header, reads = _header(original)
+
+    assert header is None and reads == [EXIF_HEADER_BYTES]
+    result = extract_exif(original)
+    assert (result.has_gps, result.width, result.height) == (False, 320, 240)
+
+
+def test_truncated_objects_do_not_loop_or_fail():
+    original = _photo((3000, 2000), exif=_exif(), icc_profile=b'\x00' * 150_000)
+    # The object ends inside the ICC profile's segments.
+    cut = original[:100_000]
+    header, reads = _header(cut)
+
+    # One read past the end finds nothing more, and the prefix is parsed as is.
+    assert header == cut and len(reads) == 3
+    result = extract_exif(header)
+    assert result.camera_make == 'Canon' and result.width is None
+    assert extract_exif(b'\xff\xd8').has_gps is False
+    assert _header(b'\xff\xd8')[0] == b'\xff\xd8'
+
+
+def test_unset_clock_has_no_capture_time():
+    result = extract_exif(_photo((64, 48), exif=_exif(taken='0000:00:00 00:00:00')))
+    assert result.captured_at is None
+    assert result.camera_make == 'Canon'
+
+
+def test_extract_gps_still_returns_the_location_alone():
+    original = _photo((64, 48), exif=_exif())
+    full = extract_exif(original)
+    assert extract_gps(original) == ExifResult(has_gps=True, lat=full.lat, lon=full.lon)
+    assert extract_gps(_photo((64, 48))) == ExifResult(has_gps=False)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from photodisplay_workers.gazetteer import Gazetteer, KDTree, to_unit_vectors
+from photodisplay_workers.geocode_worker import Place
+
+
+def _random_points(rng, count):
+    lats = np.degrees(np.arcsin(rng.uniform(-1, 1, count)))
+    return to_unit_vectors(lats, rng.uniform(-180, 180, count))
+
+
+def _brute_force(points, queries):
+    distances = np.sqrt(((queries[:, None, :] - points[None]) ** 2).sum(axis=-1))
+    return distances.min(axis=1)
+
+
+@pytest.mark.parametrize('count, leaf_size', [(1, 32), (33, 4), (1000, 8), (5000, 32)])
+@pytest.mark.parametrize('queries', [1, 31, 32, 700])
+def test_tree_matches_brute_force(count, leaf_size, queries):
+    # Fewer than SEARCH_BATCH queries take the depth-first path, more the batched one.
+    rng = np.random.default_rng(count + queries)
+    points = _random_points(rng, count)
+    # Duplicates and points on splitting planes must not be lost.
+    points[count // 2:count // 2 + count // 10] = points[0]
+    probes = np.concatenate([_random_points(rng, queries - 1), points[-1:]])
+    tree = KDTree(points, leaf_size=leaf_size)
+
+    distances, indices = tree.query(probes)
+    assert np.allclose(distances, _brute_force(points, probes))
+    assert np.allclose(np.linalg.norm(points[indices] - probes, axis=1), distances)
+    assert distances[-1] == 0
+
+
+def test_empty_gazetteer_finds_nothing():
+    gazetteer = Gazetteer([], [], [], [])
+    few = [(38.72, -9.14)] * 3
+    many = [(38.72, -9.14)] * 40
+    assert gazetteer.lookup_many([], 50) == []
+    assert gazetteer.lookup_many(few, 50) == [None] * 3
+    assert gazetteer.lookup_many(many, 1e9) == [None] * 40
+
+
+def test_lookup_respects_the_distance_limit():
+    gazetteer = Gazetteer([38.7223, 41.1579], [-9.1393, -8.6291], ['Lisbon', 'Porto'], ['Portugal', 'Portugal'])
+    assert gazetteer.lookup(38.75, -9.15, 50) == Place('Lisbon', 'Portugal')
+    assert gazetteer.lookup(41.0, -8.6, 50) == Place('Porto', 'Portugal')
+    assert gazetteer.lookup(48.85, 2.35, 50) is None
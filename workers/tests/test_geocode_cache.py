@@ -0,0 +1,92 @@
+import asyncio
+
+from photodisplay_workers.geocode_cache import GeocodeCache, SqlitePlaceStore, geohash, geohash_center
+from photodisplay_workers.geocode_worker import GeocodeWorker, Place
+
+LISBON = (38.7223, -9.1393)
+PORTO = (41.1579, -8.6291)
+FARO = (37.0194, -7.9304)
+
+
+class CountingLookup:
+    def __init__(self, places=None, delay=0.0):
+        self.places = places or {}
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, lat, lon):
+        self.calls.append((lat, lon))
+        await asyncio.sleep(self.delay)
+        return self.places.get(round(lat), Place(f'{lat:.2f},{lon:.2f}'))
+
+
+def test_geohash_center_is_inside_its_cell():
+    cell = geohash(*LISBON, 7)
+    assert cell.startswith('eycs')
+    assert geohash(*geohash_center(cell), 7) == cell
+
+
+def test_concurrent_misses_share_one_lookup():
+    cache = GeocodeCache(precision=6)
+    lookup = CountingLookup(delay=0.01)
+
+    async def scenario():
+        nearby = [(LISBON[0] + i * 1e-4, LISBON[1]) for i in range(20)]
+        return await asyncio.gather(*(cache.get(lat, lon, lookup) for lat, lon in nearby))
+
+    places = asyncio.run(scenario())
+    assert len(lookup.calls) == 1 and cache.lookups == 1
+    assert all(place is places[0] for place in places)
+
+
+def test_least_recently_used_cell_is_evicted():
+    cache = GeocodeCache(max_entries=2)
+    lookup = CountingLookup()
+
+    async def scenario():
+        for lat, lon in (LISBON, PORTO, LISBON, FARO, LISBON, PORTO):
+            await cache.get(lat, lon, lookup)
+
+    asyncio.run(scenario())
+    # Lisbon was used before Faro arrived, so Porto went and had to be looked up again.
+    assert len(lookup.calls) == 4
+    assert lookup.calls[-1] == geohash_center(geohash(*PORTO, 7))
+
+
+def test_backends_do_not_share_answers(tmp_path):
+    store = SqlitePlaceStore(str(tmp_path / 'geocode.sqlite'))
+    offline = CountingLookup(places={39: None})
+    online = CountingLookup(places={39: Place('Lisbon, Portugal', 'Portugal')})
+
+    async def scenario():
+        first = await GeocodeCache(store).get(*LISBON, offline, 'gazetteer')
+        second = await GeocodeCache(store).get(*LISBON, online, 'nominatim')
+        again = await GeocodeCache(store).get(*LISBON, online, 'nominatim')
+        return first, second, again
+
+    first, second, again = asyncio.run(scenario())
+    assert first is None
+    assert second == again == Place('Lisbon, Portugal', 'Portugal')
+    assert len(offline.calls) == 1 and len(online.calls) == 1
+
+
+def test_no_place_expires_but_places_persist(tmp_path):
+    store = SqlitePlaceStore(str(tmp_path / 'geocode.sqlite'))
+    nowhere = CountingLookup(places={39: None, 41: Place('Porto, Portugal', 'Portugal')})
+
+    async def scenario():
+        for _ in range(2):
+            cache = GeocodeCache(store, negative_ttl=0)
+            await cache.get(*LISBON, nowhere)
+            await cache.get(*LISBON, nowhere)
+            await cache.get(*PORTO, nowhere)
+
+    asyncio.run(scenario())
+    # Lisbon's "no place" is asked again on every get; Porto only the first time.
+    assert [round(lat) for lat, _ in nowhere.calls] == [39, 39, 41, 39, 39]
+
+
+def test_worker_keys_the_cache_by_backend():
+    assert GeocodeWorker().backend == 'nominatim'
+    assert GeocodeWorker(gazetteer=object(), fallback=False).backend == 'gazetteer'
+    assert GeocodeWorker(gazetteer=object()).backend == 'gazetteer+nominatim'
@@ -0,0 +1,95 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from photodisplay_workers.ai_caption_worker import AiCaptionWorker, FakeCaptionClient
+from photodisplay_workers.derivative_worker import DerivativeWorker
+from photodisplay_workers.geocode_worker import GeocodeWorker
+from photodisplay_workers.pipeline import PhotoTask, photo_pipeline, process_photo
+
+
+def _jpeg(width, height, color='teal'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def _run(captioner, originals, tasks, executor=None):
+    stored = {}
+
+    async def fetch(key):
+        return originals[key]
+
+    async def store(key, data, content_type):
+        stored[key] = data
+
+    async def scenario():
+        runner = photo_pipeline(DerivativeWorker(), GeocodeWorker(), captioner, store, executor=executor)
+        return [await process_photo(runner, task, fetch) for task in tasks]
+
+    return asyncio.run(scenario()), stored
+
+
+def test_caption_input_covers_caption_size_when_only_thumbnails_are_rendered():
+    client = FakeCaptionClient(latency=0)
+    captioner = AiCaptionWorker(client)
+    [result], stored = _run(
+        captioner,
+        {'a.jpg': _jpeg(4000, 3000)},
+        [PhotoTask('p1', 'a.jpg', stages=['derivative', 'caption'], sizes=[256])]
+    )
+
+    assert result.status == 'ready'
+    assert all(key.startswith('a/256.') for key in stored)
+    # Not the 256px thumbnail: the model sees the image at the caption size.
+    assert result.results['caption'].caption == 'A 1024x768 photo (en)'
+
+
+def test_caption_uses_a_covering_variant():
+    client = FakeCaptionClient(latency=0)
+    [result], _ = _run(
+        AiCaptionWorker(client, image_size=512),
+        {'a.jpg': _jpeg(4000, 3000)},
+        [PhotoTask('p1', 'a.jpg', stages=['derivative', 'caption'], sizes=[256, 1024])]
+    )
+
+    assert result.results['caption'].caption == 'A 512x384 photo (en)'
+
+
+def test_caption_cache_is_keyed_by_content_digest():
+    client = FakeCaptionClient(latency=0)
+    originals = {'a.jpg': _jpeg(1200, 900), 'b.jpg': _jpeg(1200, 900, 'navy')}
+    results, _ = _run(AiCaptionWorker(client), originals, [
+        PhotoTask('p1', 'a.jpg', stages=['caption'], digest='ab' * 32),
+        PhotoTask('p2', 'a.jpg', stages=['caption'], digest='ab' * 32),
+        PhotoTask('p3', 'b.jpg', stages=['caption'], digest='cd' * 32),
+    ])
+
+    assert [result.status for result in results] == ['ready'] * 3
+    assert client.calls == 2
+
+
+def test_original_is_decoded_once_with_an_executor(monkeypatch):
+    decodes = []
+    decode = DerivativeWorker.decode
+
+    def counting_decode(self, payload):
+        decodes.append(max(self.sizes))
+        return decode(self, payload)
+
+    # Threads stand in for the process pool so the decodes can be counted.
+    monkeypatch.setattr(DerivativeWorker, 'decode', counting_decode)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        [result], stored = _run(
+            AiCaptionWorker(FakeCaptionClient(latency=0)),
+            {'a.jpg': _jpeg(4000, 3000)},
+            [PhotoTask('p1', 'a.jpg', stages=['derivative', 'caption'], sizes=[256])],
+            executor=executor
+        )
+
+    assert result.status == 'ready'
+    assert decodes == [1024]
+    assert all(key.startswith('a/256.') for key in stored)
+    assert result.results['caption'].caption == 'A 1024x768 photo (en)'
@@ -0,0 +1,154 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+from photodisplay_workers.pipeline import PhotoContext, PhotoTask, PipelineRunner, Stage
+from photodisplay_workers.runtime import WorkerRuntime
+
+
+@dataclass
+class FakeJob:
+    id: str
+    attempts: int = 1
+    type: str = 'process'
+    last_error: Optional[str] = None
+
+
+class FakeJobSource:
+    """Hands out its jobs once and records what the runtime does with each"""
+
+    def __init__(self, jobs, stages=('a', 'b', 'c')):
+        self.jobs = list(jobs)
+        self.stages = list(stages)
+        self.events = []
+        self.idle = asyncio.Event()
+
+    async def start(self):
+        pass
+
+    async def claim(self, limit):
+        claimed, self.jobs = self.jobs[:limit], self.jobs[limit:]
+        return claimed
+
+    async def wait(self):
+        self.idle.set()
+        await asyncio.Event().wait()
+
+    async def task(self, job):
+        return {'photo_id': job.id, 'storage_key': f'{job.id}.jpg', 'stages': self.stages}
+
+    async def fetch(self, key):
+        return b''
+
+    async def fetch_range(self, key, length):
+        return b''
+
+    async def store(self, key, data, content_type):
+        pass
+
+    async def complete(self, job):
+        self.events.append(('complete', job.id))
+        return True
+
+    async def save(self, job, record):
+        self.events.append(('save', job.id, record['status']))
+        return True
+
+    async def retry(self, job, delay_seconds, error, record=None, stages=None):
+        self.events.append(('retry', job.id, delay_seconds, error, record, stages))
+        return True
+
+    async def dead_letter(self, job, error, record=None):
+        self.events.append(('dead_letter', job.id, error, record))
+        return True
+
+    async def close(self):
+        pass
+
+
+def _runner(fail=(), block=None):
+    """a -> b, and c on its own branch"""
+    def stage(name):
+        async def run(context):
+            if name == block:
+                await asyncio.Event().wait()
+            if name in fail:
+                raise ValueError(f'{name} broke')
+            return name
+        return run
+
+    return PipelineRunner([Stage('a', stage('a')), Stage('b', stage('b'), after=('a',)), Stage('c', stage('c'))])
+
+
+def _serve(runtime, source):
+    async def scenario():
+        run = asyncio.create_task(runtime.run())
+        await source.idle.wait()
+        # Let in-flight jobs settle before stopping, unless one never will.
+        for _ in range(10):
+            await asyncio.sleep(0)
+        runtime.stop()
+        await run
+
+    asyncio.run(scenario())
+    return source.events
+
+
+def test_failed_stage_skips_only_its_dependents():
+    async def scenario():
+        context = PhotoContext(task=PhotoTask('p1', 'p1.jpg'), fetch=None)
+        return await _runner(fail=('a',)).run(context)
+
+    result = asyncio.run(scenario())
+    assert result.errors == {'a': 'ValueError: a broke'}
+    assert result.skipped == ['b']
+    assert result.results == {'c': 'c'}
+    assert result.status == 'error'
+
+
+def test_successful_job_is_saved():
+    source = FakeJobSource([FakeJob('p1')])
+    events = _serve(WorkerRuntime(source, _runner()), source)
+    assert events == [('save', 'p1', 'ready')]
+
+
+def test_retry_keeps_partial_results_and_narrows_stages():
+    source = FakeJobSource([FakeJob('p1', attempts=3)])
+    runtime = WorkerRuntime(source, _runner(fail=('a',)), max_attempts=5, backoff_base=2.0, backoff_max=5.0)
+    [(kind, job_id, delay, error, record, stages)] = _serve(runtime, source)
+
+    assert (kind, job_id) == ('retry', 'p1')
+    # Full jitter below base * 2 ** (attempts - 1), capped at backoff_max.
+    assert 0 <= delay <= 5.0
+    assert error == 'a: ValueError: a broke'
+    assert record['status'] == 'error' and record['errors'] == {'a': 'ValueError: a broke'}
+    assert stages == ['a', 'b']
+
+
+def test_last_attempt_is_dead_lettered_with_its_record():
+    source = FakeJobSource([FakeJob('p1', attempts=2)])
+    [(kind, job_id, error, record)] = _serve(WorkerRuntime(source, _runner(fail=('c',)), max_attempts=2), source)
+    assert (kind, job_id, error) == ('dead_letter', 'p1', 'c: ValueError: c broke')
+    assert record['status'] == 'error'
+
+
+def test_jobs_that_cannot_run_are_dead_lettered():
+    source = FakeJobSource([
+        FakeJob('lost', attempts=6, last_error='worker died'),
+        FakeJob('odd', type='transcode')
+    ])
+    events = _serve(WorkerRuntime(source, _runner(), max_attempts=5), source)
+    assert sorted(events) == [
+        ('dead_letter', 'lost', 'worker died', None),
+        ('dead_letter', 'odd', 'Unknown job type transcode', None)
+    ]
+
+
+def test_shutdown_releases_unfinished_jobs():
+    source = FakeJobSource([FakeJob('p1'), FakeJob('p2')], stages=['a'])
+    runtime = WorkerRuntime(source, _runner(block='a'), shutdown_timeout=0.01)
+    events = _serve(runtime, source)
+    assert sorted(events) == [
+        ('retry', 'p1', 0, 'Worker shut down', None, None),
+        ('retry', 'p2', 0, 'Worker shut down', None, None)
+    ]